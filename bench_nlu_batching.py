@@ -0,0 +1,142 @@
+"""
+Benchmark of micro-batched NLU inference.
+
+Simulates concurrent dialog sessions sending transcripts to one shared CPU model and compares
+direct batch size 1 calls with MicroBatcher at several max_wait / max_batch_size settings,
+reporting throughput and per-request latency percentiles.
+
+The model is a synthetic stand-in for the BERT intent classifier (token embedding, BERT-base sized
+feed-forward layers over the padded batch, mean pooling), so the benchmark runs without the NLU
+component or a checkpoint. Like BERT on a CPU, a batch size 1 pass is bound by reading the layer
+weights, which a padded batch reads once for all its utterances. The results do not apply to the
+NLU component, which runs one forward pass per request (see nlu_batching).
+
+usage: python bench_nlu_batching.py [--sessions 16] [--requests 50] [--layers 4] [--dim 768]
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from nlu_batching import MicroBatcher
+
+UTTERANCES = [
+    "yes",
+    "no",
+    "stop",
+    "hello",
+    "what is the weather like tomorrow",
+    "can you tell me a story about a dragon",
+    "please turn left and walk to the kitchen",
+    "i would like to order a large pizza with extra cheese",
+]
+
+
+class SyntheticIntentModel:
+    """Padded-batch forward pass through transformer-sized feed-forward layers."""
+
+    def __init__(self, layers=4, dim=768, vocab=8192, intents=16):
+        rng = np.random.default_rng(0)
+        self.vocab = vocab
+        self.embedding = rng.standard_normal((vocab, dim), dtype=np.float32) * 0.1
+        self.layers = [
+            (
+                rng.standard_normal((dim, 4 * dim), dtype=np.float32) / np.sqrt(dim),
+                rng.standard_normal((4 * dim, dim), dtype=np.float32)
+                / np.sqrt(4 * dim),
+            )
+            for _ in range(layers)
+        ]
+        self.classifier = rng.standard_normal((dim, intents), dtype=np.float32)
+        # the model is not thread-safe, like one NLU component serving all sessions
+        self.lock = threading.Lock()
+
+    def tokenize(self, text):
+        return [hash(word) % self.vocab for word in text.split()] or [0]
+
+    def __call__(self, texts):
+        tokens = [self.tokenize(text) for text in texts]
+        length = max(len(t) for t in tokens)
+        ids = np.zeros((len(tokens), length), dtype=np.int64)
+        mask = np.zeros((len(tokens), length, 1), dtype=np.float32)
+        for i, t in enumerate(tokens):
+            ids[i, : len(t)] = t
+            mask[i, : len(t)] = 1.0
+        with self.lock:
+            # one (batch * length, dim) matrix, so each layer is a single GEMM
+            hidden = self.embedding[ids.ravel()]
+            for up, down in self.layers:
+                hidden = np.tanh(hidden @ up) @ down + hidden
+            hidden = hidden.reshape(len(tokens), length, -1)
+            pooled = (hidden * mask).sum(1) / mask.sum(1)
+            logits = pooled @ self.classifier
+        return [(int(np.argmax(row)), float(np.max(row))) for row in logits]
+
+
+def run_sessions(infer, sessions, requests):
+    """Runs sessions threads sending requests each, returns (seconds, latencies)."""
+    latencies = [[] for _ in range(sessions)]
+    barrier = threading.Barrier(sessions + 1)
+
+    def session(index):
+        barrier.wait()
+        for i in range(requests):
+            start = time.perf_counter()
+            infer(UTTERANCES[(index + i) % len(UTTERANCES)])
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, np.concatenate(latencies)
+
+
+def report(name, elapsed, latencies, mean_batch_size):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e3
+    print(
+        f"{name:>28} {len(latencies) / elapsed:>10.1f} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f}"
+        f" {mean_batch_size:>10.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NLU micro-batching benchmark")
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--dim", type=int, default=768)
+    args = parser.parse_args()
+
+    model = SyntheticIntentModel(args.layers, args.dim)
+    model(UTTERANCES)
+
+    print(
+        f"{'setting':>28} {'req/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'batch size':>10}"
+    )
+    elapsed, latencies = run_sessions(
+        lambda text: model([text])[0], args.sessions, args.requests
+    )
+    report("batch size 1", elapsed, latencies, 1.0)
+    for max_batch_size in (8, 32):
+        for max_wait in (0.0, 0.002, 0.005, 0.01):
+            with MicroBatcher(model, max_batch_size, max_wait) as batcher:
+                elapsed, latencies = run_sessions(
+                    batcher.request, args.sessions, args.requests
+                )
+                stats = batcher.stats()
+            report(
+                f"max {max_batch_size}, wait {max_wait * 1e3:g} ms",
+                elapsed,
+                latencies,
+                stats["mean_batch_size"],
+            )
+
+
+if __name__ == "__main__":
+    main()
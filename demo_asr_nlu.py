@@ -1,5 +1,14 @@
-from os.path import abspath, join
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from functools import partial
 from importlib.resources import files
+from typing import Optional
+
+from sic_framework.core.message_python2 import AudioMessage
 from sic_framework.devices.desktop import Desktop
 from sic_framework.services.nlu.bert_nlu import (
     NLU,
@@ -12,12 +21,29 @@ from sic_framework.services.openai_whisper_speech_to_text.whisper_speech_to_text
     SICWhisper,
 )
 
-
+from latency_tracing import LatencyTracer, SpeechActivityMonitor
+from nlu_cache import NLUResultCache
+from vad_endpointing import StreamEndpointer
 
 """
 This demo shows how to create a simple pipeline (ASR + NLU) where Whisper transcribes your speech and
 feeds it into the NLU component to run inference
 
+The rounds run as a staged pipeline: one thread keeps requesting transcripts from Whisper while
+another runs NLU on the previous transcript, so round i+1 is already being captured while round i
+is classified. The stages are connected by bounded queues and the results are printed in round order.
+
+Speech is endpointed on the microphone stream with an energy based VAD: as soon as hangover_ms of
+trailing silence follow an utterance, only its voiced segment is sent to Whisper, instead of waiting
+on the fixed timeout/phrase_time_limit windows of GetTranscript. The GetTranscript request of an
+utterance is sent as soon as the VAD confirms its speech, so it reaches Whisper before the segment.
+--no-vad restores those windows, --hangover-ms tunes the endpointing (see eval_vad_endpointing.py
+to evaluate it on recordings).
+
+Run with --trace to print p50/p95/p99 latencies per stage (end of speech to transcript, Whisper and NLU
+requests including their message broker transit) at the end, and with --trace-output latencies.json
+(or .csv) to also export them.
+
 IMPORTANT
 The Whisper component and NLU component need to be running:
 
@@ -28,28 +54,367 @@ The Whisper component and NLU component need to be running:
     The other terminal: run-nlu
 """
 
-desktop = Desktop()
+ROUNDS = 10
+# rounds that may wait between two stages before the earlier stage blocks
+QUEUE_SIZE = 2
+
+# NLU results of repeated utterances are cached, see nlu_cache
+NLU_CACHE_SIZE = 1024
+NLU_CACHE_TTL = 3600.0
+
+# seconds to wait for speech in a round
+LISTEN_TIMEOUT = 10
+# longest phrase Whisper transcribes, also the longest VAD segment
+PHRASE_TIME_LIMIT = 20
+VAD_HANGOVER_MS = 300
+# silence streamed after a segment, ends the phrase in the Whisper component's listener
+TRAILING_SILENCE = 1.5
+
+# marks the end of the rounds on a queue
+DONE = object()
+
+
+@dataclass
+class Turn:
+    """One round flowing through the pipeline stages."""
+
+    index: int
+    transcript: Optional[str] = None
+    nlu_result: Optional[InferenceResult] = None
+    error: Optional[Exception] = None
+
+
+def transcribe_window(whisper, round_index, tracer, speech_monitor=None):
+    """Let Whisper listen for one phrase within fixed windows."""
+    whisper_start = time.time()
+    tracer.mark(round_index, "whisper_start", whisper_start)
+    reply = whisper.request(
+        GetTranscript(timeout=LISTEN_TIMEOUT, phrase_time_limit=PHRASE_TIME_LIMIT)
+    )
+    if speech_monitor is not None:
+        end_of_speech = speech_monitor.end_of_speech(since=whisper_start)
+        if end_of_speech is not None:
+            tracer.mark(round_index, "end_of_speech", end_of_speech)
+    return reply
+
+
+class TranscriptRequests:
+    """GetTranscript requests sent ahead of the segments they transcribe.
+
+    The Whisper component drops the audio it received before it handles a
+    request and does not acknowledge one, so a request sent together with its
+    segment may lose it. Instead send is registered as the on_speech callback
+    of the endpointer: it is called once for every segment the endpointer will
+    queue, while its speech is still going on and so at least hangover_ms
+    before the segment can be streamed. The component handles the requests one
+    at a time and its listener waits for audio, so the replies come in request
+    order and each streamed segment is transcribed for the oldest pending
+    request. A request still waiting behind the previous one is handled as soon
+    as that reply is sent, before the segment streamed after the reply arrives.
+    """
+
+    def __init__(self, whisper):
+        self.whisper = whisper
+        self._replies = queue.Queue()
+
+    def send(self):
+        """Send a GetTranscript request without waiting for its reply."""
+        reply = Future()
+
+        def request():
+            try:
+                reply.set_result(
+                    self.whisper.request(
+                        GetTranscript(
+                            timeout=LISTEN_TIMEOUT, phrase_time_limit=PHRASE_TIME_LIMIT
+                        )
+                    )
+                )
+            except Exception as e:
+                reply.set_exception(e)
+
+        self._replies.put(reply)
+        threading.Thread(target=request, daemon=True).start()
+
+    @property
+    def pending(self):
+        """Number of requests whose reply was not taken yet."""
+        return self._replies.qsize()
+
+    def next_reply(self):
+        """Wait for the reply to the oldest pending request."""
+        return self._replies.get_nowait().result()
+
 
-whisper = SICWhisper()
+def stream_audio(whisper, audio, sample_rate, chunk_size):
+    """Send 16 bit audio to Whisper as AudioMessages of chunk_size samples.
 
+    The Whisper component listens on its own audio stream, which takes the
+    chunk size from the first message, so the microphone's chunk size is kept.
+    """
+    chunk_bytes = 2 * chunk_size
+    for offset in range(0, len(audio), chunk_bytes):
+        chunk = audio[offset : offset + chunk_bytes].ljust(chunk_bytes, b"\0")
+        whisper.send_message(AudioMessage(chunk, sample_rate=sample_rate))
 
-whisper.connect(desktop.mic)
-#add path to ontology and model.
-model_path = str(files("sic_framework.services.nlu.utils.checkpoints").joinpath("model_checkpoint.pt"))
-ontology_path = str(files("sic_framework.services.nlu.utils.data").joinpath("ontology.json"))
-nlu_conf = NLUConf(ontology_path=ontology_path, model_path=model_path)
-nlu = NLU(conf=nlu_conf)
-print("Initiated NLU component!")
 
+def transcribe_segment(whisper, transcript_requests, segment, chunk_size):
+    """Transcribe a VAD segment by streaming it to Whisper.
 
-for i in range(10):
-    print("..." * 10, f"Talk now Round {i}")
-    transcript = whisper.request(GetTranscript(timeout=10, phrase_time_limit=20))
-    nlu_result = nlu.request(InferenceRequest(transcript.transcript))
-    print("Transcript:", transcript.transcript)
-    print("Intent:", nlu_result.intent, '\t', nlu_result.intent_confidence)
-    print("Slots:\n", nlu_result.slots)
+    The segment's request was already sent by transcript_requests. The trailing
+    silence lets the listener end the phrase right away.
+    """
+    if not transcript_requests.pending:
+        raise RuntimeError(
+            "no GetTranscript request pending for the segment, register "
+            "TranscriptRequests.send as on_speech of the endpointer"
+        )
+    audio = segment.audio.tobytes() + bytes(
+        2 * int(TRAILING_SILENCE * segment.sample_rate)
+    )
+    stream_audio(whisper, audio, segment.sample_rate, chunk_size)
+    return transcript_requests.next_reply()
+
+
+def finish_requests(whisper, transcript_requests, endpointer):
+    """Stop sending requests and answer those sent for speech after the last round.
+
+    Their segments are streamed, or silence if a segment does not end within
+    LISTEN_TIMEOUT, so the component does not keep listening for them.
+    """
+    endpointer.on_speech = None
+    for _ in range(transcript_requests.pending):
+        segment = endpointer.next_segment(timeout=LISTEN_TIMEOUT)
+        if segment is None:
+            sample_rate = endpointer.vad.sample_rate
+            # the listener gives up after LISTEN_TIMEOUT seconds of audio without speech
+            audio = bytes(2 * int((LISTEN_TIMEOUT + 1) * sample_rate))
+        else:
+            sample_rate = segment.sample_rate
+            audio = segment.audio.tobytes() + bytes(
+                2 * int(TRAILING_SILENCE * sample_rate)
+            )
+        stream_audio(whisper, audio, sample_rate, endpointer.chunk_size)
+        try:
+            transcript_requests.next_reply()
+        except Exception:
+            # the transcript is not used, the request only has to be finished
+            pass
+
+
+def transcribe_stage(
+    whisper,
+    rounds,
+    out_queue,
+    tracer,
+    speech_monitor=None,
+    endpointer=None,
+    transcript_requests=None,
+):
+    """Capture and transcribe one utterance per round with Whisper.
+
+    With an endpointer, the utterances are the segments it detected on the
+    microphone stream, transcribed for the requests of transcript_requests.
+    Otherwise Whisper listens within fixed windows.
+    """
+    try:
+        for i in range(rounds):
+            turn = Turn(i)
+            print("..." * 10, f"Talk now Round {i}")
+            try:
+                if endpointer is None:
+                    reply = transcribe_window(whisper, i, tracer, speech_monitor)
+                else:
+                    segment = endpointer.next_segment(timeout=LISTEN_TIMEOUT)
+                    if segment is None:
+                        raise TimeoutError(f"no speech within {LISTEN_TIMEOUT} s")
+                    tracer.mark(i, "end_of_speech", segment.end_time)
+                    tracer.mark(i, "whisper_start")
+                    reply = transcribe_segment(
+                        whisper, transcript_requests, segment, endpointer.chunk_size
+                    )
+                tracer.mark(i, "whisper_end")
+                turn.transcript = reply.transcript
+            except Exception as e:
+                turn.error = e
+            out_queue.put(turn)
+    finally:
+        out_queue.put(DONE)
+
+
+def nlu_stage(nlu, in_queue, out_queue, tracer, nlu_cache=None):
+    """Run NLU inference on the transcripts in the order they arrive."""
+
+    def infer(turn):
+        return nlu.request(InferenceRequest(turn.transcript))
+
+    try:
+        for turn in iter(in_queue.get, DONE):
+            if turn.error is None:
+                try:
+                    tracer.mark(turn.index, "nlu_start")
+                    if nlu_cache is None:
+                        turn.nlu_result = infer(turn)
+                    else:
+                        turn.nlu_result = nlu_cache.get(
+                            turn.transcript, partial(infer, turn)
+                        )
+                    tracer.mark(turn.index, "nlu_end")
+                except Exception as e:
+                    turn.error = e
+            out_queue.put(turn)
+    finally:
+        out_queue.put(DONE)
+
+
+def print_turn(turn):
+    if turn.error is not None:
+        print(f"Round {turn.index} failed:", repr(turn.error))
+    else:
+        print("Transcript:", turn.transcript)
+        print(
+            "Intent:", turn.nlu_result.intent, "\t", turn.nlu_result.intent_confidence
+        )
+        print("Slots:\n", turn.nlu_result.slots)
     print("-" * 20)
 
-print("done")
 
+def run_pipeline(
+    whisper,
+    nlu,
+    rounds=ROUNDS,
+    queue_size=QUEUE_SIZE,
+    nlu_cache=None,
+    tracer=None,
+    speech_monitor=None,
+    endpointer=None,
+    transcript_requests=None,
+):
+    """Run the transcription and NLU stages on threads and print the turns.
+
+    Each stage handles one turn at a time from a FIFO queue, so the turns
+    come out in round order. Stage timestamps are marked on tracer.
+    """
+    if tracer is None:
+        tracer = LatencyTracer(enabled=False)
+    transcripts = queue.Queue(maxsize=queue_size)
+    results = queue.Queue(maxsize=queue_size)
+    # daemon threads, so an interrupted run does not wait for a pending request
+    stages = [
+        threading.Thread(
+            target=transcribe_stage,
+            args=(
+                whisper,
+                rounds,
+                transcripts,
+                tracer,
+                speech_monitor,
+                endpointer,
+                transcript_requests,
+            ),
+            daemon=True,
+        ),
+        threading.Thread(
+            target=nlu_stage,
+            args=(nlu, transcripts, results, tracer, nlu_cache),
+            daemon=True,
+        ),
+    ]
+    for stage in stages:
+        stage.start()
+    for turn in iter(results.get, DONE):
+        print_turn(turn)
+    for stage in stages:
+        stage.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASR + NLU demo")
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="trace the latency of each stage and print percentiles at the end",
+    )
+    parser.add_argument(
+        "--trace-output",
+        default=None,
+        help="also write the traced latencies to this .json or .csv file, implies --trace",
+    )
+    parser.add_argument(
+        "--no-vad",
+        action="store_true",
+        help="let Whisper listen within fixed timeout/phrase_time_limit windows",
+    )
+    parser.add_argument(
+        "--hangover-ms",
+        type=int,
+        default=VAD_HANGOVER_MS,
+        help="trailing silence that ends an utterance",
+    )
+    args = parser.parse_args()
+    tracer = LatencyTracer(enabled=args.trace or args.trace_output is not None)
+
+    desktop = Desktop()
+
+    whisper = SICWhisper()
+
+    speech_monitor = None
+    endpointer = None
+    transcript_requests = None
+    if args.no_vad:
+        whisper.connect(desktop.mic)
+        if tracer.enabled:
+            # the end of speech is taken from the microphone stream Whisper listens to
+            speech_monitor = SpeechActivityMonitor()
+            desktop.mic.register_callback(speech_monitor.on_audio)
+    else:
+        # Whisper only receives the segments the endpointer detected, their requests are sent
+        # when the endpointer confirms speech
+        transcript_requests = TranscriptRequests(whisper)
+        endpointer = StreamEndpointer(
+            on_speech=transcript_requests.send,
+            hangover_ms=args.hangover_ms,
+            max_segment_ms=PHRASE_TIME_LIMIT * 1000,
+        )
+        desktop.mic.register_callback(endpointer.on_audio)
+    # add path to ontology and model.
+    model_path = str(
+        files("sic_framework.services.nlu.utils.checkpoints").joinpath(
+            "model_checkpoint.pt"
+        )
+    )
+    ontology_path = str(
+        files("sic_framework.services.nlu.utils.data").joinpath("ontology.json")
+    )
+    nlu_conf = NLUConf(ontology_path=ontology_path, model_path=model_path)
+    nlu = NLU(conf=nlu_conf)
+    print("Initiated NLU component!")
+
+    nlu_cache = NLUResultCache(
+        model_path, ontology_path, max_entries=NLU_CACHE_SIZE, ttl=NLU_CACHE_TTL
+    )
+    run_pipeline(
+        whisper,
+        nlu,
+        rounds=args.rounds,
+        nlu_cache=nlu_cache,
+        tracer=tracer,
+        speech_monitor=speech_monitor,
+        endpointer=endpointer,
+        transcript_requests=transcript_requests,
+    )
+    if endpointer is not None:
+        finish_requests(whisper, transcript_requests, endpointer)
+    print("NLU cache:", nlu_cache.stats())
+    if tracer.enabled:
+        tracer.print_report()
+        if args.trace_output:
+            tracer.export(args.trace_output)
+            print("Latencies written to", args.trace_output)
+
+    print("done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Offline evaluation of VAD endpointing on recorded audio.
+
+Replays 16 bit WAV recordings in microphone sized chunks through EnergyVAD with several hangover
+settings and through a fixed window baseline configured like the listener behind
+GetTranscript(timeout=10, phrase_time_limit=20): 250 ms chunks, 0.8 s of silence to end a phrase
+and a 20 s phrase limit. For every reference utterance it reports when the end of speech was
+detected, the latency saved against the baseline and whether the submitted segment clipped it.
+
+Reference utterances come from an Audacity label file next to each recording (input.wav ->
+input.txt, one "start<TAB>end[<TAB>label]" line per utterance, in seconds). Recordings without
+labels are skipped unless --auto-reference is given, which takes the first and last voiced frame of
+each utterance from a sensitive offline pass with 10 ms frames and a 1 s hangover instead; clipping
+is then measured against that pass rather than annotations.
+
+--noise-step adds a synthetic recording whose background noise gets 20 dB louder halfway, between
+utterances of amplitude modulated noise with known boundaries. A noise floor that does not follow
+the step shows up as segments running to max_segment_ms, i.e. endpoint delays of seconds.
+
+usage: python eval_vad_endpointing.py [recording.wav ...] [--hangover-ms 150,300,500]
+           [--chunk-ms 250] [--auto-reference] [--noise-step] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import wave
+
+import numpy as np
+
+from vad_endpointing import EnergyVAD
+
+# how far a segment may miss the reference boundaries before it counts as clipped
+CLIP_TOLERANCE = 0.02
+BASELINE = {
+    "frame_ms": 250,
+    "start_ms": 250,
+    "hangover_ms": 800,
+    "pre_roll_ms": 500,
+    "max_segment_ms": 20000,
+}
+
+
+def read_wav(path):
+    """Returns (int16 mono samples, sample rate) of a 16 bit WAV file."""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16 bit WAV files are supported")
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        channels = f.getnchannels()
+        sample_rate = f.getframerate()
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, sample_rate
+
+
+def read_labels(path):
+    """Returns [(start, end)] of an Audacity label file."""
+    utterances = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split("\t")
+            if len(fields) >= 2 and not line.startswith("\\"):
+                utterances.append((float(fields[0]), float(fields[1])))
+    return utterances
+
+
+def noise_step(sample_rate=16000, seed=0):
+    """
+    Returns (int16 samples, reference) of 60 s of noise that gets 20 dB louder after 30 s, with a
+    1.5 s utterance every 5 s.
+    """
+    rng = np.random.default_rng(seed)
+    duration = 60
+    t = np.arange(duration * sample_rate) / sample_rate
+    audio = rng.standard_normal(len(t)) * np.where(t < duration / 2, 50.0, 500.0)
+    reference = []
+    for start in np.arange(2.0, duration, 5.0):
+        end = start + 1.5
+        voiced = (t >= start) & (t < end)
+        # syllables at 4 Hz
+        envelope = np.clip(
+            np.abs(np.sin(2 * np.pi * 2 * (t[voiced] - start))), 0.3, None
+        )
+        audio[voiced] += rng.standard_normal(voiced.sum()) * 4000.0 * envelope
+        reference.append((float(start), float(end)))
+    return np.clip(audio, -32768, 32767).astype(np.int16), reference
+
+
+def run_vad(samples, sample_rate, chunk_ms, **vad_params):
+    """Streams samples through EnergyVAD in chunks and returns its segments."""
+    vad = EnergyVAD(sample_rate, **vad_params)
+    chunk = max(int(sample_rate * chunk_ms / 1000), 1)
+    segments = []
+    for offset in range(0, len(samples), chunk):
+        for segment in vad.process(samples[offset : offset + chunk]):
+            # the end is only seen once the chunk holding it has arrived
+            segment.detected_at = min(
+                np.ceil(segment.detected_at / (chunk / sample_rate))
+                * chunk
+                / sample_rate,
+                len(samples) / sample_rate,
+            )
+            segments.append(segment)
+    segment = vad.flush()
+    if segment is not None:
+        segments.append(segment)
+    return segments
+
+
+def auto_reference(samples, sample_rate):
+    return [
+        (segment.start, segment.end)
+        for segment in run_vad(
+            samples,
+            sample_rate,
+            chunk_ms=1000,
+            frame_ms=10,
+            start_ms=30,
+            hangover_ms=1000,
+            pre_roll_ms=0,
+            min_speech_ms=50,
+            max_segment_ms=10**9,
+        )
+    ]
+
+
+def match(reference, segments):
+    """
+    Returns per utterance (detected_at or None, clipped, split) for the segments overlapping it.
+    """
+    results = []
+    for start, end in reference:
+        overlapping = [
+            s for s in segments if s.audio_start < end and s.audio_end > start
+        ]
+        if not overlapping:
+            results.append((None, True, False))
+            continue
+        clipped = (
+            overlapping[0].audio_start > start + CLIP_TOLERANCE
+            or overlapping[-1].audio_end < end - CLIP_TOLERANCE
+            or any(
+                a.audio_end < b.audio_start
+                for a, b in zip(overlapping, overlapping[1:])
+            )
+        )
+        results.append((overlapping[-1].detected_at, clipped, len(overlapping) > 1))
+    return results
+
+
+def summarize(name, reference_ends, results, baseline_detected, false_alarms):
+    delays, saved = [], []
+    for end, (detected_at, _, _), base in zip(
+        reference_ends, results, baseline_detected
+    ):
+        if detected_at is None:
+            continue
+        delays.append(detected_at - end)
+        if base is not None:
+            saved.append(base - detected_at)
+    count = len(results)
+    return {
+        "setting": name,
+        "utterances": count,
+        "missed": sum(detected is None for detected, _, _ in results),
+        "clipping_rate": (
+            sum(clipped for _, clipped, _ in results) / count if count else 0.0
+        ),
+        "split": sum(split for _, _, split in results),
+        "false_alarms": false_alarms,
+        "endpoint_delay_p50_ms": (
+            float(np.percentile(delays, 50) * 1e3) if delays else None
+        ),
+        "endpoint_delay_p95_ms": (
+            float(np.percentile(delays, 95) * 1e3) if delays else None
+        ),
+        "latency_saved_mean_ms": float(np.mean(saved) * 1e3) if saved else None,
+    }
+
+
+def recordings(args):
+    """Yields (samples, sample rate, reference) of the recordings to evaluate."""
+    for path in args.recordings:
+        samples, sample_rate = read_wav(path)
+        labels = os.path.splitext(path)[0] + ".txt"
+        if os.path.exists(labels):
+            reference = read_labels(labels)
+        elif args.auto_reference:
+            reference = auto_reference(samples, sample_rate)
+        else:
+            print(f"skipping {path}: no label file {labels}")
+            continue
+        yield samples, sample_rate, reference
+    if args.noise_step:
+        samples, reference = noise_step()
+        yield samples, 16000, reference
+
+
+def main():
+    parser = argparse.ArgumentParser(description="offline VAD endpointing evaluation")
+    parser.add_argument("recordings", nargs="*")
+    parser.add_argument("--hangover-ms", default="150,300,500")
+    parser.add_argument("--chunk-ms", type=float, default=250)
+    parser.add_argument("--auto-reference", action="store_true")
+    parser.add_argument("--noise-step", action="store_true")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    if not args.recordings and not args.noise_step:
+        parser.error("give recordings or --noise-step")
+    hangovers = [int(value) for value in args.hangover_ms.split(",")]
+
+    settings = [("baseline", BASELINE)] + [
+        (f"vad hangover {hangover} ms", {"hangover_ms": hangover})
+        for hangover in hangovers
+    ]
+    collected = {name: ([], [], [], 0) for name, _ in settings}
+    for samples, sample_rate, reference in recordings(args):
+        baseline_detected = None
+        for name, params in settings:
+            segments = run_vad(samples, sample_rate, args.chunk_ms, **params)
+            results = match(reference, segments)
+            if baseline_detected is None:
+                baseline_detected = [detected for detected, _, _ in results]
+            false_alarms = sum(
+                not any(
+                    s.audio_start < end and s.audio_end > start
+                    for start, end in reference
+                )
+                for s in segments
+            )
+            ends, all_results, all_baseline, all_false_alarms = collected[name]
+            ends.extend(end for _, end in reference)
+            all_results.extend(results)
+            all_baseline.extend(baseline_detected)
+            collected[name] = (
+                ends,
+                all_results,
+                all_baseline,
+                all_false_alarms + false_alarms,
+            )
+
+    summaries = [summarize(name, *collected[name]) for name, _ in settings]
+    # (key, heading, width, format)
+    columns = [
+        ("utterances", "utterances", 11, "d"),
+        ("missed", "missed", 7, "d"),
+        ("clipping_rate", "clipped", 9, ".1%"),
+        ("split", "split", 6, "d"),
+        ("false_alarms", "false", 7, "d"),
+        ("endpoint_delay_p50_ms", "delay p50", 10, ".0f"),
+        ("endpoint_delay_p95_ms", "delay p95", 10, ".0f"),
+        ("latency_saved_mean_ms", "saved ms", 10, ".0f"),
+    ]
+    print(
+        f"{'setting':<24}"
+        + "".join(f"{heading:>{width}}" for _, heading, width, _ in columns)
+    )
+    for summary in summaries:
+        print(
+            f"{summary['setting']:<24}"
+            + "".join(
+                (
+                    f"{summary[key]:>{width}{spec}}"
+                    if summary[key] is not None
+                    else "-".rjust(width)
+                )
+                for key, _, width, spec in columns
+            )
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summaries, f, indent=1)
+        print("results written to", args.output)
+
+
+if __name__ == "__main__":
+    main()
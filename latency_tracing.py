@@ -0,0 +1,172 @@
+"""
+Per-stage latency tracing of the ASR + NLU pipeline.
+
+LatencyTracer collects wall clock timestamps of named events per round (end of speech, Whisper
+request start/end and NLU request start/end) and turns them into per-stage durations. At the end of
+a run it reports count, mean, p50/p95/p99 and a histogram per stage, and can export them to a JSON
+or CSV file.
+
+The time spent on the message broker is not traced separately. SIC sets the _timestamp of
+requests, connector messages and sensor output, but not of service replies, so the Whisper and NLU
+request stages include the broker transit both ways.
+"""
+
+import csv
+import json
+import threading
+import time
+
+import numpy as np
+
+# (stage, start event, end event)
+STAGES = [
+    ("speech_to_transcript", "end_of_speech", "whisper_end"),
+    ("whisper_request", "whisper_start", "whisper_end"),
+    ("queue_wait", "whisper_end", "nlu_start"),
+    ("nlu_request", "nlu_start", "nlu_end"),
+    ("speech_to_intent", "end_of_speech", "nlu_end"),
+]
+PERCENTILES = (50, 95, 99)
+# upper bounds in milliseconds of the histogram buckets, the last bucket is unbounded
+HISTOGRAM_BOUNDS_MS = (10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class LatencyTracer:
+    """
+    Collects event timestamps per round. A disabled tracer ignores all marks.
+
+    :param enabled: whether marks are recorded
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._rounds = {}
+        self._lock = threading.Lock()
+
+    def mark(self, round_index, event, timestamp=None):
+        """Records event of a round at timestamp (seconds since the epoch), by default now."""
+        if not self.enabled:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            self._rounds.setdefault(round_index, {})[event] = timestamp
+
+    def durations(self):
+        """{stage: [seconds per round that has both events of the stage]}"""
+        with self._lock:
+            rounds = [self._rounds[i] for i in sorted(self._rounds)]
+        durations = {stage: [] for stage, _, _ in STAGES}
+        for events in rounds:
+            for stage, start, end in STAGES:
+                if start in events and end in events:
+                    durations[stage].append(events[end] - events[start])
+        return durations
+
+    def summary(self):
+        """{stage: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms, histogram}}"""
+        summary = {}
+        for stage, values in self.durations().items():
+            if not values:
+                continue
+            values_ms = [value * 1e3 for value in values]
+            histogram = np.bincount(
+                np.searchsorted(HISTOGRAM_BOUNDS_MS, values_ms),
+                minlength=len(HISTOGRAM_BOUNDS_MS) + 1,
+            )
+            summary[stage] = {
+                "count": len(values_ms),
+                "mean_ms": sum(values_ms) / len(values_ms),
+                **{f"p{q}_ms": float(np.percentile(values_ms, q)) for q in PERCENTILES},
+                "max_ms": max(values_ms),
+                "histogram": histogram.tolist(),
+            }
+        return summary
+
+    def print_report(self):
+        summary = self.summary()
+        if not summary:
+            print("No latencies traced")
+            return
+        missing = [stage for stage, _, _ in STAGES if stage not in summary]
+        columns = ["count", "mean_ms"] + [f"p{q}_ms" for q in PERCENTILES] + ["max_ms"]
+        print(f"{'stage':<22}" + "".join(f"{column:>10}" for column in columns))
+        for stage, stats in summary.items():
+            print(
+                f"{stage:<22}{stats['count']:>10}"
+                + "".join(f"{stats[column]:>10.1f}" for column in columns[1:])
+            )
+        labels = [f"<{bound}" for bound in HISTOGRAM_BOUNDS_MS] + [
+            f">={HISTOGRAM_BOUNDS_MS[-1]}"
+        ]
+        print(f"\n{'histogram (ms)':<22}" + "".join(f"{label:>7}" for label in labels))
+        for stage, stats in summary.items():
+            print(
+                f"{stage:<22}" + "".join(f"{count:>7}" for count in stats["histogram"])
+            )
+        if missing:
+            print(
+                "\nNo samples for",
+                ", ".join(missing),
+                "(no round recorded both of their events)",
+            )
+
+    def export(self, path):
+        """
+        Writes the summary and the per-round events to a .json file, or one row of stage
+        durations in milliseconds per round to a .csv file.
+        """
+        with self._lock:
+            rounds = {i: dict(self._rounds[i]) for i in sorted(self._rounds)}
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["round"] + [stage for stage, _, _ in STAGES])
+                for i, events in rounds.items():
+                    writer.writerow(
+                        [i]
+                        + [
+                            (
+                                f"{(events[end] - events[start]) * 1e3:.3f}"
+                                if start in events and end in events
+                                else ""
+                            )
+                            for _, start, end in STAGES
+                        ]
+                    )
+        else:
+            with open(path, "w") as f:
+                json.dump(
+                    {
+                        "histogram_bounds_ms": HISTOGRAM_BOUNDS_MS,
+                        "stages": self.summary(),
+                        "rounds": rounds,
+                    },
+                    f,
+                    indent=1,
+                )
+
+
+class SpeechActivityMonitor:
+    """
+    Tracks when the microphone last carried speech, for the end of speech of a round.
+
+    Register on_audio as a callback of the microphone connector. A chunk counts as speech when its
+    RMS energy reaches threshold (16 bit samples).
+    """
+
+    def __init__(self, threshold=500.0):
+        self.threshold = threshold
+        self.last_speech = None
+
+    def on_audio(self, message):
+        samples = np.frombuffer(message.waveform, dtype=np.int16).astype(np.float32)
+        if samples.size and np.sqrt(np.mean(samples * samples)) >= self.threshold:
+            self.last_speech = getattr(message, "_timestamp", None) or time.time()
+
+    def end_of_speech(self, since):
+        """The time speech was last heard if that was after since, else None."""
+        last_speech = self.last_speech
+        if last_speech is not None and last_speech > since:
+            return last_speech
+        return None
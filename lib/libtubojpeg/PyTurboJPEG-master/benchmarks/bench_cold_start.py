@@ -0,0 +1,81 @@
+# -*- coding: UTF-8 -*-
+#
+# Cold-start benchmark of TurboJPEG construction.
+#
+# Measures, in fresh interpreter processes, the time to import turbojpeg
+# and create the first TurboJPEG instance (library search, load and ctypes
+# binding) with and without the TURBOJPEG_LIB_PATH environment variable, and
+# in one process the time to create further instances, which reuse the
+# shared bindings.
+#
+# usage: python benchmarks/bench_cold_start.py [--lib-path PATH] [--runs N]
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from turbojpeg import LIB_PATH_ENV, TurboJPEG, TurboJPEGLibrary
+
+CHILD = '''
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {path!r})
+import turbojpeg
+imported = time.perf_counter()
+turbojpeg.TurboJPEG({lib_path!r})
+print(imported - start, time.perf_counter() - imported)
+'''
+
+
+def cold_start(lib_path, env_path, runs):
+    """returns best (import, first instance) seconds over fresh processes"""
+    env = dict(os.environ)
+    env.pop(LIB_PATH_ENV, None)
+    if env_path is not None:
+        env[LIB_PATH_ENV] = env_path
+    code = CHILD.format(path=os.path.join(HERE, '..'), lib_path=lib_path)
+    best = (float('inf'), float('inf'))
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', code], env=env)
+        import_time, init_time = map(float, output.split())
+        best = min(best, (import_time, init_time), key=lambda t: t[1])
+    return best
+
+
+def warm_start(lib_path, runs):
+    """returns best seconds to create an instance once bindings are cached"""
+    TurboJPEG(lib_path).close()
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        TurboJPEG(lib_path).close()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TurboJPEG cold-start benchmark')
+    parser.add_argument('--lib-path', default=None,
+                        help='libturbojpeg to use for TURBOJPEG_LIB_PATH runs')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    lib_path = args.lib_path or TurboJPEGLibrary.find()
+
+    print('{:<44} {:>10} {:>14}'.format('case', 'import ms', 'TurboJPEG() ms'))
+    rows = [
+        ('fresh process, library search', cold_start(None, None, args.runs)),
+        ('fresh process, {}'.format(LIB_PATH_ENV), cold_start(None, lib_path, args.runs)),
+        ('fresh process, explicit lib_path', cold_start(lib_path, None, args.runs)),
+        ('same process, shared bindings', (0.0, warm_start(lib_path, args.runs))),
+    ]
+    for name, (import_time, init_time) in rows:
+        print('{:<44} {:>10.2f} {:>14.3f}'.format(name, import_time * 1e3, init_time * 1e3))
+
+
+if __name__ == '__main__':
+    main()
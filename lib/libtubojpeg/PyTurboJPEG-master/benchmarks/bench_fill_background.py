@@ -0,0 +1,127 @@
+# -*- coding: UTF-8 -*-
+#
+# Benchmark of the fill_background transform callback used by
+# TurboJPEG.crop_multiple when a crop region extends past the image.
+#
+# The callback is driven directly the way libjpeg-turbo drives it during
+# tjTransform (one call per iMCU row of the luminance plane), so no
+# libturbojpeg is needed to run it. The previous per-MCU loop implementation
+# is kept below as the reference the vectorized one is checked against.
+#
+# usage: python benchmarks/bench_fill_background.py [--repeat N]
+
+import argparse
+import os
+import sys
+import time
+from ctypes import POINTER, addressof, c_short, cast, pointer
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from turbojpeg import (MCU_HEIGHT, MCU_SIZE, MCU_WIDTH, TJXOP_NONE,
+                       TJXOPT_CROP, TJXOPT_PERFECT, BackgroundStruct,
+                       CroppingRegion, TransformStruct, fill_background)
+
+# (image width, image height, canvas width, canvas height)
+CASES = [
+    (640, 480, 1024, 1024),
+    (1280, 720, 1920, 1920),
+    (1920, 1080, 2048, 2048),
+    (640, 480, 4096, 4096),
+]
+
+# rows of coefficient blocks handed to the callback per call
+ROWS_PER_CALL = MCU_HEIGHT
+
+
+def fill_background_loops(coeffs_ptr, arrayRegion, planeRegion, componentID, transformID, transform_ptr):
+    """The per-MCU loop implementation fill_background replaced."""
+    if componentID == 0:
+        coeff_array_size = arrayRegion.w * arrayRegion.h
+        ArrayType = c_short*coeff_array_size
+        array_pointer = cast(coeffs_ptr, POINTER(ArrayType))
+        coeffs = np.frombuffer(array_pointer.contents, dtype=np.int16)
+        coeffs.shape = (
+            arrayRegion.h//MCU_WIDTH,
+            arrayRegion.w//MCU_HEIGHT,
+            MCU_SIZE
+        )
+        transform = cast(transform_ptr, POINTER(TransformStruct)).contents
+        background_data = cast(
+            transform.data, POINTER(BackgroundStruct)
+        ).contents
+        left_start_row = min(arrayRegion.y, background_data.h) - arrayRegion.y
+        left_end_row = (
+            min(arrayRegion.y+arrayRegion.h, background_data.h)
+            - arrayRegion.y
+        )
+        for x in range(background_data.w//MCU_WIDTH, planeRegion.w//MCU_WIDTH):
+            for y in range(
+                left_start_row//MCU_HEIGHT,
+                left_end_row//MCU_HEIGHT
+            ):
+                coeffs[y][x][0] = background_data.lum
+        bottom_start_row = (
+            max(arrayRegion.y, background_data.h) - arrayRegion.y
+        )
+        bottom_end_row = (
+            max(arrayRegion.y+arrayRegion.h, background_data.h)
+            - arrayRegion.y
+        )
+        for x in range(0, planeRegion.w//MCU_WIDTH):
+            for y in range(
+                bottom_start_row//MCU_HEIGHT,
+                bottom_end_row//MCU_HEIGHT
+            ):
+                coeffs[y][x][0] = background_data.lum
+    return 1
+
+
+def fill_plane(callback, width, height, canvas_width, canvas_height, lum=1023):
+    """Runs callback over a whole luminance plane and returns its coefficients."""
+    plane = np.zeros(
+        (canvas_height//MCU_HEIGHT, canvas_width//MCU_WIDTH, MCU_SIZE),
+        dtype=np.int16)
+    background = BackgroundStruct(width, height, lum)
+    transform = TransformStruct(
+        CroppingRegion(0, 0, canvas_width, canvas_height), TJXOP_NONE,
+        TJXOPT_PERFECT | TJXOPT_CROP, pointer(background))
+    plane_region = CroppingRegion(0, 0, canvas_width, canvas_height)
+    for y in range(0, canvas_height, ROWS_PER_CALL):
+        rows = plane[y//MCU_HEIGHT:(y + ROWS_PER_CALL)//MCU_HEIGHT]
+        callback(
+            rows.ctypes.data_as(POINTER(c_short)),
+            CroppingRegion(0, y, canvas_width, rows.shape[0] * MCU_HEIGHT),
+            plane_region, 0, 0, addressof(transform))
+    return plane
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='fill_background benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('{:>22} {:>12} {:>12} {:>8}'.format('image -> canvas', 'loops ms', 'sliced ms', 'speedup'))
+    for case in CASES:
+        expected = fill_plane(fill_background_loops, *case)
+        if not np.array_equal(fill_plane(fill_background, *case), expected):
+            raise AssertionError('fill_background differs from reference for {}'.format(case))
+        loops = best_time(lambda: fill_plane(fill_background_loops, *case), args.repeat)
+        sliced = best_time(lambda: fill_plane(fill_background, *case), args.repeat)
+        print('{:>22} {:>12.2f} {:>12.2f} {:>7.1f}x'.format(
+            '{}x{} -> {}x{}'.format(*case), loops * 1e3, sliced * 1e3, loops / sliced))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: UTF-8 -*-
+#
+# Benchmark of luma-only decoding.
+#
+# Compares TurboJPEG.decode_gray, writing into a preallocated array, with
+# TurboJPEG.decode(pixel_format=TJPF_GRAY) for the full image, DCT-scaled
+# images and a region, across chroma subsampling modes. Input images are
+# synthetic unless --image is given.
+#
+# usage: python benchmarks/bench_gray.py [--lib-path PATH] [--image FILE] [--repeat N]
+#            [--use-tj3 | --no-tj3]
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from turbojpeg import TJPF_GRAY, TJSAMP_420, TJSAMP_422, TJSAMP_444, TurboJPEG
+
+SUBSAMPLES = {'444': TJSAMP_444, '422': TJSAMP_422, '420': TJSAMP_420}
+
+
+def synthetic_jpeg(jpeg, width, height, subsample):
+    y, x = np.mgrid[0:height, 0:width]
+    rng = np.random.default_rng(0)
+    img = np.stack([x * 255 // width, y * 255 // height, (x ^ y) & 255], -1)
+    img = np.clip(img + rng.integers(-8, 8, img.shape), 0, 255).astype(np.uint8)
+    return jpeg.encode(img, quality=90, jpeg_subsample=subsample)
+
+
+def best_time(func, repeat):
+    func()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='luma-only decode benchmark')
+    parser.add_argument('--lib-path', default=None)
+    parser.add_argument('--image', default=None)
+    parser.add_argument('--repeat', type=int, default=20)
+    tj3 = parser.add_mutually_exclusive_group()
+    tj3.add_argument('--use-tj3', dest='use_tj3', action='store_const', const=True, default=None)
+    tj3.add_argument('--no-tj3', dest='use_tj3', action='store_const', const=False)
+    args = parser.parse_args()
+
+    jpeg = TurboJPEG(args.lib_path, use_tj3=args.use_tj3)
+    if args.image:
+        with open(args.image, 'rb') as f:
+            images = {os.path.basename(args.image): f.read()}
+    else:
+        images = {'1920x1080 {}'.format(name): synthetic_jpeg(jpeg, 1920, 1080, subsample)
+                  for name, subsample in SUBSAMPLES.items()}
+
+    print('backend: {}'.format(jpeg.backend))
+    print('{:>16} {:>20} {:>12} {:>12} {:>8}'.format(
+        'image', 'operation', 'gray ms', 'luma ms', 'speedup'))
+    for name, jpeg_buf in images.items():
+        width, height, _, _ = jpeg.decode_header(jpeg_buf)
+        region = (width // 4, height // 4, width // 3, height // 3)
+        for label, scaling_factor, roi in [('full', None, None), ('scale 1/2', (1, 2), None),
+                                           ('scale 1/4', (1, 4), None), ('region', None, region)]:
+            out = np.empty_like(jpeg.decode_gray(jpeg_buf, scaling_factor=scaling_factor, region=roi))
+            gray = best_time(lambda: jpeg.decode(
+                jpeg_buf, TJPF_GRAY, scaling_factor, region=roi), args.repeat)
+            luma = best_time(lambda: jpeg.decode_gray(
+                jpeg_buf, out, scaling_factor, region=roi), args.repeat)
+            print('{:>16} {:>20} {:>12.2f} {:>12.2f} {:>7.2f}x'.format(
+                name, label, gray * 1e3, luma * 1e3, gray / luma))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+# -*- coding: UTF-8 -*-
+#
+# Benchmark suite of the TurboJPEG wrapper.
+#
+# Runs decode, decode_gray, decode_to_yuv, decode_to_yuv_planes, encode,
+# encode_from_yuv, crop, crop_multiple and scale_with_quality on synthetic
+# images across resolutions, TJSAMP_* subsampling modes,
+# TJFLAG_FASTDCT/TJFLAG_FASTUPSAMPLE and every supported scaling factor, so no
+# test images are needed.
+#
+# Each case records calls per second (fps), MB/s of uncompressed image data
+# (width * height * 3 bytes per call), the peak Python-side allocation of
+# one call and the blocks still held after it returns as seen by tracemalloc
+# (numpy arrays and bytes; memory libjpeg-turbo allocates internally is not
+# traced) and the peak RSS of the process after the case, which never
+# decreases during a run.
+#
+# Results are written as JSON. Passing an earlier result file as --baseline
+# compares each case with it and exits with status 1 when fps dropped or
+# allocations grew by more than --threshold. No baseline is shipped: fps
+# depends on the machine and its load, so record the baseline with --output
+# on the machine running the comparison, e.g. before a change. On busy or
+# single-core machines short runs vary by more than the default threshold;
+# use --min-time 1 or more there, not --quick.
+#
+# usage: python benchmarks/bench_suite.py [--lib-path PATH] [--output FILE]
+#            [--baseline FILE] [--threshold 0.1] [--min-time 0.2]
+#            [--resolutions 640x480,1920x1080] [--ops decode,encode] [--quick]
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from turbojpeg import (TJFLAG_FASTDCT, TJFLAG_FASTUPSAMPLE, TJSAMP_411,
+                       TJSAMP_420, TJSAMP_422, TJSAMP_440, TJSAMP_444,
+                       TJSAMP_GRAY, TurboJPEG)
+
+RESOLUTIONS = [(640, 480), (1920, 1080), (3840, 2160)]
+QUICK_RESOLUTIONS = [(640, 480)]
+SUBSAMPLES = {
+    '444': TJSAMP_444, '422': TJSAMP_422, '420': TJSAMP_420,
+    'gray': TJSAMP_GRAY, '440': TJSAMP_440, '411': TJSAMP_411,
+}
+FLAGS = {
+    'none': 0, 'fastdct': TJFLAG_FASTDCT, 'fastupsample': TJFLAG_FASTUPSAMPLE,
+    'fastdct+fastupsample': TJFLAG_FASTDCT | TJFLAG_FASTUPSAMPLE,
+}
+OPS = ['decode', 'decode_gray', 'decode_to_yuv', 'decode_to_yuv_planes', 'encode',
+       'encode_from_yuv', 'crop', 'crop_multiple', 'scale_with_quality']
+QUALITY = 85
+
+
+def synthetic_image(width, height):
+    """gradients plus noise, compressing like a camera frame rather than a flat image"""
+    y, x = np.mgrid[0:height, 0:width]
+    rng = np.random.default_rng(0)
+    img = np.stack([x * 255 // width, y * 255 // height, ((x // 8) ^ (y // 8)) & 255], -1)
+    return np.clip(img + rng.integers(-12, 13, img.shape), 0, 255).astype(np.uint8)
+
+
+def scaling_factor_name(scaling_factor):
+    return '{}/{}'.format(*scaling_factor) if scaling_factor else '1/1'
+
+
+def cases(jpeg, resolutions, ops):
+    """yields (key, params, func) for every benchmark case"""
+    for width, height in resolutions:
+        img = synthetic_image(width, height)
+        for subsample_name, subsample in SUBSAMPLES.items():
+            jpeg_buf = jpeg.encode(img, quality=QUALITY, jpeg_subsample=subsample)
+            yuv_buf, _ = jpeg.decode_to_yuv(jpeg_buf)
+            base = {'width': width, 'height': height, 'subsample': subsample_name}
+
+            def case(op, func, **params):
+                params = dict(base, op=op, **params)
+                key = '{op} {width}x{height} {subsample}'.format(**params) + ''.join(
+                    ' {}={}'.format(k, params[k]) for k in sorted(params)
+                    if k not in ('op', 'width', 'height', 'subsample'))
+                return key, params, func
+
+            if 'decode' in ops:
+                for flags_name, flags in FLAGS.items():
+                    yield case('decode', lambda f=flags: jpeg.decode(jpeg_buf, flags=f),
+                               flags=flags_name, scale='1/1')
+                for scaling_factor in sorted(jpeg.scaling_factors, key=lambda f: f[0] / f[1]):
+                    if scaling_factor == (1, 1):
+                        continue
+                    yield case('decode', lambda s=scaling_factor: jpeg.decode(jpeg_buf, scaling_factor=s),
+                               flags='none', scale=scaling_factor_name(scaling_factor))
+            if 'decode_gray' in ops:
+                gray_out = np.empty((height, width), dtype=np.uint8)
+                yield case('decode_gray', lambda: jpeg.decode_gray(jpeg_buf, gray_out))
+            for op in ('decode_to_yuv', 'decode_to_yuv_planes'):
+                if op in ops:
+                    for flags_name in ('none', 'fastdct'):
+                        yield case(op, lambda op=op, f=FLAGS[flags_name]: getattr(jpeg, op)(jpeg_buf, flags=f),
+                                   flags=flags_name)
+            if 'encode' in ops:
+                for flags_name in ('none', 'fastdct'):
+                    yield case('encode', lambda f=FLAGS[flags_name]: jpeg.encode(
+                        img, quality=QUALITY, jpeg_subsample=subsample, flags=f), flags=flags_name)
+            if 'encode_from_yuv' in ops:
+                yield case('encode_from_yuv', lambda: jpeg.encode_from_yuv(
+                    yuv_buf, height, width, quality=QUALITY, jpeg_subsample=subsample))
+            if 'crop' in ops:
+                yield case('crop', lambda: jpeg.crop(jpeg_buf, 32, 32, width // 2, height // 2))
+            if 'crop_multiple' in ops:
+                regions = [(0, 0, width // 2, height // 2), (width // 2 // 32 * 32, 0, width // 2, height),
+                           (0, height // 2 // 32 * 32, width, height // 2), (0, 0, width + 64, height + 64)]
+                yield case('crop_multiple', lambda: jpeg.crop_multiple(jpeg_buf, regions),
+                           crops=len(regions))
+            if 'scale_with_quality' in ops:
+                for scaling_factor in sorted(jpeg.scaling_factors, key=lambda f: f[0] / f[1]):
+                    yield case('scale_with_quality',
+                               lambda s=scaling_factor: jpeg.scale_with_quality(jpeg_buf, s, QUALITY),
+                               scale=scaling_factor_name(scaling_factor))
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak // 1024 if platform.system() == 'Darwin' else peak
+
+
+def measure(params, func, min_time):
+    """times func for at least min_time seconds, then traces one call"""
+    func()
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while calls < 3 or elapsed < min_time:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        func()
+        snapshot = tracemalloc.take_snapshot()
+        _, traced_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    fps = calls / elapsed
+    return dict(
+        params,
+        fps=fps,
+        mb_per_s=fps * params['width'] * params['height'] * 3 / 1e6,
+        alloc_peak_bytes=traced_peak,
+        retained_blocks=sum(stat.count for stat in snapshot.statistics('filename')),
+        peak_rss_kb=peak_rss_kb())
+
+
+def compare(results, baseline, threshold):
+    """returns regression messages of results against a baseline"""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None or 'error' in result or 'error' in base:
+            continue
+        if result['fps'] < base['fps'] * (1 - threshold):
+            regressions.append('{}: {:.1f} fps, baseline {:.1f} fps'.format(
+                key, result['fps'], base['fps']))
+        if result['alloc_peak_bytes'] > base['alloc_peak_bytes'] * (1 + threshold) + 1024:
+            regressions.append('{}: {} bytes allocated, baseline {}'.format(
+                key, result['alloc_peak_bytes'], base['alloc_peak_bytes']))
+    return regressions
+
+
+def parse_resolutions(value):
+    return [tuple(int(v) for v in r.split('x')) for r in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TurboJPEG benchmark suite')
+    parser.add_argument('--lib-path', default=None)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--threshold', type=float, default=0.1)
+    parser.add_argument('--min-time', type=float, default=0.2)
+    parser.add_argument('--resolutions', type=parse_resolutions, default=None)
+    parser.add_argument('--ops', default=','.join(OPS))
+    parser.add_argument('--quick', action='store_true',
+                        help='smallest resolution and a short minimum time per case')
+    args = parser.parse_args()
+
+    resolutions = args.resolutions or (QUICK_RESOLUTIONS if args.quick else RESOLUTIONS)
+    min_time = 0.05 if args.quick else args.min_time
+    ops = args.ops.split(',')
+    unknown = set(ops) - set(OPS)
+    if unknown:
+        parser.error('unknown ops: {}'.format(', '.join(sorted(unknown))))
+
+    jpeg = TurboJPEG(args.lib_path)
+    results = {}
+    for key, params, func in cases(jpeg, resolutions, ops):
+        try:
+            result = measure(params, func, min_time)
+            print('{:<64} {:>10.1f} fps {:>9.1f} MB/s {:>12} B'.format(
+                key, result['fps'], result['mb_per_s'], result['alloc_peak_bytes']))
+        except Exception as e:
+            result = dict(params, error='{}: {}'.format(type(e).__name__, e))
+            print('{:<64} {}'.format(key, result['error']))
+        results[key] = result
+
+    report = {
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                    'numpy': np.__version__, 'backend': jpeg.backend},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+    print('wrote {} cases to {}'.format(len(results), args.output))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('machine') != report['machine']:
+            print('warning: baseline was recorded on {}'.format(baseline.get('machine')))
+        regressions = compare(results, baseline['results'], args.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            sys.exit(1)
+        print('no regressions against {}'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# -*- coding: UTF-8 -*-
+#
+# Benchmark of JPEG to scaled JPEG transcoding.
+#
+# Compares TurboJPEG.scale_with_quality and TurboJPEG.thumbnails with the
+# previous scale_with_quality implementation, which is kept below as the
+# reference: a new float64 YUV buffer per call and one full decode per
+# thumbnail. Input images are synthetic unless --image is given.
+#
+# usage: python benchmarks/bench_transcode.py [--lib-path PATH] [--image FILE] [--repeat N]
+
+import argparse
+import os
+import sys
+import time
+from ctypes import byref, c_int, c_ulong, c_void_p, string_at
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from turbojpeg import TJSAMP_420, TurboJPEG, TurboJPEGLibrary
+
+SIZES = [(640, 360), (320, 180), (160, 90)]
+
+
+def scale_with_quality_previous(lib, jpeg_buf, scaling_factor, quality=85, flags=0):
+    """The scale_with_quality implementation the transcode engine replaced."""
+    jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
+    src_addr = jpeg_array.ctypes.data_as(lib.decompress.argtypes[1])
+    handle = lib.init_decompress()
+    try:
+        width, height, jpeg_subsample, jpeg_colorspace = c_int(), c_int(), c_int(), c_int()
+        if lib.decompress_header(handle, src_addr, jpeg_array.size, byref(width), byref(height),
+                                 byref(jpeg_subsample), byref(jpeg_colorspace)) != 0:
+            raise IOError(lib.get_error_str2(handle).decode())
+        num, denom = scaling_factor
+        scaled_width = (width.value * num + denom - 1) // denom
+        scaled_height = (height.value * num + denom - 1) // denom
+        buffer_YUV_size = lib.buffer_size_YUV2(
+            scaled_height, 4, scaled_width, jpeg_subsample.value)
+        img_array = np.empty([buffer_YUV_size])
+        dest_addr = img_array.ctypes.data_as(lib.decompress.argtypes[1])
+        if lib.decompressToYUV2(handle, src_addr, jpeg_array.size, dest_addr,
+                                scaled_width, 4, scaled_height, flags) != 0:
+            raise IOError(lib.get_error_str2(handle).decode())
+    finally:
+        lib.destroy(handle)
+    handle = lib.init_compress()
+    try:
+        jpeg_out = c_void_p()
+        jpeg_size = c_ulong()
+        if lib.compressFromYUV(handle, dest_addr, scaled_width, 4, scaled_height,
+                               jpeg_subsample.value, byref(jpeg_out), byref(jpeg_size),
+                               quality, flags) != 0:
+            raise IOError(lib.get_error_str2(handle).decode())
+        try:
+            return string_at(jpeg_out.value, jpeg_size.value)
+        finally:
+            lib.free(jpeg_out)
+    finally:
+        lib.destroy(handle)
+
+
+def fit_scaling_factor(jpeg, width, height, size):
+    """largest scaling factor fitting width x height into size, like thumbnails"""
+    def scaled(dim, f):
+        return (dim * f[0] + f[1] - 1) // f[1]
+    fitting = [f for f in jpeg.scaling_factors
+               if scaled(width, f) <= size[0] and scaled(height, f) <= size[1]]
+    return max(fitting or [min(jpeg.scaling_factors, key=lambda f: f[0] / f[1])],
+               key=lambda f: f[0] / f[1])
+
+
+def synthetic_jpeg(jpeg, width, height):
+    y, x = np.mgrid[0:height, 0:width]
+    rng = np.random.default_rng(0)
+    img = np.stack([x * 255 // width, y * 255 // height, (x ^ y) & 255], -1)
+    img = np.clip(img + rng.integers(-8, 8, img.shape), 0, 255).astype(np.uint8)
+    return jpeg.encode(img, quality=90, jpeg_subsample=TJSAMP_420)
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='transcode benchmark')
+    parser.add_argument('--lib-path', default=None)
+    parser.add_argument('--image', default=None)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    jpeg = TurboJPEG(args.lib_path)
+    lib = TurboJPEGLibrary.load(args.lib_path)
+    if args.image:
+        with open(args.image, 'rb') as f:
+            images = {os.path.basename(args.image): f.read()}
+    else:
+        images = {'{}x{}'.format(w, h): synthetic_jpeg(jpeg, w, h)
+                  for w, h in [(1280, 720), (1920, 1080), (3840, 2160)]}
+
+    print('{:>12} {:>24} {:>12} {:>12} {:>8}'.format(
+        'image', 'operation', 'previous ms', 'current ms', 'speedup'))
+    for name, jpeg_buf in images.items():
+        for scaling_factor in [(1, 2), (1, 4)]:
+            previous = best_time(
+                lambda: scale_with_quality_previous(lib, jpeg_buf, scaling_factor), args.repeat)
+            current = best_time(
+                lambda: jpeg.scale_with_quality(jpeg_buf, scaling_factor), args.repeat)
+            print('{:>12} {:>24} {:>12.2f} {:>12.2f} {:>7.1f}x'.format(
+                name, 'scale {}/{}'.format(*scaling_factor),
+                previous * 1e3, current * 1e3, previous / current))
+        width, height, _, _ = jpeg.decode_header(jpeg_buf)
+        factors = [fit_scaling_factor(jpeg, width, height, size) for size in SIZES]
+        previous = best_time(
+            lambda: [scale_with_quality_previous(lib, jpeg_buf, f) for f in factors], args.repeat)
+        current = best_time(lambda: jpeg.thumbnails(jpeg_buf, SIZES), args.repeat)
+        print('{:>12} {:>24} {:>12.2f} {:>12.2f} {:>7.1f}x'.format(
+            name, '{} thumbnails'.format(len(SIZES)),
+            previous * 1e3, current * 1e3, previous / current))
+
+
+if __name__ == '__main__':
+    main()
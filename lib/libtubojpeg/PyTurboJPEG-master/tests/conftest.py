@@ -0,0 +1,59 @@
+# -*- coding: UTF-8 -*-
+#
+# pytest fixtures running the tests against each libTurboJPEG build and
+# backend.
+#
+# The builds are the bundled lib32 one and the library TurboJPEGLibrary.find
+# locates (e.g. a system libjpeg-turbo 3.x, or the one TURBOJPEG_LIB_PATH
+# points to). TURBOJPEG_TEST_LIB_PATHS replaces them with its own list,
+# separated by os.pathsep. Builds this interpreter cannot load, e.g. the
+# 32-bit one in a 64-bit Python, are skipped.
+#
+# usage: python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from turbojpeg import TurboJPEG, TurboJPEGLibrary
+
+BUNDLED_LIB_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lib32', 'libturbojpeg.so.0')
+TEST_LIB_PATHS_ENV = 'TURBOJPEG_TEST_LIB_PATHS'
+
+
+def lib_paths():
+    """returns the library paths to test, None for the one found by default"""
+    paths = os.environ.get(TEST_LIB_PATHS_ENV)
+    if paths:
+        return paths.split(os.pathsep)
+    return [os.path.normpath(BUNDLED_LIB_PATH), None]
+
+
+@pytest.fixture(params=lib_paths(), ids=lambda path: path or 'default')
+def lib(request):
+    """the bindings of a libTurboJPEG build"""
+    try:
+        return TurboJPEGLibrary.load(request.param)
+    except (OSError, RuntimeError) as e:
+        pytest.skip('cannot load {}: {}'.format(request.param or 'the default library', e))
+
+
+@pytest.fixture(params=[False, True], ids=['legacy', 'tj3'])
+def jpeg(request, lib):
+    """a TurboJPEG instance of each backend the library provides"""
+    if request.param and not lib.has_tj3:
+        pytest.skip('{} does not provide the tj3 API'.format(lib.lib_path))
+    with TurboJPEG(lib.lib_path, use_tj3=request.param) as jpeg:
+        yield jpeg
+
+
+def synthetic_image(width, height):
+    """returns a BGR test image of gradients and texture"""
+    y, x = np.mgrid[0:height, 0:width]
+    return np.stack(
+        [x * 255 // width, y * 255 // height, (x * 7 ^ y * 3) & 255], -1).astype(np.uint8)
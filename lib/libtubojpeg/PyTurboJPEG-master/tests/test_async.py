@@ -0,0 +1,121 @@
+# -*- coding: UTF-8 -*-
+#
+# Tests of AsyncTurboJPEG: the awaitable methods have to return what the
+# blocking ones do, and calls beyond max_concurrency have to wait.
+
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_image
+from turbojpeg import TJXOP_ROT90, AsyncTurboJPEG
+
+TIMEOUT = 5
+
+
+class BlockingDecoder(object):
+    """stands in for TurboJPEG, its decode blocks until released"""
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.calls = []
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+
+    def decode(self, jpeg_buf, pixel_format, scaling_factor, flags):
+        with self.lock:
+            self.calls.append(jpeg_buf)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            assert self.release.wait(TIMEOUT)
+            return jpeg_buf
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def test_methods_match_blocking_calls(jpeg):
+    img_array = synthetic_image(203, 101)
+    jpeg_buf = jpeg.encode(img_array)
+
+    async def run():
+        async with AsyncTurboJPEG(jpeg, max_workers=2) as async_jpeg:
+            return await asyncio.gather(
+                async_jpeg.decode_header(jpeg_buf),
+                async_jpeg.decode(jpeg_buf, scaling_factor=(1, 2)),
+                async_jpeg.encode(img_array, 75),
+                async_jpeg.crop(jpeg_buf, 16, 16, 64, 32),
+                async_jpeg.transform(jpeg_buf, [TJXOP_ROT90]))
+
+    header, img, encoded, cropped, transformed = asyncio.run(run())
+    assert header == jpeg.decode_header(jpeg_buf)
+    np.testing.assert_array_equal(img, jpeg.decode(jpeg_buf, scaling_factor=(1, 2)))
+    assert encoded == jpeg.encode(img_array, 75)
+    assert cropped == jpeg.crop(jpeg_buf, 16, 16, 64, 32)
+    assert transformed == jpeg.transform(jpeg_buf, [TJXOP_ROT90])
+    # the instance passed in is not closed
+    assert jpeg.decode_header(jpeg_buf) == header
+
+
+def test_own_instance(lib, jpeg):
+    jpeg_buf = jpeg.encode(synthetic_image(64, 48))
+
+    async def run():
+        async with AsyncTurboJPEG(lib_path=lib.lib_path, max_workers=1) as async_jpeg:
+            return await async_jpeg.decode(jpeg_buf)
+
+    np.testing.assert_array_equal(asyncio.run(run()), jpeg.decode(jpeg_buf))
+
+
+def test_errors_are_raised(jpeg):
+    async def run():
+        async with AsyncTurboJPEG(jpeg, max_workers=1) as async_jpeg:
+            with pytest.raises(IOError):
+                await async_jpeg.decode(b'\xff\xd8 not a jpeg')
+            # the worker and its slot are still usable
+            return await async_jpeg.decode_header(jpeg_buf)
+
+    jpeg_buf = jpeg.encode(synthetic_image(64, 48))
+    assert asyncio.run(run()) == jpeg.decode_header(jpeg_buf)
+
+
+def test_max_concurrency():
+    decoder = BlockingDecoder()
+
+    async def run():
+        async with AsyncTurboJPEG(decoder, max_workers=4, max_concurrency=2) as async_jpeg:
+            calls = [asyncio.ensure_future(async_jpeg.decode(i)) for i in range(6)]
+            while len(decoder.calls) < 2:
+                await asyncio.sleep(0.01)
+            # the other calls wait for a slot
+            await asyncio.sleep(0.1)
+            assert len(decoder.calls) == 2
+            decoder.release.set()
+            return await asyncio.wait_for(asyncio.gather(*calls), TIMEOUT)
+
+    assert asyncio.run(run()) == list(range(6))
+    assert decoder.max_running == 2
+
+
+def test_cancelled_queued_call_is_not_run():
+    decoder = BlockingDecoder()
+
+    async def run():
+        async with AsyncTurboJPEG(decoder, max_workers=1, max_concurrency=1) as async_jpeg:
+            running = asyncio.ensure_future(async_jpeg.decode('running'))
+            queued = asyncio.ensure_future(async_jpeg.decode('queued'))
+            while not decoder.calls:
+                await asyncio.sleep(0.01)
+            queued.cancel()
+            decoder.release.set()
+            assert await asyncio.wait_for(running, TIMEOUT) == 'running'
+            with pytest.raises(asyncio.CancelledError):
+                await queued
+            assert await async_jpeg.decode('next') == 'next'
+
+    asyncio.run(run())
+    assert decoder.calls == ['running', 'next']
@@ -0,0 +1,122 @@
+# -*- coding: UTF-8 -*-
+#
+# Compares the tj3 backend with the legacy one on each libTurboJPEG build
+# providing the tj3 API: both have to return the same headers, images and
+# JPEG data.
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_image
+from turbojpeg import (TJFLAG_ACCURATEDCT, TJFLAG_BOTTOMUP, TJFLAG_PROGRESSIVE, TJPF_BGR,
+                       TJPF_BGRA, TJPF_GRAY, TJPF_RGB, TJSAMP_420, TJSAMP_422, TJSAMP_440,
+                       TJSAMP_444, TJSAMP_GRAY, TJXOP_HFLIP, TJXOP_ROT90, TJXOPT_GRAY,
+                       TransformOp, TurboJPEG)
+
+SUBSAMPLES = [TJSAMP_444, TJSAMP_422, TJSAMP_420, TJSAMP_440, TJSAMP_GRAY]
+REGIONS = [(0, 0, 50, 40), (17, 9, 60, 33), (100, 50, 200, 200)]
+WIDTH, HEIGHT = 203, 101
+
+
+@pytest.fixture
+def backends(lib):
+    """(legacy, tj3) TurboJPEG instances of one library"""
+    if not lib.has_tj3:
+        pytest.skip('{} does not provide the tj3 API'.format(lib.lib_path))
+    with TurboJPEG(lib.lib_path, use_tj3=False) as legacy, \
+            TurboJPEG(lib.lib_path, use_tj3=True) as tj3:
+        assert (legacy.backend, tj3.backend) == ('legacy', 'tj3')
+        yield legacy, tj3
+
+
+@pytest.fixture(params=SUBSAMPLES)
+def jpeg_buf(request, backends):
+    legacy, _ = backends
+    return legacy.encode(synthetic_image(WIDTH, HEIGHT), jpeg_subsample=request.param)
+
+
+def test_decode_header(backends, jpeg_buf):
+    legacy, tj3 = backends
+    assert tj3.decode_header(jpeg_buf) == legacy.decode_header(jpeg_buf)
+
+
+@pytest.mark.parametrize('pixel_format', [TJPF_BGR, TJPF_RGB, TJPF_BGRA, TJPF_GRAY])
+def test_decode(backends, jpeg_buf, pixel_format):
+    legacy, tj3 = backends
+    np.testing.assert_array_equal(
+        tj3.decode(jpeg_buf, pixel_format), legacy.decode(jpeg_buf, pixel_format))
+    np.testing.assert_array_equal(tj3.decode_gray(jpeg_buf), legacy.decode_gray(jpeg_buf))
+
+
+def test_scaled_decode(backends, jpeg_buf):
+    legacy, tj3 = backends
+    for scaling_factor in legacy.scaling_factors:
+        np.testing.assert_array_equal(
+            tj3.decode(jpeg_buf, scaling_factor=scaling_factor),
+            legacy.decode(jpeg_buf, scaling_factor=scaling_factor))
+
+
+@pytest.mark.parametrize('region', REGIONS)
+@pytest.mark.parametrize('scaling_factor', [None, (1, 2)])
+def test_region_decode(backends, jpeg_buf, region, scaling_factor):
+    legacy, tj3 = backends
+    x, y, w, h = region
+    full = legacy.decode(jpeg_buf, scaling_factor=scaling_factor)
+    if scaling_factor is not None:
+        num, denom = scaling_factor
+        x, y = x * num // denom, y * num // denom
+        w, h = (w * num + denom - 1) // denom, (h * num + denom - 1) // denom
+    expected = full[y:y + h, x:x + w]
+    subsample = legacy.decode_header(jpeg_buf)[2]
+    for jpeg in backends:
+        img_array = jpeg.decode(jpeg_buf, scaling_factor=scaling_factor, region=region)
+        assert img_array.shape == expected.shape
+        if subsample in (TJSAMP_444, TJSAMP_GRAY):
+            np.testing.assert_array_equal(img_array, expected)
+        else:
+            # chroma upsampling at the MCU-aligned crop edges lacks the
+            # neighbouring samples, see TurboJPEG.decode
+            np.testing.assert_array_equal(img_array[2:-2, 2:-2], expected[2:-2, 2:-2])
+
+
+@pytest.mark.parametrize('subsample', SUBSAMPLES)
+@pytest.mark.parametrize('quality', [50, 85, 96])
+@pytest.mark.parametrize('flags', [0, TJFLAG_ACCURATEDCT, TJFLAG_PROGRESSIVE, TJFLAG_BOTTOMUP])
+def test_encode(backends, subsample, quality, flags):
+    legacy, tj3 = backends
+    img_array = synthetic_image(WIDTH, HEIGHT)
+    expected = legacy.encode(img_array, quality, jpeg_subsample=subsample, flags=flags)
+    assert tj3.encode(img_array, quality, jpeg_subsample=subsample, flags=flags) == expected
+    out = np.empty(tj3.buffer_size(WIDTH, HEIGHT, subsample), dtype=np.uint8)
+    assert bytes(tj3.encode_into(
+        img_array, out, quality, jpeg_subsample=subsample, flags=flags)) == expected
+
+
+def test_crop(backends, jpeg_buf):
+    legacy, tj3 = backends
+    assert tj3.crop(jpeg_buf, 16, 8, 64, 32) == legacy.crop(jpeg_buf, 16, 8, 64, 32)
+    assert tj3.crop(jpeg_buf, 16, 8, 64, 32, gray=True) == \
+        legacy.crop(jpeg_buf, 16, 8, 64, 32, gray=True)
+
+
+def test_transform(backends, jpeg_buf):
+    legacy, tj3 = backends
+    ops = [TransformOp(TJXOP_ROT90), TransformOp(TJXOP_HFLIP, TJXOPT_GRAY)]
+    assert tj3.transform(jpeg_buf, ops) == legacy.transform(jpeg_buf, ops)
+
+
+@pytest.mark.parametrize('settings', [
+    dict(lossless=True), dict(flags=TJFLAG_PROGRESSIVE), dict(flags=TJFLAG_ACCURATEDCT)])
+def test_encode_settings_do_not_leak_into_next_encode(lib, settings):
+    if not lib.has_tj3:
+        pytest.skip('{} does not provide the tj3 API'.format(lib.lib_path))
+    img_array = synthetic_image(WIDTH, HEIGHT)
+    with TurboJPEG(lib.lib_path, use_tj3=True, pool_size=0) as unpooled:
+        expected = unpooled.encode(img_array, 85)
+    with TurboJPEG(lib.lib_path, use_tj3=True, pool_size=1) as tj3:
+        out = np.empty(tj3.buffer_size(WIDTH, HEIGHT), dtype=np.uint8)
+        for _ in range(2):
+            tj3.encode(img_array, **settings)
+            assert tj3.encode(img_array, 85) == expected
+            tj3.encode(img_array, **settings)
+            assert bytes(tj3.encode_into(img_array, out, 85)) == expected
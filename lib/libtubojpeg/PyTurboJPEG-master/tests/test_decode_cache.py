@@ -0,0 +1,19 @@
+# -*- coding: UTF-8 -*-
+#
+# Tests of DecodeCache.
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_image
+from turbojpeg import DecodeCache
+
+
+@pytest.mark.parametrize('scaling_factor', [(1, 2), [1, 2]])
+def test_scaling_factor_list_or_tuple(jpeg, scaling_factor):
+    jpeg_buf = jpeg.encode(synthetic_image(64, 48))
+    cache = DecodeCache(jpeg)
+    img_array = cache.decode(jpeg_buf, scaling_factor=scaling_factor)
+    np.testing.assert_array_equal(img_array, jpeg.decode(jpeg_buf, scaling_factor=(1, 2)))
+    assert cache.decode(jpeg_buf, scaling_factor=(1, 2)) is img_array
+    assert cache.stats()['hits'] == 1
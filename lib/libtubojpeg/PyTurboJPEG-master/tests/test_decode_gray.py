@@ -0,0 +1,75 @@
+# -*- coding: UTF-8 -*-
+#
+# Tests of decode_gray: the luma it decodes has to equal decode with
+# TJPF_GRAY and the Y plane of decode_to_yuv_planes.
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_image
+from turbojpeg import (TJFLAG_PROGRESSIVE, TJPF_GRAY, TJSAMP_420, TJSAMP_422, TJSAMP_440, TJSAMP_444,
+                       TJSAMP_GRAY, FrameRing)
+
+SUBSAMPLES = [TJSAMP_444, TJSAMP_422, TJSAMP_420, TJSAMP_440, TJSAMP_GRAY]
+REGIONS = [(0, 0, 50, 40), (17, 9, 60, 33), (100, 50, 200, 200)]
+WIDTH, HEIGHT = 203, 101
+
+
+@pytest.fixture(params=SUBSAMPLES)
+def jpeg_buf(request, jpeg):
+    return jpeg.encode(synthetic_image(WIDTH, HEIGHT), jpeg_subsample=request.param)
+
+
+@pytest.mark.parametrize('scaling_factor', [None, (1, 2), (3, 8), (1, 8)])
+def test_matches_gray_decode(jpeg, jpeg_buf, scaling_factor):
+    img_array = jpeg.decode_gray(jpeg_buf, scaling_factor=scaling_factor)
+    expected = jpeg.decode(jpeg_buf, TJPF_GRAY, scaling_factor)
+    assert img_array.ndim == 2
+    np.testing.assert_array_equal(img_array, expected[:, :, 0])
+    y_plane = jpeg.decode_to_yuv_planes(jpeg_buf, scaling_factor)[0]
+    np.testing.assert_array_equal(img_array, y_plane[:img_array.shape[0], :img_array.shape[1]])
+
+
+def test_progressive(jpeg):
+    jpeg_buf = jpeg.encode(synthetic_image(WIDTH, HEIGHT), flags=TJFLAG_PROGRESSIVE)
+    np.testing.assert_array_equal(
+        jpeg.decode_gray(jpeg_buf), jpeg.decode(jpeg_buf, TJPF_GRAY)[:, :, 0])
+
+
+@pytest.mark.parametrize('region', REGIONS)
+@pytest.mark.parametrize('scaling_factor', [None, (1, 2)])
+def test_region(jpeg, jpeg_buf, region, scaling_factor):
+    x, y, w, h = region
+    full = jpeg.decode_gray(jpeg_buf, scaling_factor=scaling_factor)
+    if scaling_factor is not None:
+        num, denom = scaling_factor
+        x, y = x * num // denom, y * num // denom
+        w, h = (w * num + denom - 1) // denom, (h * num + denom - 1) // denom
+    # the luma needs no upsampling, so the crop edges match too
+    np.testing.assert_array_equal(
+        jpeg.decode_gray(jpeg_buf, scaling_factor=scaling_factor, region=region),
+        full[y:y + h, x:x + w])
+
+
+def test_into_caller_buffers(jpeg, jpeg_buf):
+    expected = jpeg.decode_gray(jpeg_buf)
+    out = np.empty((HEIGHT, WIDTH), dtype=np.uint8)
+    assert jpeg.decode_gray(jpeg_buf, out) is out
+    np.testing.assert_array_equal(out, expected)
+    # padded rows, e.g. a view into a larger frame
+    frame = np.zeros((HEIGHT, WIDTH + 29), dtype=np.uint8)
+    np.testing.assert_array_equal(jpeg.decode_gray(jpeg_buf, frame[:, 3:3 + WIDTH]), expected)
+    assert not frame[:, :3].any() and not frame[:, 3 + WIDTH:].any()
+    region_out = np.empty((33, 60), dtype=np.uint8)
+    np.testing.assert_array_equal(
+        jpeg.decode_gray(jpeg_buf, region_out, region=(17, 9, 60, 33)), expected[9:42, 17:77])
+    ring = FrameRing(2)
+    frames = [jpeg.decode_gray(jpeg_buf, ring) for _ in range(3)]
+    assert frames[0] is frames[2]
+    np.testing.assert_array_equal(frames[1], expected)
+
+
+@pytest.mark.parametrize('shape', [(HEIGHT, WIDTH + 1), (HEIGHT, WIDTH, 1), (HEIGHT - 1, WIDTH)])
+def test_rejects_wrong_shape(jpeg, jpeg_buf, shape):
+    with pytest.raises(ValueError):
+        jpeg.decode_gray(jpeg_buf, np.empty(shape, dtype=np.uint8))
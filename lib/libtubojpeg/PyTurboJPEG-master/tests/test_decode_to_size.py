@@ -0,0 +1,75 @@
+# -*- coding: UTF-8 -*-
+#
+# Tests of decode_to_size and choose_scaling_factor.
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_image
+
+SIZES = list(range(1, 400, 37))
+
+
+def fit_size(width, height, max_w, max_h):
+    """the largest aspect-preserving size within (max_w, max_h), never upscaled"""
+    num, denom = (max_w, width) if max_w * height <= max_h * width else (max_h, height)
+    if num > denom:
+        num = denom = 1
+    return max(width * num // denom, 1), max(height * num // denom, 1)
+
+
+def cover_size(width, height, min_w, min_h):
+    """the smallest aspect-preserving size covering (min_w, min_h)"""
+    num, denom = (min_w, width) if min_w * height >= min_h * width else (min_h, height)
+    return -(-width * num // denom), -(-height * num // denom)
+
+
+@pytest.fixture(params=[(640, 480), (203, 101)], ids=['640x480', '203x101'])
+def image(request, jpeg):
+    width, height = request.param
+    return width, height, jpeg.encode(synthetic_image(width, height))
+
+
+@pytest.mark.parametrize('min_size, shape', [((100, 1000), (1000, 1334)), ((31, 31), (31, 42))])
+def test_resize_exact_limit(jpeg, min_size, shape):
+    jpeg_buf = jpeg.encode(synthetic_image(640, 480))
+    assert jpeg.decode_to_size(jpeg_buf, min_size=min_size, resize=True).shape[:2] == shape
+
+
+def test_resize_max_size(jpeg, image):
+    width, height, jpeg_buf = image
+    for max_w in SIZES:
+        for max_h in SIZES:
+            img_array = jpeg.decode_to_size(jpeg_buf, max_size=(max_w, max_h), resize=True)
+            target_w, target_h = fit_size(width, height, max_w, max_h)
+            assert img_array.shape == (target_h, target_w, 3)
+
+
+def test_resize_min_size(jpeg, image):
+    width, height, jpeg_buf = image
+    for min_w in SIZES:
+        for min_h in SIZES:
+            img_array = jpeg.decode_to_size(jpeg_buf, min_size=(min_w, min_h), resize=True)
+            target_w, target_h = cover_size(width, height, min_w, min_h)
+            assert img_array.shape == (target_h, target_w, 3)
+
+
+def scale(factor):
+    return factor[0] / factor[1]
+
+
+@pytest.mark.parametrize('size', [(1, 1), (50, 50), (160, 120), (1000, 1000), (5000, 5000)])
+def test_dct_scaled_size(jpeg, image, size):
+    width, height, jpeg_buf = image
+    smallest = min(jpeg.scaling_factors, key=scale)
+    largest = max(jpeg.scaling_factors, key=scale)
+    img_array = jpeg.decode_to_size(jpeg_buf, max_size=size)
+    scaling_factor = jpeg.choose_scaling_factor(width, height, max_size=size)
+    np.testing.assert_array_equal(img_array, jpeg.decode(jpeg_buf, scaling_factor=scaling_factor))
+    fits = img_array.shape[1] <= size[0] and img_array.shape[0] <= size[1]
+    assert fits or scaling_factor == smallest
+    img_array = jpeg.decode_to_size(jpeg_buf, min_size=size)
+    scaling_factor = jpeg.choose_scaling_factor(width, height, min_size=size)
+    np.testing.assert_array_equal(img_array, jpeg.decode(jpeg_buf, scaling_factor=scaling_factor))
+    covers = img_array.shape[1] >= size[0] and img_array.shape[0] >= size[1]
+    assert covers or scaling_factor == largest
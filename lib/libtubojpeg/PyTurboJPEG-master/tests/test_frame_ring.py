@@ -0,0 +1,78 @@
+# -*- coding: UTF-8 -*-
+#
+# Tests of FrameRing and of decoding into caller-supplied arrays: decode_into
+# has to return the same image as decode.
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_image
+from turbojpeg import TJPF_BGRA, TJPF_GRAY, FrameRing
+
+WIDTH, HEIGHT = 203, 101
+
+
+@pytest.fixture
+def jpeg_buf(jpeg):
+    return jpeg.encode(synthetic_image(WIDTH, HEIGHT))
+
+
+def test_frame_ring_round_robin():
+    ring = FrameRing(3)
+    frames = [ring.acquire((4, 5, 3)) for _ in range(6)]
+    assert [frame.shape for frame in frames] == [(4, 5, 3)] * 6
+    assert len(set(map(id, frames[:3]))) == 3
+    assert all(frames[i] is frames[i + 3] for i in range(3))
+
+
+def test_frame_ring_reallocates_on_shape_change():
+    ring = FrameRing(1)
+    frame = ring.acquire((4, 5, 3))
+    assert ring.acquire([4, 5, 3]) is frame
+    smaller = ring.acquire((2, 5, 3))
+    assert smaller.shape == (2, 5, 3) and smaller is not frame
+    assert ring.acquire((2, 5, 3)) is smaller
+
+
+def test_frame_ring_count():
+    with pytest.raises(ValueError):
+        FrameRing(0)
+
+
+@pytest.mark.parametrize('pixel_format', [None, TJPF_BGRA, TJPF_GRAY])
+@pytest.mark.parametrize('scaling_factor', [None, (1, 2), (3, 8)])
+def test_decode_into_matches_decode(jpeg, jpeg_buf, pixel_format, scaling_factor):
+    kwargs = dict(scaling_factor=scaling_factor)
+    if pixel_format is not None:
+        kwargs['pixel_format'] = pixel_format
+    expected = jpeg.decode(jpeg_buf, **kwargs)
+    out = np.empty_like(expected)
+    assert jpeg.decode_into(jpeg_buf, out, **kwargs) is out
+    np.testing.assert_array_equal(out, expected)
+    # padded rows, e.g. a view into a larger frame
+    frame = np.zeros((expected.shape[0], expected.shape[1] + 13, expected.shape[2]), dtype=np.uint8)
+    view = frame[:, 5:5 + expected.shape[1]]
+    np.testing.assert_array_equal(jpeg.decode_into(jpeg_buf, view, **kwargs), expected)
+    assert not frame[:, :5].any() and not frame[:, 5 + expected.shape[1]:].any()
+
+
+def test_decode_into_frame_ring(jpeg, jpeg_buf):
+    ring = FrameRing(2)
+    expected = jpeg.decode(jpeg_buf)
+    frames = [jpeg.decode_into(jpeg_buf, ring) for _ in range(4)]
+    for frame in frames:
+        np.testing.assert_array_equal(frame, expected)
+    assert frames[0] is frames[2] and frames[1] is frames[3] and frames[0] is not frames[1]
+
+
+@pytest.mark.parametrize('shape', [(HEIGHT, WIDTH + 1, 3), (HEIGHT, WIDTH, 4), (HEIGHT - 1, WIDTH, 3)])
+def test_decode_into_rejects_wrong_shape(jpeg, jpeg_buf, shape):
+    with pytest.raises(ValueError):
+        jpeg.decode_into(jpeg_buf, np.empty(shape, dtype=np.uint8))
+
+
+def test_decode_into_rejects_read_only(jpeg, jpeg_buf):
+    out = np.empty((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    out.flags.writeable = False
+    with pytest.raises(ValueError):
+        jpeg.decode_into(jpeg_buf, out)
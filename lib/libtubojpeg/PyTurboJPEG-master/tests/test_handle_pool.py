@@ -0,0 +1,115 @@
+# -*- coding: UTF-8 -*-
+#
+# Regression tests of the pooled tjhandles: a reused handle must not leak the
+# header or output of its previous image into a later call.
+
+import warnings
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_image
+from turbojpeg import (TJFLAG_ACCURATEDCT, TJFLAG_BOTTOMUP, TJFLAG_PROGRESSIVE, TJPF_GRAY, TJSAMP_422,
+                       FrameRing, JPEGIndex, TurboJPEG)
+
+# datastreams without an image: libjpeg-turbo reads them as tables-only and
+# returns success from the header decode
+NO_IMAGE_BUFFERS = [
+    b'\xff\xd8junk',
+    b'\xff\xd8',
+    b'\xff\xd8\xff\xd9',
+    b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00\xff\xd9',
+]
+
+
+@pytest.fixture
+def jpeg_buf(jpeg):
+    return jpeg.encode(synthetic_image(64, 48))
+
+
+@pytest.mark.parametrize('bad_buf', NO_IMAGE_BUFFERS)
+def test_no_image_after_decode_raises(jpeg, jpeg_buf, bad_buf):
+    jpeg.decode(jpeg_buf)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        with pytest.raises(IOError):
+            jpeg.decode_header(bad_buf)
+        with pytest.raises(IOError):
+            jpeg.decode(bad_buf)
+        with pytest.raises(IOError):
+            jpeg.decode_into(bad_buf, np.zeros((48, 64, 3), dtype=np.uint8))
+        with pytest.raises(IOError):
+            jpeg.decode_gray(bad_buf)
+        with pytest.raises(IOError):
+            jpeg.decode_to_yuv(bad_buf)
+        result, = jpeg.decode_batch([bad_buf])
+        assert isinstance(result, IOError)
+    # the pool stays usable
+    assert jpeg.decode_header(jpeg_buf)[:2] == (64, 48)
+    assert jpeg.decode(jpeg_buf).shape == (48, 64, 3)
+
+
+def test_header_warning_returns_image_header(jpeg, jpeg_buf):
+    offset = jpeg_buf.index(b'\xff\xdb')
+    # extraneous bytes before the DQT marker make the header decode warn
+    corrupt = jpeg_buf[:offset] + b'\x00\x00' + jpeg_buf[offset:]
+    header = jpeg.decode_header(jpeg_buf)
+    jpeg.decode(jpeg.encode(synthetic_image(32, 32)))
+    with pytest.warns(UserWarning, match='extraneous bytes'):
+        assert jpeg.decode_header(corrupt) == header
+
+
+def test_truncated_decode_matches_new_instance(lib, jpeg, jpeg_buf):
+    truncated = jpeg_buf[:len(jpeg_buf) * 2 // 3]
+    jpeg.decode(jpeg.encode(synthetic_image(32, 32)))
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        img_array = jpeg.decode(truncated)
+        gray_array = jpeg.decode_gray(truncated)
+    assert caught
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        with TurboJPEG(lib.lib_path, use_tj3=jpeg.backend == 'tj3') as fresh:
+            np.testing.assert_array_equal(img_array, fresh.decode(truncated))
+            np.testing.assert_array_equal(gray_array, fresh.decode(truncated, TJPF_GRAY)[:, :, 0])
+
+
+def test_decode_into_frame_ring_reuses_handle(jpeg, jpeg_buf):
+    ring = FrameRing(2)
+    expected = jpeg.decode(jpeg_buf)
+    for _ in range(4):
+        np.testing.assert_array_equal(jpeg.decode_into(jpeg_buf, ring), expected)
+    created = jpeg.stats()['handles_created']
+    assert created.get('tj3_decompress' if jpeg.backend == 'tj3' else 'decompress') == 1
+
+
+def test_has_image():
+    assert not any(JPEGIndex.has_image(buf) for buf in NO_IMAGE_BUFFERS)
+    assert JPEGIndex.has_image(b'\xff\xd8\x00garbage\xff\xc0\x00\x11')
+
+
+def encode_calls(jpeg, img_array, flags):
+    """returns the output of each compress handle user called with flags"""
+    jpeg_buf = jpeg.encode(img_array, 85)
+    yuv_array, _ = jpeg.decode_to_yuv(jpeg_buf)
+    planes = jpeg.decode_to_yuv_planes(jpeg_buf)
+    height, width = img_array.shape[:2]
+    out = np.empty(jpeg.buffer_size(width, height), dtype=np.uint8)
+    return [
+        jpeg.encode(img_array, 85, flags=flags),
+        bytes(jpeg.encode_into(img_array, out, 85, flags=flags)),
+        jpeg.encode_from_yuv(yuv_array, height, width, 85, TJSAMP_422, flags),
+        jpeg.encode_from_yuv_planes(planes, height, width, 85, TJSAMP_422, flags),
+        jpeg.scale_with_quality(jpeg_buf, (1, 2), 70, flags=flags),
+    ]
+
+
+@pytest.mark.parametrize('flags', [TJFLAG_PROGRESSIVE, TJFLAG_ACCURATEDCT, TJFLAG_BOTTOMUP])
+def test_encode_flags_do_not_leak_into_next_encode(lib, flags):
+    img_array = synthetic_image(160, 120)
+    with TurboJPEG(lib.lib_path, use_tj3=False, pool_size=0) as unpooled:
+        expected = encode_calls(unpooled, img_array, 0)
+    with TurboJPEG(lib.lib_path, use_tj3=False, pool_size=1) as jpeg:
+        for _ in range(2):
+            encode_calls(jpeg, img_array, flags)
+            assert encode_calls(jpeg, img_array, 0) == expected
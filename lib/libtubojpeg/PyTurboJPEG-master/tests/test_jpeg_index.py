@@ -0,0 +1,68 @@
+# -*- coding: UTF-8 -*-
+#
+# Tests of JPEGIndex.parse: its header has to match decode_header, and the
+# crop paths have to return the same data with and without an index.
+
+from struct import pack
+
+import pytest
+
+from conftest import synthetic_image
+from turbojpeg import (TJFLAG_PROGRESSIVE, TJSAMP_420, TJSAMP_422, TJSAMP_440, TJSAMP_444,
+                       TJSAMP_GRAY, JPEGIndex)
+
+SUBSAMPLES = [TJSAMP_444, TJSAMP_422, TJSAMP_420, TJSAMP_440, TJSAMP_GRAY]
+WIDTH, HEIGHT = 203, 101
+
+
+@pytest.mark.parametrize('subsample', SUBSAMPLES)
+@pytest.mark.parametrize('flags', [0, TJFLAG_PROGRESSIVE])
+def test_header_matches_decode_header(jpeg, subsample, flags):
+    jpeg_buf = jpeg.encode(synthetic_image(WIDTH, HEIGHT), jpeg_subsample=subsample, flags=flags)
+    index = JPEGIndex.parse(jpeg_buf)
+    assert index.header == jpeg.decode_header(jpeg_buf)
+    assert (index.width, index.height, index.precision) == (WIDTH, HEIGHT, 8)
+    assert index.progressive == bool(flags)
+    assert index.restart_interval == 0
+    assert jpeg_buf[index.sos_offset:index.sos_offset + 2] == b'\xff\xda'
+    assert len(index.components) == (1 if subsample == TJSAMP_GRAY else 3)
+
+
+@pytest.mark.parametrize('quality, luma_dc, chroma_dc', [(50, 16, 17), (100, 1, 1)])
+def test_dc_quant(jpeg, quality, luma_dc, chroma_dc):
+    # the DC elements of the standard tables, scaled like libjpeg does
+    index = JPEGIndex.parse(jpeg.encode(synthetic_image(WIDTH, HEIGHT), quality))
+    assert index.dc_quant(0) == luma_dc
+    assert index.dc_quant(1) == index.dc_quant(2) == chroma_dc
+    assert [int(index.quant_tables[table_id][0]) for table_id in (0, 1)] == [luma_dc, chroma_dc]
+
+
+def test_restart_interval(jpeg):
+    jpeg_buf = jpeg.encode(synthetic_image(WIDTH, HEIGHT))
+    sos_offset = JPEGIndex.parse(jpeg_buf).sos_offset
+    dri = b'\xff\xdd' + pack('>HH', 4, 7)
+    index = JPEGIndex.parse(jpeg_buf[:sos_offset] + dri + jpeg_buf[sos_offset:])
+    assert index.restart_interval == 7
+    assert index.sos_offset == sos_offset + len(dri)
+
+
+@pytest.mark.parametrize('bad_buf, message', [
+    (b'\x00\x01\x02\x03', 'missing SOI'),
+    (b'\xff\xd8\x00\x00', 'Invalid JPEG marker'),
+    (b'\xff\xd8\xff\xdb\x00\x43\x00', 'Truncated'),
+    (b'\xff\xd8\xff\xd9', 'No SOF'),
+])
+def test_invalid_buffers(bad_buf, message):
+    with pytest.raises(ValueError, match=message):
+        JPEGIndex.parse(bad_buf)
+
+
+@pytest.mark.parametrize('subsample', SUBSAMPLES)
+def test_crop_with_index(jpeg, subsample):
+    jpeg_buf = jpeg.encode(synthetic_image(WIDTH, HEIGHT), jpeg_subsample=subsample)
+    index = JPEGIndex.parse(jpeg_buf)
+    assert jpeg.crop(jpeg_buf, 16, 16, 64, 32, jpeg_index=index) == jpeg.crop(jpeg_buf, 16, 16, 64, 32)
+    # the last one extends the image with background
+    crop_parameters = [(0, 0, 48, 48), (160, 80, 43, 21), (0, 0, 300, 200)]
+    assert jpeg.crop_multiple(jpeg_buf, crop_parameters, jpeg_index=index) == \
+        jpeg.crop_multiple(jpeg_buf, crop_parameters)
@@ -0,0 +1,88 @@
+# -*- coding: UTF-8 -*-
+#
+# Tests of MJPEGSplitter, iter_mjpeg and decode_stream: a concatenated stream
+# fed in chunks of any size has to split into the original JPEG images.
+
+import io
+from struct import pack
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_image
+from turbojpeg import FrameRing, MJPEGSplitter, iter_mjpeg
+
+CHUNK_SIZES = [1, 7, 4096, 1 << 20]
+
+
+@pytest.fixture
+def frames(jpeg):
+    """JPEG images of different sizes, the second one carrying a JPEG
+       thumbnail in an APP1 segment like EXIF does"""
+    frames = [jpeg.encode(np.roll(synthetic_image(96, 64), i * 9, axis=1)) for i in range(4)]
+    frames.append(jpeg.encode(synthetic_image(203, 101)))
+    thumbnail = jpeg.encode(synthetic_image(16, 16))
+    app1 = b'\xff\xe1' + pack('>H', len(thumbnail) + 8) + b'Exif\x00\x00' + thumbnail
+    frames[1] = frames[1][:2] + app1 + frames[1][2:]
+    return frames
+
+
+def split(data, chunk_size, **kwargs):
+    splitter = MJPEGSplitter(**kwargs)
+    result = []
+    for offset in range(0, len(data), chunk_size):
+        result.extend(splitter.feed(data[offset:offset + chunk_size]))
+    return result
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_split_concatenated(frames, chunk_size):
+    assert split(b''.join(frames), chunk_size) == frames
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_bytes_between_images_are_dropped(frames, chunk_size):
+    data = b'garbage\xff' + b'\x00\xff\xff\xd9'.join(frames) + b'\xff\xd8\xff'
+    assert split(data, chunk_size) == frames
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_truncated_image_is_dropped(frames, chunk_size):
+    truncated = frames[0][:len(frames[0]) * 2 // 3]
+    assert split(truncated + b''.join(frames[1:]), chunk_size) == frames[1:]
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_max_frame_size(frames, chunk_size):
+    max_frame_size = max(len(frame) for frame in frames[:4])
+    assert len(frames[4]) > max_frame_size
+    data = b''.join(frames[3:] + frames[:3])
+    assert split(data, chunk_size, max_frame_size=max_frame_size) == frames[3:4] + frames[:3]
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_iter_mjpeg(frames, chunk_size):
+    assert list(iter_mjpeg(io.BytesIO(b''.join(frames)), chunk_size)) == frames
+
+
+@pytest.mark.parametrize('skip, every_nth', [(0, 1), (1, 2), (2, 3), (5, 1)])
+def test_decode_stream_matches_decode(jpeg, frames, skip, every_nth):
+    stream = io.BytesIO(b''.join(frames))
+    images = list(jpeg.decode_stream(stream, every_nth, skip, chunk_size=1000))
+    expected = [jpeg.decode(frame) for frame in frames[skip::every_nth]]
+    assert len(images) == len(expected)
+    for img_array, expected_array in zip(images, expected):
+        np.testing.assert_array_equal(img_array, expected_array)
+
+
+def test_decode_stream_into_frame_ring(jpeg, frames):
+    ring = FrameRing(2)
+    stream = io.BytesIO(b''.join(frames[:4]))
+    for img_array, frame in zip(jpeg.decode_stream(stream, out=ring), frames[:4]):
+        np.testing.assert_array_equal(img_array, jpeg.decode(frame))
+    assert ring.acquire((64, 96, 3)) is not ring.acquire((64, 96, 3))
+
+
+def test_decode_stream_every_nth(jpeg):
+    with pytest.raises(ValueError):
+        next(jpeg.decode_stream(io.BytesIO(b''), every_nth=0))
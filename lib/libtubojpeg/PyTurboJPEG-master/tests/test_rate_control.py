@@ -0,0 +1,51 @@
+# -*- coding: UTF-8 -*-
+#
+# Tests of the byte budget of encode_to_size and RateController.
+
+import pytest
+
+from conftest import synthetic_image
+from turbojpeg import RateController
+
+WIDTH, HEIGHT = 320, 240
+
+
+@pytest.fixture
+def sizes(jpeg):
+    """JPEG size of the test image per quality"""
+    img_array = synthetic_image(WIDTH, HEIGHT)
+    return dict((quality, len(jpeg.encode(img_array, quality))) for quality in range(5, 96))
+
+
+@pytest.mark.parametrize('start', [5, 50, 85, 95])
+def test_encode_to_size_fits_budget(jpeg, sizes, start):
+    img_array = synthetic_image(WIDTH, HEIGHT)
+    for target_bytes in range(sizes[5], sizes[95] + 1, (sizes[95] - sizes[5]) // 40):
+        jpeg_buf, quality = jpeg.encode_to_size(img_array, target_bytes, start)
+        assert len(jpeg_buf) == sizes[quality] <= target_bytes
+
+
+@pytest.mark.parametrize('start', [5, 50, 85, 95])
+def test_encode_to_size_returns_largest_fit(jpeg, sizes, start):
+    img_array = synthetic_image(WIDTH, HEIGHT)
+    for target_bytes in range(sizes[5], sizes[95] + 1, (sizes[95] - sizes[5]) // 40):
+        _, quality = jpeg.encode_to_size(img_array, target_bytes, start, tolerance=0)
+        assert quality == max(q for q, size in sizes.items() if size <= target_bytes)
+
+
+def test_encode_to_size_over_budget_only_at_min_quality(jpeg, sizes):
+    img_array = synthetic_image(WIDTH, HEIGHT)
+    jpeg_buf, quality = jpeg.encode_to_size(img_array, sizes[5] - 1, max_trials=2)
+    assert (quality, len(jpeg_buf)) == (5, sizes[5])
+    jpeg_buf, quality = jpeg.encode_to_size(img_array, sizes[5], max_trials=2)
+    assert (quality, len(jpeg_buf)) == (5, sizes[5])
+
+
+def test_rate_controller_fits_budget(jpeg, sizes):
+    img_array = synthetic_image(WIDTH, HEIGHT)
+    target_bytes = (sizes[10] + sizes[15]) // 2
+    controller = RateController(jpeg, target_bytes)
+    for _ in range(3):
+        jpeg_buf = controller.encode(img_array)
+        assert controller.last_size == len(jpeg_buf) <= target_bytes
+        assert 5 <= controller.quality < 15
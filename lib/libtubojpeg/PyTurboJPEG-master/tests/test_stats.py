@@ -0,0 +1,114 @@
+# -*- coding: UTF-8 -*-
+#
+# Tests of enable_stats and stats: the counters have to match the calls made,
+# and collecting them must not change any result.
+
+import warnings
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_image
+
+WIDTH, HEIGHT = 203, 101
+
+
+@pytest.fixture
+def img_array():
+    return synthetic_image(WIDTH, HEIGHT)
+
+
+@pytest.fixture
+def jpeg_buf(jpeg, img_array):
+    return jpeg.encode(img_array)
+
+
+def test_disabled(jpeg, jpeg_buf):
+    jpeg.decode(jpeg_buf)
+    stats = jpeg.stats()
+    assert not stats['enabled']
+    assert stats['methods'] == {} and stats['warnings'] == 0
+    assert 'decode' not in vars(jpeg)
+
+
+def test_counts_calls_and_bytes(jpeg, img_array, jpeg_buf):
+    expected = jpeg.decode(jpeg_buf)
+    jpeg.enable_stats()
+    for _ in range(2):
+        np.testing.assert_array_equal(jpeg.decode(jpeg_buf), expected)
+    assert jpeg.encode(img_array) == jpeg_buf
+    methods = jpeg.stats()['methods']
+    decode = methods['decode']
+    assert (decode['calls'], decode['errors']) == (2, 0)
+    assert decode['bytes_in'] == 2 * len(jpeg_buf)
+    assert decode['bytes_out'] == 2 * expected.nbytes
+    assert sum(decode['histogram']) == 2
+    assert 0 < decode['c_time'] <= decode['wall_time']
+    assert decode['python_time'] == pytest.approx(decode['wall_time'] - decode['c_time'])
+    encode = methods['encode']
+    assert (encode['calls'], encode['bytes_in'], encode['bytes_out']) == \
+        (1, img_array.nbytes, len(jpeg_buf))
+
+
+def test_nested_calls(jpeg, jpeg_buf):
+    jpeg.enable_stats()
+    jpeg.decode(jpeg_buf)
+    methods = jpeg.stats()['methods']
+    # decode runs decode_into, the library time counts towards both
+    assert methods['decode_into']['calls'] == 1
+    assert methods['decode_into']['c_time'] <= methods['decode']['c_time'] + 1e-9
+
+
+def test_errors_and_warnings(jpeg, jpeg_buf):
+    jpeg.enable_stats()
+    with pytest.raises(IOError):
+        jpeg.decode(b'\xff\xd8 not a jpeg')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        jpeg.decode(jpeg_buf[:len(jpeg_buf) // 2])
+    stats = jpeg.stats()
+    assert (stats['methods']['decode']['calls'], stats['methods']['decode']['errors']) == (2, 1)
+    assert stats['warnings'] >= 1
+
+
+def test_callback(jpeg, jpeg_buf):
+    records = []
+    jpeg.enable_stats(records.append)
+    jpeg.decode_header(jpeg_buf)
+    assert [record['method'] for record in records] == ['decode_header']
+    assert set(records[0]) == {
+        'method', 'wall_time', 'c_time', 'python_time', 'bytes_in', 'bytes_out', 'error'}
+    assert records[0]['error'] is None
+
+    def failing_callback(record):
+        raise RuntimeError('metrics down')
+
+    jpeg.enable_stats(failing_callback)
+    with pytest.warns(UserWarning, match='metrics down'):
+        assert jpeg.decode_header(jpeg_buf) == jpeg.decode_header.__wrapped__(jpeg_buf)
+
+
+def test_reset(jpeg, jpeg_buf):
+    jpeg.enable_stats()
+    jpeg.decode(jpeg_buf)
+    assert jpeg.stats(reset=True)['methods']['decode']['calls'] == 1
+    stats = jpeg.stats()
+    assert stats['methods'] == {} and stats['enabled']
+    assert not any(stats['handles_created'].values())
+
+
+def test_handles_created(jpeg, jpeg_buf):
+    jpeg.stats(reset=True)
+    for _ in range(3):
+        jpeg.decode(jpeg_buf)
+    created = jpeg.stats()['handles_created']
+    assert created['tj3_decompress' if jpeg.backend == 'tj3' else 'decompress'] == 1
+
+
+def test_disable(jpeg, jpeg_buf):
+    expected = jpeg.decode(jpeg_buf)
+    jpeg.enable_stats()
+    jpeg.disable_stats()
+    assert 'decode' not in vars(jpeg)
+    np.testing.assert_array_equal(jpeg.decode(jpeg_buf), expected)
+    assert jpeg.stats()['methods'] == {} and not jpeg.stats()['enabled']
@@ -0,0 +1,64 @@
+# -*- coding: UTF-8 -*-
+#
+# Tests of scale_with_quality and thumbnails: a transcode has to equal decoding
+# to YUV planes and encoding them, and thumbnails derived from a larger scale
+# have to stay close to transcoding at their own scale.
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_image
+from turbojpeg import TJSAMP_420, TJSAMP_422, TJSAMP_440, TJSAMP_444, TJSAMP_GRAY
+
+SUBSAMPLES = [TJSAMP_444, TJSAMP_422, TJSAMP_420, TJSAMP_440, TJSAMP_GRAY]
+WIDTH, HEIGHT = 203, 101
+
+
+@pytest.fixture(params=SUBSAMPLES)
+def jpeg_buf(request, jpeg):
+    return jpeg.encode(synthetic_image(WIDTH, HEIGHT), 95, jpeg_subsample=request.param)
+
+
+def transcode_reference(jpeg, jpeg_buf, scaling_factor, quality):
+    """decodes to yuv planes and encodes them, like the transcode does"""
+    width, height, subsample, _ = jpeg.decode_header(jpeg_buf)
+    if scaling_factor is not None:
+        num, denom = scaling_factor
+        width, height = -(-width * num // denom), -(-height * num // denom)
+    planes = jpeg.decode_to_yuv_planes(jpeg_buf, scaling_factor)
+    return jpeg.encode_from_yuv_planes(planes, height, width, quality, subsample)
+
+
+@pytest.mark.parametrize('scaling_factor', [None, (1, 2), (3, 8), (1, 8)])
+def test_scale_with_quality(jpeg, jpeg_buf, scaling_factor):
+    scaled = jpeg.scale_with_quality(jpeg_buf, scaling_factor, quality=70)
+    assert scaled == transcode_reference(jpeg, jpeg_buf, scaling_factor, 70)
+    expected = jpeg.decode(jpeg_buf, scaling_factor=scaling_factor)
+    assert jpeg.decode(scaled).shape == expected.shape
+    assert jpeg.decode_header(scaled)[2] == jpeg.decode_header(jpeg_buf)[2]
+
+
+def test_thumbnails(jpeg, jpeg_buf):
+    # 1/4 and 1/8 are derived from the YUV planes of the 1/2 scale
+    sizes = [(50, 25), (110, 60), (26, 13), (80, 80)]
+    thumbnails = jpeg.thumbnails(jpeg_buf, sizes, quality=90)
+    assert len(thumbnails) == len(sizes)
+    for size, thumbnail in zip(sizes, thumbnails):
+        scaling_factor = jpeg.choose_scaling_factor(WIDTH, HEIGHT, max_size=size)
+        expected = jpeg.scale_with_quality(jpeg_buf, scaling_factor, 90)
+        if scaling_factor == (1, 2):
+            # decoded at its own scale
+            assert thumbnail == expected
+        for img_array, expected_array in zip(jpeg.decode_to_yuv_planes(thumbnail),
+                                             jpeg.decode_to_yuv_planes(expected)):
+            assert img_array.shape == expected_array.shape
+            diff = np.abs(img_array.astype(np.int16) - expected_array.astype(np.int16))
+            assert diff.mean() < 4
+        img_array = jpeg.decode(thumbnail)
+        assert img_array.shape == jpeg.decode(jpeg_buf, scaling_factor=scaling_factor).shape
+        assert img_array.shape[1] <= size[0] and img_array.shape[0] <= size[1]
+
+
+def test_thumbnails_same_size_twice(jpeg, jpeg_buf):
+    first, second = jpeg.thumbnails(jpeg_buf, [(60, 30), (60, 30)])
+    assert first == second == jpeg.scale_with_quality(jpeg_buf, (1, 4))
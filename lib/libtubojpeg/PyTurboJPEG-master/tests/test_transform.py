@@ -0,0 +1,80 @@
+# -*- coding: UTF-8 -*-
+#
+# Tests of transform and transform_batch: a lossless transform has to decode
+# to the rotated or flipped image, and one call with several ops has to
+# return what separate calls do.
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_image
+from turbojpeg import (TJSAMP_420, TJSAMP_422, TJSAMP_444, TJSAMP_GRAY, TJXOP_HFLIP, TJXOP_NONE,
+                       TJXOP_ROT90, TJXOP_ROT180, TJXOP_ROT270, TJXOP_TRANSPOSE, TJXOP_TRANSVERSE,
+                       TJXOP_VFLIP, TJXOPT_GRAY, TJXOPT_PERFECT, TJXOPT_TRIM, TransformOp)
+
+SUBSAMPLES = [TJSAMP_444, TJSAMP_422, TJSAMP_420, TJSAMP_GRAY]
+# the pixel operation each transform applies
+PIXEL_OPS = {
+    TJXOP_NONE: lambda a: a,
+    TJXOP_HFLIP: lambda a: a[:, ::-1],
+    TJXOP_VFLIP: lambda a: a[::-1],
+    TJXOP_TRANSPOSE: lambda a: a.transpose(1, 0, 2),
+    TJXOP_TRANSVERSE: lambda a: a[::-1, ::-1].transpose(1, 0, 2),
+    TJXOP_ROT90: lambda a: np.rot90(a, -1),
+    TJXOP_ROT180: lambda a: a[::-1, ::-1],
+    TJXOP_ROT270: lambda a: np.rot90(a),
+}
+
+
+@pytest.mark.parametrize('subsample', SUBSAMPLES)
+def test_transform_matches_pixel_ops(jpeg, subsample):
+    # MCU-aligned, so every transform is perfect
+    jpeg_buf = jpeg.encode(synthetic_image(64, 48), jpeg_subsample=subsample)
+    img_array = jpeg.decode(jpeg_buf).astype(np.int16)
+    ops = [TransformOp(op, TJXOPT_PERFECT) for op in PIXEL_OPS]
+    for transformed, pixel_op in zip(jpeg.transform(jpeg_buf, ops), PIXEL_OPS.values()):
+        expected = pixel_op(img_array)
+        # only the rounding of the inverse DCT differs
+        assert np.abs(jpeg.decode(transformed) - expected).max() <= 3
+
+
+@pytest.mark.parametrize('subsample', SUBSAMPLES)
+def test_multiple_ops_match_single_calls(jpeg, subsample):
+    jpeg_buf = jpeg.encode(synthetic_image(203, 101), jpeg_subsample=subsample)
+    ops = [TJXOP_ROT90, TransformOp(TJXOP_HFLIP, TJXOPT_TRIM), TransformOp(TJXOP_ROT180, TJXOPT_GRAY),
+           TransformOp(TJXOP_NONE, region=(16, 16, 64, 32))]
+    assert jpeg.transform(jpeg_buf, ops) == [jpeg.transform(jpeg_buf, [op])[0] for op in ops]
+    assert jpeg.transform(jpeg_buf, ops[3:]) == [jpeg.crop(jpeg_buf, 16, 16, 64, 32)]
+    assert jpeg.transform(jpeg_buf, []) == []
+
+
+def test_trim(jpeg):
+    jpeg_buf = jpeg.encode(synthetic_image(203, 101), jpeg_subsample=TJSAMP_420)
+    with pytest.raises(IOError):
+        jpeg.transform(jpeg_buf, [TransformOp(TJXOP_ROT90, TJXOPT_PERFECT)])
+    rotated, = jpeg.transform(jpeg_buf, [TransformOp(TJXOP_ROT90, TJXOPT_TRIM)])
+    # the partial MCU row at the bottom edge, which would become the left
+    # edge, is dropped
+    assert jpeg.decode_header(rotated)[:2] == (96, 203)
+
+
+def test_transform_batch(jpeg):
+    jpeg_bufs = [jpeg.encode(synthetic_image(64 + 16 * i, 48), jpeg_subsample=TJSAMP_422)
+                 for i in range(4)]
+    jpeg_bufs.insert(2, b'\xff\xd8 not a jpeg')
+    ops = [TJXOP_ROT270, TransformOp(TJXOP_VFLIP, TJXOPT_GRAY)]
+    results = jpeg.transform_batch(jpeg_bufs, ops)
+    assert isinstance(results[2], IOError)
+    for jpeg_buf, result in zip(jpeg_bufs[:2] + jpeg_bufs[3:], results[:2] + results[3:]):
+        assert result == jpeg.transform(jpeg_buf, ops)
+
+
+@pytest.mark.parametrize('bad_buf', [b'\xff\xd8 not a jpeg', b'\xff\xd8\xff\xd9'])
+def test_no_image(jpeg, bad_buf):
+    with pytest.raises(IOError, match='no image'):
+        jpeg.transform(bad_buf, [TJXOP_ROT90])
+
+
+def test_invalid_op():
+    with pytest.raises(ValueError):
+        TransformOp(TJXOP_ROT270 + 1)
@@ -0,0 +1,77 @@
+# -*- coding: UTF-8 -*-
+#
+# Tests of the planar YUV path: encoding decoded YUV planes has to give the
+# same JPEG data as encoding the packed YUV buffer, for any row padding.
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_image
+from turbojpeg import TJSAMP_420, TJSAMP_422, TJSAMP_440, TJSAMP_444, TJSAMP_GRAY, FrameRing
+
+SUBSAMPLES = [TJSAMP_444, TJSAMP_422, TJSAMP_420, TJSAMP_440, TJSAMP_GRAY]
+WIDTH, HEIGHT = 203, 101
+
+
+@pytest.fixture(params=SUBSAMPLES)
+def subsample(request):
+    return request.param
+
+
+@pytest.fixture
+def jpeg_buf(jpeg, subsample):
+    return jpeg.encode(synthetic_image(WIDTH, HEIGHT), 95, jpeg_subsample=subsample)
+
+
+@pytest.mark.parametrize('pad', [1, 2, 4, 8])
+def test_encode_from_yuv_pad(jpeg, jpeg_buf, subsample, pad):
+    expected = jpeg.encode_from_yuv(
+        jpeg.decode_to_yuv(jpeg_buf)[0], HEIGHT, WIDTH, 80, subsample)
+    yuv_array, plane_sizes = jpeg.decode_to_yuv(jpeg_buf, pad=pad)
+    assert plane_sizes[0] == (HEIGHT, WIDTH)
+    assert jpeg.encode_from_yuv(yuv_array, HEIGHT, WIDTH, 80, subsample, pad=pad) == expected
+
+
+def test_encode_from_yuv_pad_mismatch(jpeg, jpeg_buf, subsample):
+    yuv_array, _ = jpeg.decode_to_yuv(jpeg_buf, pad=1)
+    with pytest.raises(ValueError, match='pad 8'):
+        jpeg.encode_from_yuv(yuv_array, HEIGHT, WIDTH, 80, subsample, pad=8)
+
+
+@pytest.mark.parametrize('scaling_factor', [None, (1, 2), (3, 8)])
+def test_encode_from_yuv_planes(jpeg, jpeg_buf, subsample, scaling_factor):
+    width, height = WIDTH, HEIGHT
+    if scaling_factor is not None:
+        num, denom = scaling_factor
+        width, height = -(-width * num // denom), -(-height * num // denom)
+    yuv_array, _ = jpeg.decode_to_yuv(jpeg_buf, scaling_factor, pad=1)
+    expected = jpeg.encode_from_yuv(yuv_array, height, width, 80, subsample, pad=1)
+    planes = jpeg.decode_to_yuv_planes(jpeg_buf, scaling_factor)
+    assert len(planes) == (1 if subsample == TJSAMP_GRAY else 3)
+    assert jpeg.encode_from_yuv_planes(planes, height, width, 80, subsample) == expected
+    # padded rows
+    padded = jpeg.decode_to_yuv_planes(jpeg_buf, scaling_factor, strides=(width + 40,) * 3)
+    assert padded[0].strides[0] == width + 40
+    assert jpeg.encode_from_yuv_planes(padded, height, width, 80, subsample) == expected
+    ring = FrameRing(3)
+    into = jpeg.decode_to_yuv_planes_into(jpeg_buf, ring, scaling_factor)
+    assert jpeg.encode_from_yuv_planes(into, height, width, 80, subsample) == expected
+
+
+def test_planes_round_trip(jpeg, jpeg_buf, subsample):
+    planes = jpeg.decode_to_yuv_planes(jpeg_buf)
+    round_trip = jpeg.encode_from_yuv_planes(planes, HEIGHT, WIDTH, 100, subsample)
+    assert jpeg.decode_header(round_trip)[:3] == (WIDTH, HEIGHT, subsample)
+    for plane, expected in zip(jpeg.decode_to_yuv_planes(round_trip), planes):
+        assert np.abs(plane.astype(np.int16) - expected).max() <= 2
+
+
+def test_encode_from_yuv_planes_rejects_wrong_planes(jpeg, jpeg_buf, subsample):
+    planes = jpeg.decode_to_yuv_planes(jpeg_buf)
+    with pytest.raises(ValueError, match='planes'):
+        jpeg.encode_from_yuv_planes(planes + [planes[0]], HEIGHT, WIDTH, 80, subsample)
+    with pytest.raises(ValueError, match='shape'):
+        jpeg.encode_from_yuv_planes(planes, HEIGHT + 16, WIDTH, 80, subsample)
+    with pytest.raises(ValueError, match='contiguous'):
+        jpeg.encode_from_yuv_planes(
+            [np.asfortranarray(plane) for plane in planes], HEIGHT, WIDTH, 80, subsample)
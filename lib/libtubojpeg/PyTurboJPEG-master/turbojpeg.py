@@ -32,7 +32,16 @@ import numpy as np
 import math
 import warnings
 import os
-from struct import unpack, calcsize
+import threading
+import functools
+import time
+import asyncio
+import hashlib
+import bisect
+from collections import OrderedDict
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor
+from struct import unpack_from
 
 # default libTurboJPEG library path
 DEFAULT_LIB_PATHS = {
@@ -57,6 +66,10 @@ DEFAULT_LIB_PATHS = {
     'Windows': ['C:/libjpeg-turbo64/bin/turbojpeg.dll']
 }
 
+# environment variable holding the libTurboJPEG library path, which skips the
+# library search when set
+LIB_PATH_ENV = 'TURBOJPEG_LIB_PATH'
+
 # error codes
 # see details in https://github.com/libjpeg-turbo/libjpeg-turbo/blob/master/turbojpeg.h
 TJERR_WARNING = 0
@@ -87,6 +100,7 @@ TJPF_CMYK = 11
 
 # chrominance subsampling options
 # see details in https://github.com/libjpeg-turbo/libjpeg-turbo/blob/master/turbojpeg.h
+TJSAMP_UNKNOWN = -1
 TJSAMP_444 = 0
 TJSAMP_422 = 1
 TJSAMP_420 = 2
@@ -139,15 +153,47 @@ tjMCUHeight = [8, 8, 16, 8, 16, 8]
 
 # miscellaneous flags
 # see details in https://github.com/libjpeg-turbo/libjpeg-turbo/blob/master/turbojpeg.h
-# note: TJFLAG_NOREALLOC cannot be supported due to reallocation is needed by PyTurboJPEG.
+# note: TJFLAG_NOREALLOC is only honored by the *_into encoders, which write into a
+# caller-provided buffer of buffer_size() bytes.
 TJFLAG_BOTTOMUP = 2
 TJFLAG_FASTUPSAMPLE = 256
+TJFLAG_NOREALLOC = 1024
 TJFLAG_FASTDCT = 2048
 TJFLAG_ACCURATEDCT = 4096
 TJFLAG_STOPONWARNING = 8192
 TJFLAG_PROGRESSIVE = 16384
 TJFLAG_LIMITSCANS = 32768
 
+# handle types of the libjpeg-turbo 3.x (tj3*) API
+# see details in https://github.com/libjpeg-turbo/libjpeg-turbo/blob/main/turbojpeg.h
+TJINIT_COMPRESS = 0
+TJINIT_DECOMPRESS = 1
+TJINIT_TRANSFORM = 2
+
+# handle parameters of the libjpeg-turbo 3.x (tj3*) API
+# see details in https://github.com/libjpeg-turbo/libjpeg-turbo/blob/main/turbojpeg.h
+TJPARAM_STOPONWARNING = 0
+TJPARAM_BOTTOMUP = 1
+TJPARAM_NOREALLOC = 2
+TJPARAM_QUALITY = 3
+TJPARAM_SUBSAMP = 4
+TJPARAM_JPEGWIDTH = 5
+TJPARAM_JPEGHEIGHT = 6
+TJPARAM_PRECISION = 7
+TJPARAM_COLORSPACE = 8
+TJPARAM_FASTUPSAMPLE = 9
+TJPARAM_FASTDCT = 10
+TJPARAM_OPTIMIZE = 11
+TJPARAM_PROGRESSIVE = 12
+TJPARAM_SCANLIMIT = 13
+TJPARAM_ARITHMETIC = 14
+TJPARAM_LOSSLESS = 15
+TJPARAM_LOSSLESSPSV = 16
+TJPARAM_LOSSLESSPT = 17
+
+# scan limit applied for TJFLAG_LIMITSCANS, as in the legacy API
+TJ_SCAN_LIMIT = 500
+
 class CroppingRegion(Structure):
     _fields_ = [("x", c_int), ("y", c_int), ("w", c_int), ("h", c_int)]
 
@@ -259,12 +305,11 @@ def fill_background(coeffs_ptr, arrayRegion, planeRegion, componentID, transform
             min(arrayRegion.y+arrayRegion.h, background_data.h)
             - arrayRegion.y
         )
-        for x in range(background_data.w//MCU_WIDTH, planeRegion.w//MCU_WIDTH):
-            for y in range(
-                left_start_row//MCU_HEIGHT,
-                left_end_row//MCU_HEIGHT
-            ):
-                coeffs[y][x][0] = background_data.lum
+        coeffs[
+            left_start_row//MCU_HEIGHT:left_end_row//MCU_HEIGHT,
+            background_data.w//MCU_WIDTH:planeRegion.w//MCU_WIDTH,
+            0
+        ] = background_data.lum
 
         # fill mcus under image
         bottom_start_row = (
@@ -274,12 +319,11 @@ def fill_background(coeffs_ptr, arrayRegion, planeRegion, componentID, transform
             max(arrayRegion.y+arrayRegion.h, background_data.h)
             - arrayRegion.y
         )
-        for x in range(0, planeRegion.w//MCU_WIDTH):
-            for y in range(
-                bottom_start_row//MCU_HEIGHT,
-                bottom_end_row//MCU_HEIGHT
-            ):
-                coeffs[y][x][0] = background_data.lum
+        coeffs[
+            bottom_start_row//MCU_HEIGHT:bottom_end_row//MCU_HEIGHT,
+            0:planeRegion.w//MCU_WIDTH,
+            0
+        ] = background_data.lum
 
     return 1
 
@@ -291,151 +335,1422 @@ def split_byte_into_nibbles(value):
     return first, second
 
 
-class TurboJPEG(object):
-    """A Python wrapper of libjpeg-turbo for decoding and encoding JPEG image."""
-    def __init__(self, lib_path=None):
-        turbo_jpeg = cdll.LoadLibrary(
-            self.__find_turbojpeg() if lib_path is None else lib_path)
-        self.__init_decompress = turbo_jpeg.tjInitDecompress
-        self.__init_decompress.restype = c_void_p
-        self.__buffer_size = turbo_jpeg.tjBufSize
-        self.__buffer_size.argtypes = [c_int, c_int, c_int]
-        self.__buffer_size.restype = c_ulong
-        self.__init_compress = turbo_jpeg.tjInitCompress
-        self.__init_compress.restype = c_void_p
-        self.__buffer_size_YUV2 = turbo_jpeg.tjBufSizeYUV2
-        self.__buffer_size_YUV2.argtypes = [c_int, c_int, c_int, c_int]
-        self.__buffer_size_YUV2.restype = c_ulong
-        self.__plane_width = turbo_jpeg.tjPlaneWidth
-        self.__plane_width.argtypes = [c_int, c_int, c_int]
-        self.__plane_width.restype = c_int
-        self.__plane_height = turbo_jpeg.tjPlaneHeight
-        self.__plane_height.argtypes = [c_int, c_int, c_int]
-        self.__plane_height.restype = c_int
-        self.__destroy = turbo_jpeg.tjDestroy
-        self.__destroy.argtypes = [c_void_p]
-        self.__destroy.restype = c_int
-        self.__decompress_header = turbo_jpeg.tjDecompressHeader3
-        self.__decompress_header.argtypes = [
+class TransformOp(object):
+    """A lossless transform applied by TurboJPEG.transform.
+
+    Parameters
+    ----------
+    op: int
+        TJXOP_* operation, e.g. TJXOP_ROT90.
+    options: int
+        TJXOPT_* options, e.g. TJXOPT_TRIM | TJXOPT_GRAY.
+    region: Optional[Tuple[int, int, int, int]]
+        (x, y, w, h) crop of the transformed image, implies TJXOPT_CROP.
+        x and y must be multiples of the MCU size.
+    """
+    __slots__ = ('op', 'options', 'region')
+
+    def __init__(self, op=TJXOP_NONE, options=0, region=None):
+        if not TJXOP_NONE <= op <= TJXOP_ROT270:
+            raise ValueError('unknown transform operation {}'.format(op))
+        self.op = op
+        self.options = options
+        self.region = region
+
+    def __repr__(self):
+        return 'TransformOp(op={}, options={}, region={})'.format(
+            self.op, self.options, self.region)
+
+
+class HandlePool(object):
+    """A bounded pool of reusable tjhandles of a single kind.
+
+    A handle is checked out for the duration of one call and returned
+    afterwards, so it is never used by two threads at the same time. At most
+    max_size idle handles are kept; surplus handles are destroyed on release.
+
+    Parameters
+    ----------
+    init_handle: callable
+        Function creating a new handle (e.g. tjInitDecompress).
+    destroy_handle: callable
+        Function destroying a handle (i.e. tjDestroy).
+    max_size: int
+        Maximum number of idle handles kept for reuse.
+    failed_handles: Optional[set]
+        Handles whose last call failed or was marked with discard.
+        libjpeg-turbo handles can stay in a broken state after a fatal error,
+        so these are destroyed on release instead of being reused.
+    handle_key: Optional[callable]
+        Maps a pooled handle to the tjhandle looked up in failed_handles.
+    """
+    def __init__(self, init_handle, destroy_handle, max_size=8, failed_handles=None, handle_key=None):
+        self.__init_handle = init_handle
+        self.__destroy_handle = destroy_handle
+        self.__max_size = max_size
+        self.__failed_handles = failed_handles if failed_handles is not None else set()
+        self.__handle_key = handle_key
+        self.__idle = []
+        self.__lock = threading.Lock()
+        self.__closed = False
+        # number of handles created, reported by TurboJPEG.stats
+        self.created = 0
+
+    def acquire(self):
+        """checks out an idle handle or creates a new one"""
+        with self.__lock:
+            if self.__closed:
+                raise RuntimeError('handle pool is closed')
+            if self.__idle:
+                return self.__idle.pop()
+        return self.create()
+
+    def create(self):
+        """creates a new handle, which is not pooled when passed to destroy"""
+        handle = self.__init_handle()
+        if not handle:
+            raise IOError('unable to initialize tjhandle')
+        with self.__lock:
+            self.created += 1
+        return handle
+
+    def destroy(self, handle):
+        """destroys a handle without returning it to the pool"""
+        self.__failed_handles.discard(self.key(handle))
+        self.__destroy_handle(handle)
+
+    def discard(self, handle):
+        """marks a checked out handle to be destroyed on release, e.g.
+           because the call leaves state behind that a later call would
+           inherit"""
+        self.__failed_handles.add(self.key(handle))
+
+    def key(self, handle):
+        """returns the tjhandle of a pooled handle"""
+        return self.__handle_key(handle) if self.__handle_key else handle
+
+    def release(self, handle):
+        """returns a handle to the pool, destroying it if the pool is full
+           or its last call failed"""
+        key = self.key(handle)
+        if key in self.__failed_handles:
+            self.__failed_handles.discard(key)
+            self.__destroy_handle(handle)
+            return
+        with self.__lock:
+            if not self.__closed and len(self.__idle) < self.__max_size:
+                self.__idle.append(handle)
+                return
+        self.__destroy_handle(handle)
+
+    def close(self):
+        """destroys all idle handles; handles still checked out are
+        destroyed when they are released"""
+        with self.__lock:
+            self.__closed = True
+            idle, self.__idle = self.__idle, []
+        for handle in idle:
+            self.__destroy_handle(handle)
+
+    @property
+    def closed(self):
+        return self.__closed
+
+
+class FrameRing(object):
+    """A fixed set of recycled output arrays for the *_into decoders.
+
+    acquire() hands out the slots in round-robin order and only allocates
+    when a slot is empty or the requested shape changes, so decoding a
+    fixed-resolution stream allocates nothing in steady state. An array is
+    handed out again count acquisitions later; callers must be done with a
+    frame by then.
+
+    Parameters
+    ----------
+    count: int
+        Number of arrays in the ring.
+    """
+    def __init__(self, count=3):
+        if count < 1:
+            raise ValueError('count must be at least 1')
+        self.__slots = [None] * count
+        self.__next = 0
+        self.__lock = threading.Lock()
+
+    def acquire(self, shape):
+        """returns the next uint8 array of the given shape"""
+        shape = tuple(shape)
+        with self.__lock:
+            index = self.__next
+            self.__next = (index + 1) % len(self.__slots)
+            frame = self.__slots[index]
+            if frame is None or frame.shape != shape:
+                frame = np.empty(shape, dtype=np.uint8)
+                self.__slots[index] = frame
+            return frame
+
+
+class JPEGIndex(object):
+    """Index of the JPEG header markers, built by walking the segments from
+    SOI up to the first SOS once, without copying the JPEG data.
+
+    Parsing a buffer once and passing the index to crop, crop_multiple or
+    other callers avoids rescanning the header for each operation.
+
+    Attributes
+    ----------
+    width, height: int
+        Image dimensions from the SOF marker.
+    precision: int
+        Sample precision in bits.
+    components: List[Tuple[int, int, int, int]]
+        (component id, horizontal sampling, vertical sampling, quantization
+        table id) for each component.
+    subsample: int
+        TJSAMP_* value, or TJSAMP_UNKNOWN for unsupported sampling factors.
+    colorspace: int
+        TJCS_* value, derived like libjpeg does from JFIF/Adobe markers and
+        component ids.
+    quant_tables: Dict[int, np.ndarray]
+        Quantization tables by id, in zigzag order.
+    restart_interval: int
+        Restart interval in MCUs from the DRI marker, 0 if none.
+    progressive: bool
+        True if the image uses progressive entropy coding.
+    sos_offset: int
+        Byte offset of the first SOS marker.
+    """
+
+    SOI = 0xD8
+    EOI = 0xD9
+    SOS = 0xDA
+    DQT = 0xDB
+    DRI = 0xDD
+    APP0 = 0xE0
+    APP14 = 0xEE
+    # SOF0-SOF15, except DHT (0xC4), JPG (0xC8) and DAC (0xCC)
+    SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - frozenset((0xC4, 0xC8, 0xCC))
+    PROGRESSIVE_SOF_MARKERS = frozenset((0xC2, 0xC6, 0xCA, 0xCE))
+    # markers without a length field
+    STANDALONE_MARKERS = frozenset(range(0xD0, 0xDA)) | frozenset((0x01,))
+
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        self.precision = 0
+        self.components = []
+        self.subsample = TJSAMP_UNKNOWN
+        self.colorspace = TJCS_YCbCr
+        self.quant_tables = {}
+        self.restart_interval = 0
+        self.progressive = False
+        self.sos_offset = None
+
+    @classmethod
+    def parse(cls, jpeg_buf):
+        """parses the header markers of a JPEG memory buffer"""
+        data = memoryview(jpeg_buf).cast('B')
+        size = len(data)
+        if size < 4 or data[0] != 0xFF or data[1] != cls.SOI:
+            raise ValueError('Not a JPEG image: missing SOI marker')
+        index = cls()
+        jfif = False
+        adobe_transform = None
+        offset = 2
+        while offset < size - 1:
+            if data[offset] != 0xFF:
+                raise ValueError('Invalid JPEG marker at offset {}'.format(offset))
+            marker = data[offset + 1]
+            if marker == 0xFF:
+                # fill byte
+                offset += 1
+                continue
+            if marker in cls.STANDALONE_MARKERS:
+                offset += 2
+                continue
+            if marker == cls.EOI:
+                break
+            if offset + 4 > size:
+                break
+            length = unpack_from('>H', data, offset + 2)[0]
+            segment = offset + 4
+            segment_end = offset + 2 + length
+            if segment_end > size:
+                raise ValueError('Truncated JPEG marker segment at offset {}'.format(offset))
+            if marker == cls.SOS:
+                index.sos_offset = offset
+                break
+            elif marker == cls.DQT:
+                index.__parse_dqt(data, segment, segment_end)
+            elif marker in cls.SOF_MARKERS:
+                index.__parse_sof(data, segment, marker)
+            elif marker == cls.DRI:
+                index.restart_interval = unpack_from('>H', data, segment)[0]
+            elif marker == cls.APP0:
+                jfif = jfif or data[segment:segment + 5] == b'JFIF\x00'
+            elif marker == cls.APP14 and length >= 14 and \
+                    data[segment:segment + 5] == b'Adobe':
+                adobe_transform = data[segment + 11]
+            offset = segment_end
+        if not index.components:
+            raise ValueError('No SOF marker found in JPEG header')
+        index.subsample = index.__get_subsample()
+        index.colorspace = index.__get_colorspace(jfif, adobe_transform)
+        return index
+
+    @classmethod
+    def has_image(cls, jpeg_buf):
+        """returns True if a SOF marker precedes the first SOS or EOI marker
+           of a JPEG memory buffer, False for a tables-only or empty
+           datastream. Unlike parse, garbage between markers is skipped like
+           libjpeg does."""
+        data = memoryview(jpeg_buf).cast('B')
+        size = len(data)
+        if size < 4 or data[0] != 0xFF or data[1] != cls.SOI:
+            return False
+        offset = 2
+        while offset < size - 1:
+            if data[offset] != 0xFF:
+                # resync on the next 0xFF byte
+                following = np.flatnonzero(np.frombuffer(data[offset:], dtype=np.uint8) == 0xFF)
+                if not following.size:
+                    return False
+                offset += int(following[0])
+                continue
+            marker = data[offset + 1]
+            if marker == 0xFF or marker == 0x00:
+                offset += 1
+                continue
+            if marker in cls.SOF_MARKERS:
+                return True
+            if marker == cls.SOS or marker == cls.EOI:
+                return False
+            if marker in cls.STANDALONE_MARKERS:
+                offset += 2
+                continue
+            if offset + 4 > size:
+                return False
+            offset += 2 + unpack_from('>H', data, offset + 2)[0]
+        return False
+
+    @property
+    def header(self):
+        """(width, height, jpeg_subsample, jpeg_colorspace), as returned by
+           TurboJPEG.decode_header"""
+        return self.width, self.height, self.subsample, self.colorspace
+
+    def dc_quant(self, component=0):
+        """returns the dc quantization element used by a component"""
+        table_id = self.components[component][3]
+        if table_id not in self.quant_tables:
+            raise ValueError(
+                "Quantisation table {dqt_index} not found in header".format(
+                    dqt_index=table_id)
+            )
+        return int(self.quant_tables[table_id][0])
+
+    def __parse_dqt(self, data, offset, end):
+        """parses all quantization tables of a DQT segment"""
+        while offset < end:
+            precision, table_id = split_byte_into_nibbles(data[offset])
+            if precision == 0:
+                dtype = np.uint8
+            elif precision == 1:
+                dtype = np.dtype('>u2')
+            else:
+                raise ValueError('Not valid precision definition in dqt')
+            self.quant_tables[table_id] = np.frombuffer(
+                data, dtype=dtype, count=MCU_SIZE, offset=offset + 1).astype(np.uint16)
+            offset += 1 + MCU_SIZE * (precision + 1)
+
+    def __parse_sof(self, data, offset, marker):
+        """parses the frame header of a SOF segment"""
+        self.precision = data[offset]
+        self.height, self.width, num_components = unpack_from('>HHB', data, offset + 1)
+        self.progressive = marker in self.PROGRESSIVE_SOF_MARKERS
+        self.components = []
+        for i in range(num_components):
+            component = offset + 6 + 3 * i
+            h_samp, v_samp = split_byte_into_nibbles(data[component + 1])
+            self.components.append((data[component], h_samp, v_samp, data[component + 2]))
+
+    def __get_subsample(self):
+        """maps the component sampling factors to a TJSAMP_* value"""
+        if len(self.components) == 1:
+            return TJSAMP_GRAY
+        if len(self.components) not in (3, 4):
+            return TJSAMP_UNKNOWN
+        _, h_samp, v_samp, _ = self.components[0]
+        for _, h, v, _ in self.components[1:3]:
+            if (h, v) != (1, 1) and (h, v) != (h_samp, v_samp):
+                return TJSAMP_UNKNOWN
+        if len(self.components) == 4 and self.components[3][1:3] != (h_samp, v_samp):
+            return TJSAMP_UNKNOWN
+        if all(component[1:3] == (h_samp, v_samp) for component in self.components):
+            return TJSAMP_444
+        for samp, (mcu_width, mcu_height) in enumerate(zip(tjMCUWidth, tjMCUHeight)):
+            if samp != TJSAMP_GRAY and \
+                    (h_samp, v_samp) == (mcu_width // MCU_WIDTH, mcu_height // MCU_HEIGHT):
+                if all(component[1:3] == (1, 1) for component in self.components[1:3]):
+                    return samp
+        return TJSAMP_UNKNOWN
+
+    def __get_colorspace(self, jfif, adobe_transform):
+        """guesses the JPEG colorspace the way libjpeg does"""
+        num_components = len(self.components)
+        if num_components == 1:
+            return TJCS_GRAY
+        if num_components == 3:
+            if jfif:
+                return TJCS_YCbCr
+            if adobe_transform is not None:
+                return TJCS_RGB if adobe_transform == 0 else TJCS_YCbCr
+            component_ids = tuple(component[0] for component in self.components)
+            if component_ids == (ord('R'), ord('G'), ord('B')):
+                return TJCS_RGB
+            return TJCS_YCbCr
+        if num_components == 4:
+            return TJCS_YCCK if adobe_transform == 2 else TJCS_CMYK
+        return TJCS_YCbCr
+
+
+class MJPEGSplitter(object):
+    """Incrementally splits a concatenated (MJPEG) byte stream into JPEG images.
+
+    Data is fed in chunks of any size. SOI/EOI boundaries are found by
+    walking the marker segments and scanning only the entropy-coded data
+    for markers, so SOI/EOI bytes inside e.g. EXIF thumbnails do not split
+    an image. Only the image currently being assembled is buffered. Bytes
+    between images are discarded, and an image growing past max_frame_size
+    is dropped and the splitter resynchronizes on the next SOI.
+
+    Parameters
+    ----------
+    max_frame_size: int
+        Maximum size in bytes of a single JPEG image.
+    """
+
+    SEEK_SOI = 0
+    SEGMENTS = 1
+    ENTROPY = 2
+
+    def __init__(self, max_frame_size=64 * 1024 * 1024):
+        self.__max_frame_size = max_frame_size
+        self.__buffer = bytearray()
+        self.__pos = 0
+        self.__state = self.SEEK_SOI
+
+    def feed(self, data):
+        """adds data and returns the list of JPEG images completed by it"""
+        self.__buffer += data
+        frames = []
+        while True:
+            frame = self.__next_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+        if len(self.__buffer) > self.__max_frame_size:
+            self.__resync(1)
+        return frames
+
+    def __next_frame(self):
+        """advances the parser, returning a complete image or None when more
+           data is needed"""
+        buffer = self.__buffer
+        while True:
+            if self.__state == self.SEEK_SOI:
+                soi = buffer.find(b'\xff\xd8', self.__pos)
+                if soi == -1:
+                    # keep a trailing 0xFF that may start the next SOI
+                    del buffer[:max(len(buffer) - 1, 0)]
+                    self.__pos = 0
+                    return None
+                del buffer[:soi]
+                self.__pos = 2
+                self.__state = self.SEGMENTS
+            elif self.__state == self.SEGMENTS:
+                pos = self.__pos
+                if pos + 2 > len(buffer):
+                    return None
+                if buffer[pos] != 0xFF:
+                    self.__resync(1)
+                    continue
+                marker = buffer[pos + 1]
+                if marker == 0xFF:
+                    self.__pos += 1
+                elif marker == JPEGIndex.EOI:
+                    if pos + 2 > self.__max_frame_size:
+                        # completed within one feed, before the size check
+                        self.__resync(pos + 2)
+                        continue
+                    frame = bytes(buffer[:pos + 2])
+                    del buffer[:pos + 2]
+                    self.__pos = 0
+                    self.__state = self.SEEK_SOI
+                    return frame
+                elif marker == JPEGIndex.SOI:
+                    # truncated image followed by a new one
+                    self.__resync(pos)
+                elif marker in JPEGIndex.STANDALONE_MARKERS:
+                    self.__pos += 2
+                else:
+                    if pos + 4 > len(buffer):
+                        return None
+                    self.__pos = pos + 2 + unpack_from('>H', buffer, pos + 2)[0]
+                    if marker == JPEGIndex.SOS:
+                        self.__state = self.ENTROPY
+            else:
+                marker = buffer.find(b'\xff', self.__pos)
+                if marker == -1 or marker + 1 >= len(buffer):
+                    self.__pos = len(buffer) if marker == -1 else marker
+                    return None
+                code = buffer[marker + 1]
+                if code == 0x00 or 0xD0 <= code <= 0xD7:
+                    # stuffed byte or restart marker
+                    self.__pos = marker + 2
+                elif code == 0xFF:
+                    self.__pos = marker + 1
+                else:
+                    self.__pos = marker
+                    self.__state = self.SEGMENTS
+
+    def __resync(self, offset):
+        """drops the current image and searches the next SOI from offset"""
+        del self.__buffer[:offset]
+        self.__pos = 0
+        self.__state = self.SEEK_SOI
+
+
+def iter_mjpeg(stream, chunk_size=65536, max_frame_size=64 * 1024 * 1024):
+    """yields the JPEG images of a concatenated (MJPEG) binary stream, reading
+       it in chunks. stream is any object with a read(size) method, e.g. an
+       open file or socket.makefile('rb')."""
+    splitter = MJPEGSplitter(max_frame_size)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        for frame in splitter.feed(chunk):
+            yield frame
+
+
+class TJ3Handle(object):
+    """A libjpeg-turbo 3.x handle and the parameters last set on it.
+
+    tj3 parameters persist on a handle, so pooled handles only need a
+    tj3Set call when a parameter differs from the previous call.
+    """
+    __slots__ = ('handle', 'params')
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.params = {}
+
+    def key(self):
+        """returns the tjhandle, see HandlePool"""
+        return self.handle
+
+
+def _nbytes(obj):
+    """returns the size in bytes of a buffer, array or list of them"""
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, memoryview):
+        return obj.nbytes
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(item) for item in obj)
+    return 0
+
+
+class TurboJPEGStats(object):
+    """Call statistics collected by TurboJPEG.enable_stats.
+
+    Per public method it counts calls and errors, sums wall time, the part
+    of it spent in libjpeg-turbo calls (c_time) and the rest spent in Python
+    (python_time), keeps a histogram of wall times and sums the bytes of the
+    first argument (bytes_in) and of the result (bytes_out). Time spent in
+    libjpeg-turbo counts towards every method active on the calling thread,
+    e.g. both decode and the decode_into it calls.
+
+    Parameters
+    ----------
+    callback: Optional[callable]
+        Called after every call with a dict of method, wall_time, c_time,
+        python_time, bytes_in, bytes_out and error, e.g. to forward the
+        values to a metrics system.
+    """
+
+    # upper bounds in seconds of the wall time histogram buckets; a last
+    # bucket counts the slower calls
+    HISTOGRAM_BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                        0.025, 0.05, 0.1, 0.25, 1.0)
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__methods = {}
+        self.__warnings = 0
+
+    def wrap_method(self, name, func):
+        """returns func recording its calls as method name"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            frames = self.__frames()
+            frame = [0.0]
+            frames.append(frame)
+            result = error = None
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                return result
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                wall_time = time.perf_counter() - start
+                frames.pop()
+                self.__record(name, wall_time, frame[0],
+                              _nbytes(args[0]) if args else 0, _nbytes(result), error)
+        return wrapper
+
+    def wrap_library_function(self, func):
+        """returns the libjpeg-turbo function func adding its time to the
+           methods active on the calling thread"""
+        def wrapper(*args):
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                elapsed = time.perf_counter() - start
+                for frame in self.__frames():
+                    frame[0] += elapsed
+        return wrapper
+
+    def wrap_report_error(self, report_error):
+        """returns report_error counting the warnings it reports"""
+        def wrapper(handle, error=None):
+            report_error(handle, error)
+            # report_error returns only for warnings and raises otherwise
+            with self.__lock:
+                self.__warnings += 1
+        return wrapper
+
+    def snapshot(self, reset=False):
+        """returns the statistics as a dict, optionally starting over"""
+        with self.__lock:
+            methods = dict(
+                (name, dict(record, histogram=list(record['histogram'])))
+                for name, record in self.__methods.items())
+            warnings_count = self.__warnings
+            if reset:
+                self.__methods = {}
+                self.__warnings = 0
+        return {
+            'methods': methods,
+            'warnings': warnings_count,
+            'histogram_bounds': self.HISTOGRAM_BOUNDS,
+        }
+
+    def __frames(self):
+        """returns the stack of methods active on the calling thread"""
+        frames = getattr(self.__local, 'frames', None)
+        if frames is None:
+            frames = self.__local.frames = []
+        return frames
+
+    def __record(self, name, wall_time, c_time, bytes_in, bytes_out, error):
+        with self.__lock:
+            record = self.__methods.get(name)
+            if record is None:
+                record = self.__methods[name] = {
+                    'calls': 0, 'errors': 0, 'wall_time': 0.0, 'c_time': 0.0,
+                    'python_time': 0.0, 'bytes_in': 0, 'bytes_out': 0,
+                    'histogram': [0] * (len(self.HISTOGRAM_BOUNDS) + 1),
+                }
+            record['calls'] += 1
+            record['errors'] += error is not None
+            record['wall_time'] += wall_time
+            record['c_time'] += c_time
+            record['python_time'] += wall_time - c_time
+            record['bytes_in'] += bytes_in
+            record['bytes_out'] += bytes_out
+            record['histogram'][bisect.bisect_left(self.HISTOGRAM_BOUNDS, wall_time)] += 1
+        callback = self.callback
+        if callback is not None:
+            try:
+                callback({
+                    'method': name, 'wall_time': wall_time, 'c_time': c_time,
+                    'python_time': wall_time - c_time, 'bytes_in': bytes_in,
+                    'bytes_out': bytes_out, 'error': error,
+                })
+            except Exception as e:
+                warnings.warn('stats callback failed: {!r}'.format(e))
+
+
+class TurboJPEGLibrary(object):
+    """ctypes bindings of a libturbojpeg library.
+
+    Bindings are resolved once per process and library path, on first use,
+    and shared by all TurboJPEG instances: load() returns the cached
+    bindings, so creating further instances does not search for, load or
+    bind the library again. Setting the TURBOJPEG_LIB_PATH environment
+    variable skips the library search (find_library runs ldconfig/gcc on
+    Linux).
+    """
+
+    __loaded = {}
+    __default_path = None
+    __lock = threading.Lock()
+
+    @classmethod
+    def load(cls, lib_path=None):
+        """returns the shared bindings of lib_path, or of the default library"""
+        with cls.__lock:
+            if lib_path is None:
+                if cls.__default_path is None:
+                    cls.__default_path = cls.find()
+                lib_path = cls.__default_path
+            lib = cls.__loaded.get(lib_path)
+            if lib is None:
+                lib = cls(lib_path)
+                cls.__loaded[lib_path] = lib
+            return lib
+
+    def __init__(self, lib_path):
+        self.lib_path = lib_path
+        turbo_jpeg = cdll.LoadLibrary(lib_path)
+        self.init_decompress = turbo_jpeg.tjInitDecompress
+        self.init_decompress.restype = c_void_p
+        self.buffer_size = turbo_jpeg.tjBufSize
+        self.buffer_size.argtypes = [c_int, c_int, c_int]
+        self.buffer_size.restype = c_ulong
+        self.init_compress = turbo_jpeg.tjInitCompress
+        self.init_compress.restype = c_void_p
+        self.buffer_size_YUV2 = turbo_jpeg.tjBufSizeYUV2
+        self.buffer_size_YUV2.argtypes = [c_int, c_int, c_int, c_int]
+        self.buffer_size_YUV2.restype = c_ulong
+        self.plane_width = turbo_jpeg.tjPlaneWidth
+        self.plane_width.argtypes = [c_int, c_int, c_int]
+        self.plane_width.restype = c_int
+        self.plane_height = turbo_jpeg.tjPlaneHeight
+        self.plane_height.argtypes = [c_int, c_int, c_int]
+        self.plane_height.restype = c_int
+        self.destroy = turbo_jpeg.tjDestroy
+        self.destroy.argtypes = [c_void_p]
+        self.destroy.restype = c_int
+        self.decompress_header = turbo_jpeg.tjDecompressHeader3
+        self.decompress_header.argtypes = [
             c_void_p, POINTER(c_ubyte), c_ulong, POINTER(c_int),
             POINTER(c_int), POINTER(c_int), POINTER(c_int)]
-        self.__decompress_header.restype = c_int
-        self.__decompress = turbo_jpeg.tjDecompress2
-        self.__decompress.argtypes = [
+        self.decompress_header.restype = c_int
+        self.decompress = turbo_jpeg.tjDecompress2
+        self.decompress.argtypes = [
             c_void_p, POINTER(c_ubyte), c_ulong, POINTER(c_ubyte),
             c_int, c_int, c_int, c_int, c_int]
-        self.__decompress.restype = c_int
-        self.__decompressToYUV2 = turbo_jpeg.tjDecompressToYUV2
-        self.__decompressToYUV2.argtypes = [
+        self.decompress.restype = c_int
+        self.decompressToYUV2 = turbo_jpeg.tjDecompressToYUV2
+        self.decompressToYUV2.argtypes = [
             c_void_p, POINTER(c_ubyte), c_ulong, POINTER(c_ubyte),
             c_int, c_int, c_int, c_int]
-        self.__decompressToYUV2.restype = c_int
-        self.__decompressToYUVPlanes = turbo_jpeg.tjDecompressToYUVPlanes
-        self.__decompressToYUVPlanes.argtypes = [
+        self.decompressToYUV2.restype = c_int
+        self.decompressToYUVPlanes = turbo_jpeg.tjDecompressToYUVPlanes
+        self.decompressToYUVPlanes.argtypes = [
             c_void_p, POINTER(c_ubyte), c_ulong, POINTER(POINTER(c_ubyte)),
             c_int, POINTER(c_int), c_int, c_int]
-        self.__decompressToYUVPlanes.restype = c_int
-        self.__compress = turbo_jpeg.tjCompress2
-        self.__compress.argtypes = [
+        self.decompressToYUVPlanes.restype = c_int
+        self.compress = turbo_jpeg.tjCompress2
+        self.compress.argtypes = [
             c_void_p, POINTER(c_ubyte), c_int, c_int, c_int, c_int,
             POINTER(c_void_p), POINTER(c_ulong), c_int, c_int, c_int]
-        self.__compress.restype = c_int
-        self.__compressFromYUV = turbo_jpeg.tjCompressFromYUV
-        self.__compressFromYUV.argtypes = [
+        self.compress.restype = c_int
+        self.compressFromYUV = turbo_jpeg.tjCompressFromYUV
+        self.compressFromYUV.argtypes = [
             c_void_p, POINTER(c_ubyte), c_int, c_int, c_int, c_int,
             POINTER(c_void_p), POINTER(c_ulong), c_int, c_int]
-        self.__compressFromYUV.restype = c_int
-        self.__init_transform = turbo_jpeg.tjInitTransform
-        self.__init_transform.restype = c_void_p
-        self.__transform = turbo_jpeg.tjTransform
-        self.__transform.argtypes = [
+        self.compressFromYUV.restype = c_int
+        self.compressFromYUVPlanes = turbo_jpeg.tjCompressFromYUVPlanes
+        self.compressFromYUVPlanes.argtypes = [
+            c_void_p, POINTER(POINTER(c_ubyte)), c_int, POINTER(c_int), c_int, c_int,
+            POINTER(c_void_p), POINTER(c_ulong), c_int, c_int]
+        self.compressFromYUVPlanes.restype = c_int
+        self.init_transform = turbo_jpeg.tjInitTransform
+        self.init_transform.restype = c_void_p
+        self.transform = turbo_jpeg.tjTransform
+        self.transform.argtypes = [
             c_void_p, POINTER(c_ubyte), c_ulong, c_int, POINTER(c_void_p),
             POINTER(c_ulong), POINTER(TransformStruct), c_int]
-        self.__transform.restype = c_int
-        self.__free = turbo_jpeg.tjFree
-        self.__free.argtypes = [c_void_p]
-        self.__free.restype = None
-        self.__get_error_str = turbo_jpeg.tjGetErrorStr
-        self.__get_error_str.restype = c_char_p
+        self.transform.restype = c_int
+        self.free = turbo_jpeg.tjFree
+        self.free.argtypes = [c_void_p]
+        self.free.restype = None
+        self.get_error_str = turbo_jpeg.tjGetErrorStr
+        self.get_error_str.restype = c_char_p
         # tjGetErrorStr2 is only available in newer libjpeg-turbo
-        self.__get_error_str2 = getattr(turbo_jpeg, 'tjGetErrorStr2', None)
-        if self.__get_error_str2 is not None:
-            self.__get_error_str2.argtypes = [c_void_p]
-            self.__get_error_str2.restype = c_char_p
+        self.get_error_str2 = getattr(turbo_jpeg, 'tjGetErrorStr2', None)
+        if self.get_error_str2 is not None:
+            self.get_error_str2.argtypes = [c_void_p]
+            self.get_error_str2.restype = c_char_p
         # tjGetErrorCode is only available in newer libjpeg-turbo
-        self.__get_error_code = getattr(turbo_jpeg, 'tjGetErrorCode', None)
-        if self.__get_error_code is not None:
-            self.__get_error_code.argtypes = [c_void_p]
-            self.__get_error_code.restype = c_int
+        self.get_error_code = getattr(turbo_jpeg, 'tjGetErrorCode', None)
+        if self.get_error_code is not None:
+            self.get_error_code.argtypes = [c_void_p]
+            self.get_error_code.restype = c_int
 
         get_scaling_factors = turbo_jpeg.tjGetScalingFactors
         get_scaling_factors.argtypes = [POINTER(c_int)]
         get_scaling_factors.restype = POINTER(ScalingFactor)
         num_scaling_factors = c_int()
         scaling_factors = get_scaling_factors(byref(num_scaling_factors))
-        self.__scaling_factors = frozenset(
+        self.scaling_factors = frozenset(
             (scaling_factors[i].num, scaling_factors[i].denom)
             for i in range(num_scaling_factors.value)
         )
+        # ascending by value, with the values for bisection
+        self.sorted_scaling_factors = sorted(
+            self.scaling_factors, key=lambda f: Fraction(*f))
+        self.scaling_factor_values = [Fraction(*f) for f in self.sorted_scaling_factors]
+
+        # the tj3* API is only available in libjpeg-turbo 3.x
+        self.has_tj3 = hasattr(turbo_jpeg, 'tj3Init')
+        if self.has_tj3:
+            self.__bind_tj3(turbo_jpeg)
+
+    def __bind_tj3(self, turbo_jpeg):
+        """binds the libjpeg-turbo 3.x functions used by the tj3 backend"""
+        self.tj3_init = turbo_jpeg.tj3Init
+        self.tj3_init.argtypes = [c_int]
+        self.tj3_init.restype = c_void_p
+        self.tj3_destroy = turbo_jpeg.tj3Destroy
+        self.tj3_destroy.argtypes = [c_void_p]
+        self.tj3_destroy.restype = None
+        self.tj3_set = turbo_jpeg.tj3Set
+        self.tj3_set.argtypes = [c_void_p, c_int, c_int]
+        self.tj3_set.restype = c_int
+        self.tj3_get = turbo_jpeg.tj3Get
+        self.tj3_get.argtypes = [c_void_p, c_int]
+        self.tj3_get.restype = c_int
+        self.tj3_decompress_header = turbo_jpeg.tj3DecompressHeader
+        self.tj3_decompress_header.argtypes = [c_void_p, POINTER(c_ubyte), c_size_t]
+        self.tj3_decompress_header.restype = c_int
+        self.tj3_set_scaling_factor = turbo_jpeg.tj3SetScalingFactor
+        self.tj3_set_scaling_factor.argtypes = [c_void_p, ScalingFactor]
+        self.tj3_set_scaling_factor.restype = c_int
+        self.tj3_set_cropping_region = turbo_jpeg.tj3SetCroppingRegion
+        self.tj3_set_cropping_region.argtypes = [c_void_p, CroppingRegion]
+        self.tj3_set_cropping_region.restype = c_int
+        self.tj3_decompress8 = turbo_jpeg.tj3Decompress8
+        self.tj3_decompress8.argtypes = [
+            c_void_p, POINTER(c_ubyte), c_size_t, POINTER(c_ubyte), c_int, c_int]
+        self.tj3_decompress8.restype = c_int
+        self.tj3_compress8 = turbo_jpeg.tj3Compress8
+        self.tj3_compress8.argtypes = [
+            c_void_p, POINTER(c_ubyte), c_int, c_int, c_int, c_int,
+            POINTER(c_void_p), POINTER(c_size_t)]
+        self.tj3_compress8.restype = c_int
+
+    @staticmethod
+    def find():
+        """returns default turbojpeg library path if possible"""
+        lib_path = os.environ.get(LIB_PATH_ENV)
+        if lib_path:
+            return lib_path
+        lib_path = find_library('turbojpeg')
+        if lib_path is not None:
+            return lib_path
+        for lib_path in DEFAULT_LIB_PATHS[platform.system()]:
+            if os.path.exists(lib_path):
+                return lib_path
+        if platform.system() == 'Linux' and 'LD_LIBRARY_PATH' in os.environ:
+            ld_library_path = os.environ['LD_LIBRARY_PATH']
+            for path in ld_library_path.split(':'):
+                lib_path = os.path.join(path, 'libturbojpeg.so.0')
+                if os.path.exists(lib_path):
+                    return lib_path
+        raise RuntimeError(
+            'Unable to locate turbojpeg library automatically. '
+            'You may specify the turbojpeg library path manually.\n'
+            'e.g. jpeg = TurboJPEG(lib_path) or the {} environment '
+            'variable'.format(LIB_PATH_ENV))
+
+
+class TurboJPEG(object):
+    """A Python wrapper of libjpeg-turbo for decoding and encoding JPEG image.
+
+    tjhandles are pooled per kind (decompress, compress, transform) and reused
+    across calls and threads. At most pool_size idle handles of each kind are
+    kept alive until close() is called. The *_batch methods run on up to
+    max_workers threads (default: number of CPUs), each using its own handle;
+    the default pool_size of None keeps max(8, max_workers) handles, so each
+    worker keeps its handle between batches. An explicit pool_size is used
+    as given, a smaller one destroys the surplus handles after each batch.
+    The library bindings are shared by all instances, see TurboJPEGLibrary.
+
+    With libjpeg-turbo 3.x, decode_header, decode, decode_into, encode and
+    encode_into use the tj3 API: parameters are set once per pooled handle
+    and only changed when they differ from the previous call, regions are
+    decoded with partial decompression and lossless JPEG can be encoded.
+    use_tj3=False forces the legacy API, use_tj3=True requires the tj3 API.
+    """
+    def __init__(self, lib_path=None, pool_size=None, max_workers=None, use_tj3=None):
+        lib = TurboJPEGLibrary.load(lib_path)
+        if use_tj3 and not lib.has_tj3:
+            raise RuntimeError('{} does not provide the tj3 API of libjpeg-turbo 3.x'.format(
+                lib.lib_path))
+        self.__use_tj3 = lib.has_tj3 if use_tj3 is None else use_tj3
+        self.__init_decompress = lib.init_decompress
+        self.__buffer_size = lib.buffer_size
+        self.__init_compress = lib.init_compress
+        self.__buffer_size_YUV2 = lib.buffer_size_YUV2
+        self.__plane_width = lib.plane_width
+        self.__plane_height = lib.plane_height
+        self.__destroy = lib.destroy
+        self.__decompress_header = lib.decompress_header
+        self.__decompress = lib.decompress
+        self.__decompressToYUV2 = lib.decompressToYUV2
+        self.__decompressToYUVPlanes = lib.decompressToYUVPlanes
+        self.__compress = lib.compress
+        self.__compressFromYUV = lib.compressFromYUV
+        self.__compressFromYUVPlanes = lib.compressFromYUVPlanes
+        self.__init_transform = lib.init_transform
+        self.__transform = lib.transform
+        self.__free = lib.free
+        self.__get_error_str = lib.get_error_str
+        self.__get_error_str2 = lib.get_error_str2
+        self.__get_error_code = lib.get_error_code
+        self.__scaling_factors = lib.scaling_factors
+        self.__sorted_scaling_factors = lib.sorted_scaling_factors
+        self.__scaling_factor_values = lib.scaling_factor_values
+
+        self.__max_workers = max_workers or os.cpu_count() or 1
+        if pool_size is None:
+            # keep a handle per batch worker thread alive between batches
+            pool_size = max(8, self.__max_workers)
+        # handles that reported an error or warning, not to be reused
+        self.__failed_handles = set()
+        self.__decompress_pool = HandlePool(
+            self.__init_decompress, self.__destroy, pool_size, self.__failed_handles)
+        self.__compress_pool = HandlePool(
+            self.__init_compress, self.__destroy, pool_size, self.__failed_handles)
+        self.__transform_pool = HandlePool(
+            self.__init_transform, self.__destroy, pool_size, self.__failed_handles)
+        # tj3 handles are kept apart from the legacy ones, as legacy calls
+        # overwrite the handle parameters
+        self.__tj3_decompress_pool = None
+        self.__tj3_compress_pool = None
+        if self.__use_tj3:
+            self.__tj3_init = lib.tj3_init
+            self.__tj3_destroy = lib.tj3_destroy
+            self.__tj3_set = lib.tj3_set
+            self.__tj3_get = lib.tj3_get
+            self.__tj3_decompress_header = lib.tj3_decompress_header
+            self.__tj3_set_scaling_factor = lib.tj3_set_scaling_factor
+            self.__tj3_set_cropping_region = lib.tj3_set_cropping_region
+            self.__tj3_decompress8 = lib.tj3_decompress8
+            self.__tj3_compress8 = lib.tj3_compress8
+            self.__tj3_decompress_pool = HandlePool(
+                functools.partial(self.__init_tj3, TJINIT_DECOMPRESS),
+                self.__destroy_tj3, pool_size, self.__failed_handles, TJ3Handle.key)
+            self.__tj3_compress_pool = HandlePool(
+                functools.partial(self.__init_tj3, TJINIT_COMPRESS),
+                self.__destroy_tj3, pool_size, self.__failed_handles, TJ3Handle.key)
+        self.__executor = None
+        self.__executor_lock = threading.Lock()
+        # per-thread uint8 scratch buffers of the transcode engine
+        self.__scratch_local = threading.local()
+        self.__stats = None
+        self.__stats_originals = {}
+        self.__handles_baseline = {}
+
+    def close(self):
+        """shuts down the batch worker threads and destroys all pooled
+           tjhandles"""
+        with self.__executor_lock:
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self.__decompress_pool.close()
+        self.__compress_pool.close()
+        self.__transform_pool.close()
+        if self.__use_tj3:
+            self.__tj3_decompress_pool.close()
+            self.__tj3_compress_pool.close()
+
+    # public methods and libjpeg-turbo functions wrapped by enable_stats;
+    # decode_stream is a generator and is covered by the decode_into it calls
+    STATS_METHODS = (
+        'decode_header', 'decode', 'decode_to_size', 'decode_into', 'decode_gray',
+        'decode_to_yuv', 'decode_to_yuv_into', 'decode_to_yuv_planes', 'decode_to_yuv_planes_into',
+        'encode', 'encode_into', 'encode_to_size', 'encode_from_yuv', 'encode_from_yuv_into',
+        'encode_from_yuv_planes', 'scale_with_quality', 'thumbnails', 'transform', 'crop',
+        'crop_multiple', 'decode_batch', 'encode_batch', 'transform_batch')
+    STATS_LIBRARY_FUNCTIONS = (
+        'decompress_header', 'decompress', 'decompressToYUV2', 'decompressToYUVPlanes',
+        'compress', 'compressFromYUV', 'compressFromYUVPlanes', 'transform',
+        'tj3_set', 'tj3_decompress_header', 'tj3_set_scaling_factor',
+        'tj3_set_cropping_region', 'tj3_decompress8', 'tj3_compress8')
+
+    def enable_stats(self, callback=None):
+        """starts collecting per-method call statistics, see TurboJPEGStats.
+           Until then the methods run unwrapped, without any overhead.
+           callback replaces the callback if statistics are already enabled.
+           Returns the TurboJPEGStats instance.
+        """
+        if self.__stats is not None:
+            self.__stats.callback = callback
+            return self.__stats
+        stats = TurboJPEGStats(callback)
+        for name in self.STATS_METHODS:
+            setattr(self, name, stats.wrap_method(name, getattr(self, name)))
+        for name in self.STATS_LIBRARY_FUNCTIONS:
+            attr = '_TurboJPEG__' + name
+            if attr in self.__dict__:
+                self.__stats_originals[attr] = getattr(self, attr)
+                setattr(self, attr, stats.wrap_library_function(getattr(self, attr)))
+        self.__report_error = stats.wrap_report_error(self.__report_error)
+        self.__stats = stats
+        return stats
+
+    def disable_stats(self):
+        """stops collecting call statistics and removes the wrappers"""
+        if self.__stats is None:
+            return
+        for name in self.STATS_METHODS:
+            del self.__dict__[name]
+        for attr, original in self.__stats_originals.items():
+            setattr(self, attr, original)
+        del self.__report_error
+        self.__stats_originals = {}
+        self.__stats = None
+
+    def stats(self, reset=False):
+        """returns a snapshot of the call statistics collected since
+           enable_stats or the last reset, and the number of tjhandles
+           created per pool; reset=True starts over"""
+        pools = {
+            'decompress': self.__decompress_pool,
+            'compress': self.__compress_pool,
+            'transform': self.__transform_pool,
+        }
+        if self.__use_tj3:
+            pools['tj3_decompress'] = self.__tj3_decompress_pool
+            pools['tj3_compress'] = self.__tj3_compress_pool
+        created = dict((kind, pool.created) for kind, pool in pools.items())
+        if self.__stats is None:
+            snapshot = {'methods': {}, 'warnings': 0,
+                        'histogram_bounds': TurboJPEGStats.HISTOGRAM_BOUNDS}
+        else:
+            snapshot = self.__stats.snapshot(reset)
+        snapshot['enabled'] = self.__stats is not None
+        snapshot['handles_created'] = dict(
+            (kind, count - self.__handles_baseline.get(kind, 0))
+            for kind, count in created.items())
+        if reset:
+            self.__handles_baseline = created
+        return snapshot
+
+    @property
+    def backend(self):
+        """'tj3' if the libjpeg-turbo 3.x API is used, 'legacy' otherwise"""
+        return 'tj3' if self.__use_tj3 else 'legacy'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def decode_header(self, jpeg_buf):
         """decodes JPEG header and returns image properties as a tuple.
            e.g. (width, height, jpeg_subsample, jpeg_colorspace)
         """
-        handle = self.__init_decompress()
+        if self.__use_tj3:
+            tj3_handle = self.__tj3_decompress_pool.acquire()
+            try:
+                jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
+                return self.__tj3_header(
+                    tj3_handle, self.__getaddr(jpeg_array), jpeg_array)
+            finally:
+                self.__tj3_decompress_pool.release(tj3_handle)
+        handle = self.__decompress_pool.acquire()
         try:
-            width = c_int()
-            height = c_int()
-            jpeg_subsample = c_int()
-            jpeg_colorspace = c_int()
             jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
-            src_addr = self.__getaddr(jpeg_array)
-            status = self.__decompress_header(
-                handle, src_addr, jpeg_array.size, byref(width), byref(height),
-                byref(jpeg_subsample), byref(jpeg_colorspace))
-            if status != 0:
-                self.__report_error(handle)
-            return (width.value, height.value, jpeg_subsample.value, jpeg_colorspace.value)
+            return self.__get_header_and_dimensions(
+                handle, jpeg_array, self.__getaddr(jpeg_array), None)
         finally:
-            self.__destroy(handle)
+            self.__decompress_pool.release(handle)
+
+    def decode(self, jpeg_buf, pixel_format=TJPF_BGR, scaling_factor=None, flags=0, region=None):
+        """decodes JPEG memory buffer to numpy array.
+           region=(x, y, w, h) decodes only the MCU rows and columns covering
+           that region of the image and returns just the region, as a view
+           of the (scaled) MCU-aligned decode. With chroma subsampling, pixels
+           at the MCU-aligned crop edges can differ slightly from a full
+           decode because chroma upsampling lacks the neighbouring samples.
+        """
+        if region is not None:
+            if self.__use_tj3:
+                return self.__tj3_decode(
+                    jpeg_buf, None, pixel_format, scaling_factor, flags, region)
+            return self.__decode_region(jpeg_buf, region, pixel_format, scaling_factor, flags)
+        return self.decode_into(jpeg_buf, None, pixel_format, scaling_factor, flags)
+
+    def decode_to_size(self, jpeg_buf, max_size=None, min_size=None, resize=False,
+                       pixel_format=TJPF_BGR, flags=0, region=None):
+        """decodes JPEG memory buffer to numpy array of about a given size,
+           scaling in the DCT domain with the factor from
+           choose_scaling_factor. max_size=(w, h) returns an image fitting
+           into it, min_size=(w, h) an image covering it. resize=True
+           finishes with a nearest-neighbour resize to the exact
+           aspect-preserving size; otherwise the DCT-scaled image is
+           returned as is. See decode for region.
+        """
+        width, height, _, _ = self.decode_header(jpeg_buf)
+        if region is not None:
+            x, y, w, h = region
+            width, height = min(w, width - x), min(h, height - y)
+        scaling_factor = self.choose_scaling_factor(width, height, max_size, min_size)
+        img_array = self.decode(jpeg_buf, pixel_format, scaling_factor, flags, region)
+        if not resize:
+            return img_array
+        # exact, the limiting dimension has to come out as given
+        if max_size is not None:
+            scale = min(Fraction(max_size[0], width), Fraction(max_size[1], height), 1)
+            target = (max(int(width * scale), 1), max(int(height * scale), 1))
+        else:
+            scale = max(Fraction(min_size[0], width), Fraction(min_size[1], height))
+            target = (int(math.ceil(width * scale)), int(math.ceil(height * scale)))
+        return self.__resize_nearest(img_array, target)
+
+    def choose_scaling_factor(self, width, height, max_size=None, min_size=None):
+        """returns the cheapest supported scaling factor for a width x height
+           image that still meets the size: the largest one whose result fits
+           into max_size=(w, h), or the smallest one whose result covers
+           min_size=(w, h). Falls back to the smallest or largest factor
+           when none meets the size.
+        """
+        if (max_size is None) == (min_size is None):
+            raise ValueError('exactly one of max_size and min_size is required')
+        values = self.__scaling_factor_values
+        if max_size is not None:
+            # ceil(dim * f) <= limit  <=>  f <= limit / dim
+            limit = min(Fraction(max_size[0], width), Fraction(max_size[1], height))
+            index = bisect.bisect_right(values, limit) - 1
+            return self.__sorted_scaling_factors[max(index, 0)]
+        # ceil(dim * f) >= limit  <=>  f > (limit - 1) / dim
+        limit = max(Fraction(min_size[0] - 1, width), Fraction(min_size[1] - 1, height))
+        index = bisect.bisect_right(values, limit)
+        return self.__sorted_scaling_factors[min(index, len(values) - 1)]
 
-    def decode(self, jpeg_buf, pixel_format=TJPF_BGR, scaling_factor=None, flags=0):
-        """decodes JPEG memory buffer to numpy array."""
-        handle = self.__init_decompress()
+    @staticmethod
+    def __resize_nearest(img_array, size):
+        """returns img_array resized to size=(w, h) by nearest-neighbour sampling"""
+        height, width = img_array.shape[:2]
+        if (width, height) == tuple(size):
+            return img_array
+        rows = (np.arange(size[1]) * height // size[1])
+        cols = (np.arange(size[0]) * width // size[0])
+        return img_array[rows[:, None], cols]
+
+    def decode_into(self, jpeg_buf, out, pixel_format=TJPF_BGR, scaling_factor=None, flags=0):
+        """decodes JPEG memory buffer into a preallocated numpy array.
+           out is a uint8 array of shape (height, width, channels) matching
+           the (scaled) image, or a FrameRing handing out such arrays. Rows
+           may be padded, e.g. out can be a view into a larger frame.
+           Returns the array the image was decoded into.
+        """
+        if self.__use_tj3:
+            return self.__tj3_decode(jpeg_buf, out, pixel_format, scaling_factor, flags)
+        handle = self.__decompress_pool.acquire()
         try:
             jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
             src_addr = self.__getaddr(jpeg_array)
             scaled_width, scaled_height, _, _ = \
-                self.__get_header_and_dimensions(handle, jpeg_array.size, src_addr, scaling_factor)
-            img_array = np.empty(
-                [scaled_height, scaled_width, tjPixelSize[pixel_format]],
-                dtype=np.uint8)
+                self.__get_header_and_dimensions(handle, jpeg_array, src_addr, scaling_factor)
+            img_array = self.__output_array(
+                out, (scaled_height, scaled_width, tjPixelSize[pixel_format]))
             dest_addr = self.__getaddr(img_array)
-            status = self.__decompress(
-                handle, src_addr, jpeg_array.size, dest_addr, scaled_width,
-                0, scaled_height, pixel_format, flags)
-            if status != 0:
-                self.__report_error(handle)
+
+            def decompress(handle):
+                return self.__decompress(
+                    handle, src_addr, jpeg_array.size, dest_addr, scaled_width,
+                    img_array.strides[0], scaled_height, pixel_format, flags)
+
+            self.__check_decompress(decompress(handle), handle, self.__decompress_pool, decompress)
+            return img_array
+        finally:
+            self.__decompress_pool.release(handle)
+
+    def decode_gray(self, jpeg_buf, out=None, scaling_factor=None, flags=0, region=None):
+        """decodes only the luma of JPEG memory buffer to a 2-D uint8 array
+           of shape (height, width). For YCbCr and grayscale images this is
+           the Y plane: libjpeg-turbo skips the chroma components entirely,
+           so there is no chroma IDCT, upsampling or color conversion.
+           out is a uint8 array of that shape, rows may be padded, or a
+           FrameRing; the luma is written into it and it is returned.
+           region=(x, y, w, h) decodes only the MCUs covering that region of
+           the image, see decode.
+        """
+        if self.__use_tj3:
+            return self.__tj3_decode_gray(jpeg_buf, out, scaling_factor, flags, region)
+        if region is not None:
+            # the lossless crop drops the chroma components, so only the
+            # luma is decoded
+            img_array = self.__decode_region(
+                jpeg_buf, region, TJPF_GRAY, scaling_factor, flags, gray=True)[:, :, 0]
+            if out is None:
+                return img_array
+            out_array = self.__output_array(out, img_array.shape)
+            out_array[...] = img_array
+            return out_array
+        handle = self.__decompress_pool.acquire()
+        try:
+            jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
+            src_addr = self.__getaddr(jpeg_array)
+            scaled_width, scaled_height, _, _ = \
+                self.__get_header_and_dimensions(handle, jpeg_array, src_addr, scaling_factor)
+            img_array = self.__output_array(out, (scaled_height, scaled_width))
+
+            def decompress(handle):
+                return self.__decompress(
+                    handle, src_addr, jpeg_array.size, self.__getaddr(img_array), scaled_width,
+                    img_array.strides[0], scaled_height, TJPF_GRAY, flags)
+
+            self.__check_decompress(decompress(handle), handle, self.__decompress_pool, decompress)
             return img_array
         finally:
-            self.__destroy(handle)
+            self.__decompress_pool.release(handle)
+
+    def __decode_region(self, jpeg_buf, region, pixel_format, scaling_factor, flags, gray=False):
+        """decodes the MCU-aligned part of a JPEG image covering region,
+           dropping its chroma components in the crop if gray is True"""
+        handle = self.__transform_pool.acquire()
+        try:
+            jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
+            src_addr = self.__getaddr(jpeg_array)
+            width, height, jpeg_subsample, _ = \
+                self.__get_header_and_dimensions(handle, jpeg_array, src_addr, None)
+            x, y, w, h, crop_region = self.__mcu_region(
+                region, width, height, jpeg_subsample)
+            crop_array = c_void_p()
+            crop_size = c_ulong()
+            crop_transform = TransformStruct(
+                crop_region, TJXOP_NONE, TJXOPT_CROP | (TJXOPT_GRAY if gray else 0))
+            status = self.__transform(
+                handle, src_addr, jpeg_array.size, 1, byref(crop_array), byref(crop_size),
+                byref(crop_transform), 0)
+            try:
+                if status != 0:
+                    self.__report_error(handle)
+                # decode straight from the libjpeg-turbo output buffer
+                img_array = self.decode(
+                    (c_ubyte * crop_size.value).from_address(crop_array.value),
+                    pixel_format, scaling_factor, flags)
+            finally:
+                self.__free(crop_array)
+        finally:
+            self.__transform_pool.release(handle)
+        return self.__region_view(img_array, x - crop_region.x, y - crop_region.y, w, h, scaling_factor)
+
+    def __mcu_region(self, region, width, height, jpeg_subsample):
+        """returns the region clipped to the image as (x, y, w, h) and the
+           MCU-aligned CroppingRegion covering it"""
+        x, y, w, h = region
+        if x < 0 or y < 0 or w <= 0 or h <= 0 or x >= width or y >= height:
+            raise ValueError('region {} is outside the {}x{} image'.format(
+                tuple(region), width, height))
+        if jpeg_subsample == TJSAMP_UNKNOWN:
+            raise IOError('Could not determine subsampling type for JPEG image')
+        w = min(w, width - x)
+        h = min(h, height - y)
+        crop_x, _ = self.__axis_to_image_boundaries(
+            x, w, width, False, tjMCUWidth[jpeg_subsample])
+        crop_y, _ = self.__axis_to_image_boundaries(
+            y, h, height, False, tjMCUHeight[jpeg_subsample])
+        # the crop may end at the unaligned right/bottom image edge
+        crop_region = CroppingRegion(crop_x, crop_y, x + w - crop_x, y + h - crop_y)
+        return x, y, w, h, crop_region
+
+    @staticmethod
+    def __region_view(img_array, dx, dy, w, h, scaling_factor):
+        """returns the (scaled) region at offset (dx, dy) of a decoded
+           MCU-aligned crop"""
+        if scaling_factor is not None:
+            num, denom = scaling_factor
+            dx, dy = dx * num // denom, dy * num // denom
+            w, h = (w * num + denom - 1) // denom, (h * num + denom - 1) // denom
+        return img_array[dy:dy + h, dx:dx + w]
+
+    def __tj3_decode(self, jpeg_buf, out, pixel_format, scaling_factor, flags, region=None):
+        """decodes JPEG memory buffer, or the part of it covering region, with
+           the tj3 API"""
+        tj3_handle = self.__tj3_decompress_pool.acquire()
+        try:
+            jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
+            src_addr = self.__getaddr(jpeg_array)
+            crop_width, crop_height, dx, w = self.__tj3_setup_decode(
+                tj3_handle, src_addr, jpeg_array, scaling_factor, flags, region)
+            img_array = self.__output_array(
+                out, (crop_height, crop_width, tjPixelSize[pixel_format]))
+            self.__tj3_decompress(
+                tj3_handle, src_addr, jpeg_array, img_array, pixel_format,
+                scaling_factor, flags, region)
+            if region is None:
+                return img_array
+            return img_array[:, dx:dx + w]
+        finally:
+            self.__tj3_decompress_pool.release(tj3_handle)
+
+    def __tj3_decode_gray(self, jpeg_buf, out, scaling_factor, flags, region):
+        """decodes the luma of JPEG memory buffer, or of the part covering
+           region, with the tj3 API"""
+        tj3_handle = self.__tj3_decompress_pool.acquire()
+        try:
+            jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
+            src_addr = self.__getaddr(jpeg_array)
+            crop_width, crop_height, dx, w = self.__tj3_setup_decode(
+                tj3_handle, src_addr, jpeg_array, scaling_factor, flags, region)
+            if out is None or crop_width == w:
+                img_array = dest_array = self.__output_array(out, (crop_height, crop_width))
+            else:
+                # partial decompression starts on the iMCU grid, so the extra
+                # columns left of the region are decoded into scratch
+                img_array = self.__output_array(out, (crop_height, w))
+                dest_array = self.__scratch(
+                    'decode_gray', crop_height * crop_width).reshape(crop_height, crop_width)
+            self.__tj3_decompress(
+                tj3_handle, src_addr, jpeg_array, dest_array, TJPF_GRAY,
+                scaling_factor, flags, region)
+            if dest_array is not img_array:
+                img_array[...] = dest_array[:, dx:dx + w]
+            elif crop_width != w:
+                img_array = img_array[:, dx:dx + w]
+            return img_array
+        finally:
+            self.__tj3_decompress_pool.release(tj3_handle)
+
+    def __tj3_setup_decode(self, tj3_handle, src_addr, jpeg_array, scaling_factor, flags, region):
+        """reads the header and sets the decompression parameters of a tj3
+           handle. Returns (crop_width, crop_height, dx, w): the size of the
+           (scaled) image or of the decoded part covering region, and the
+           column offset and width of the region within it"""
+        handle = tj3_handle.handle
+        width, height, jpeg_subsample, _ = self.__tj3_header(
+            tj3_handle, src_addr, jpeg_array)
+        scaled_width, scaled_height = self.__scaled_dimensions(width, height, scaling_factor)
+        self.__tj3_set_params(tj3_handle, (
+            (TJPARAM_BOTTOMUP, int(bool(flags & TJFLAG_BOTTOMUP))),
+            (TJPARAM_FASTUPSAMPLE, int(bool(flags & TJFLAG_FASTUPSAMPLE))),
+            (TJPARAM_FASTDCT, int(bool(flags & TJFLAG_FASTDCT))),
+            (TJPARAM_STOPONWARNING, int(bool(flags & TJFLAG_STOPONWARNING))),
+            (TJPARAM_SCANLIMIT, TJ_SCAN_LIMIT if flags & TJFLAG_LIMITSCANS else 0),
+        ))
+        scaling_factor = scaling_factor or (1, 1)
+        if tj3_handle.params.get('scaling') != scaling_factor:
+            if self.__tj3_set_scaling_factor(handle, ScalingFactor(*scaling_factor)) != 0:
+                self.__report_error(handle)
+            tj3_handle.params['scaling'] = scaling_factor
+        if region is None:
+            crop = (0, 0, 0, 0)
+            crop_width, crop_height = scaled_width, scaled_height
+        else:
+            x, y, w, h, _ = self.__mcu_region(region, width, height, jpeg_subsample)
+            num, denom = scaling_factor
+            x, y = x * num // denom, y * num // denom
+            w = min((w * num + denom - 1) // denom, scaled_width - x)
+            h = min((h * num + denom - 1) // denom, scaled_height - y)
+            # partial decompression needs the left edge on the scaled
+            # iMCU grid, the top edge can be any row
+            crop_x, _ = self.__axis_to_image_boundaries(
+                x, w, scaled_width, False,
+                max(tjMCUWidth[jpeg_subsample] * num // denom, 1))
+            crop_width, crop_height = x + w - crop_x, h
+            crop = (crop_x, y, crop_width, crop_height)
+        # the cropping region is validated against the current header, so
+        # it is always set for a region
+        if region is not None or tj3_handle.params.get('crop') != crop:
+            if self.__tj3_set_cropping_region(handle, CroppingRegion(*crop)) != 0:
+                self.__report_error(handle)
+            tj3_handle.params['crop'] = crop
+        if region is None:
+            return crop_width, crop_height, 0, crop_width
+        return crop_width, crop_height, x - crop_x, w
+
+    def __tj3_decompress(self, tj3_handle, src_addr, jpeg_array, dest_array, pixel_format,
+                         scaling_factor, flags, region):
+        """decompresses into dest_array with a tj3 handle set up by
+           __tj3_setup_decode, see __check_decompress"""
+        def decompress(tj3_handle):
+            return self.__tj3_decompress8(
+                tj3_handle.handle, src_addr, jpeg_array.size, self.__getaddr(dest_array),
+                dest_array.strides[0], pixel_format)
+
+        def setup_and_decompress(tj3_handle):
+            self.__tj3_setup_decode(tj3_handle, src_addr, jpeg_array, scaling_factor, flags, region)
+            return decompress(tj3_handle)
+
+        self.__check_decompress(
+            decompress(tj3_handle), tj3_handle, self.__tj3_decompress_pool, setup_and_decompress)
+
+    def __init_tj3(self, init_type):
+        """returns a new TJ3Handle, or None if tj3Init failed"""
+        handle = self.__tj3_init(init_type)
+        return TJ3Handle(handle) if handle else None
+
+    def __destroy_tj3(self, tj3_handle):
+        """destroys the libjpeg-turbo handle of a TJ3Handle"""
+        self.__tj3_destroy(tj3_handle.handle)
+
+    def __tj3_set_params(self, tj3_handle, params):
+        """sets the (param, value) pairs that differ from the ones last set"""
+        for param, value in params:
+            if tj3_handle.params.get(param) != value:
+                if self.__tj3_set(tj3_handle.handle, param, value) != 0:
+                    self.__report_error(tj3_handle.handle)
+                tj3_handle.params[param] = value
+
+    def __tj3_header(self, tj3_handle, src_addr, jpeg_array):
+        """decodes JPEG header with the tj3 API and returns
+           (width, height, jpeg_subsample, jpeg_colorspace)"""
+        handle = tj3_handle.handle
+        if self.__tj3_decompress_header(handle, src_addr, jpeg_array.size) != 0:
+            header = self.__report_header_error(handle, src_addr, jpeg_array.size)
+        else:
+            header = (self.__tj3_get(handle, TJPARAM_JPEGWIDTH),
+                      self.__tj3_get(handle, TJPARAM_JPEGHEIGHT),
+                      self.__tj3_get(handle, TJPARAM_SUBSAMP),
+                      self.__tj3_get(handle, TJPARAM_COLORSPACE))
+        self.__check_header(handle, jpeg_array, header)
+        return header
 
     def decode_to_yuv(self, jpeg_buf, scaling_factor=None, pad=4, flags=0):
         """decodes JPEG memory buffer to yuv array."""
-        handle = self.__init_decompress()
+        return self.decode_to_yuv_into(jpeg_buf, None, scaling_factor, pad, flags)
+
+    def decode_to_yuv_into(self, jpeg_buf, out, scaling_factor=None, pad=4, flags=0):
+        """decodes JPEG memory buffer into a preallocated yuv array.
+           out is a contiguous 1-D uint8 array of tjBufSizeYUV2 bytes, or a
+           FrameRing handing out such arrays. Returns (out, plane_sizes).
+        """
+        handle = self.__decompress_pool.acquire()
         try:
             jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
             src_addr = self.__getaddr(jpeg_array)
             scaled_width, scaled_height, jpeg_subsample, _ = \
-                self.__get_header_and_dimensions(handle, jpeg_array.size, src_addr, scaling_factor)
+                self.__get_header_and_dimensions(handle, jpeg_array, src_addr, scaling_factor)
             buffer_size = self.__buffer_size_YUV2(scaled_width, pad, scaled_height, jpeg_subsample)
-            buffer_array = np.empty(buffer_size, dtype=np.uint8)
+            buffer_array = self.__output_array(out, (buffer_size,))
             dest_addr = self.__getaddr(buffer_array)
-            status = self.__decompressToYUV2(
-                handle, src_addr, jpeg_array.size, dest_addr, scaled_width,
-                pad, scaled_height, flags)
-            if status != 0:
-                self.__report_error(handle)
+
+            def decompress(handle):
+                return self.__decompressToYUV2(
+                    handle, src_addr, jpeg_array.size, dest_addr, scaled_width,
+                    pad, scaled_height, flags)
+
+            self.__check_decompress(decompress(handle), handle, self.__decompress_pool, decompress)
             plane_sizes = list()
             plane_sizes.append((scaled_height, scaled_width))
             if jpeg_subsample != TJSAMP_GRAY:
@@ -445,131 +1760,510 @@ class TurboJPEG(object):
                         self.__plane_width(i, scaled_width, jpeg_subsample)))
             return buffer_array, plane_sizes
         finally:
-            self.__destroy(handle)
+            self.__decompress_pool.release(handle)
 
     def decode_to_yuv_planes(self, jpeg_buf, scaling_factor=None, strides=(0, 0, 0), flags=0):
         """decodes JPEG memory buffer to yuv planes."""
-        handle = self.__init_decompress()
+        return self.__decode_to_yuv_planes(jpeg_buf, None, scaling_factor, strides, flags)
+
+    def decode_to_yuv_planes_into(self, jpeg_buf, planes, scaling_factor=None, flags=0):
+        """decodes JPEG memory buffer into preallocated yuv planes.
+           planes holds one uint8 array (or FrameRing) per plane, or is a
+           single FrameRing used for all planes. Each plane array has the
+           plane height as rows and at least the plane width as columns; its
+           row stride is used as the plane stride. Returns the planes.
+        """
+        return self.__decode_to_yuv_planes(jpeg_buf, planes, scaling_factor, None, flags)
+
+    def __decode_to_yuv_planes(self, jpeg_buf, out, scaling_factor, strides, flags):
+        """decodes JPEG memory buffer to new or preallocated yuv planes"""
+        handle = self.__decompress_pool.acquire()
         try:
             jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
             src_addr = self.__getaddr(jpeg_array)
             scaled_width, scaled_height, jpeg_subsample, _ = \
-                self.__get_header_and_dimensions(handle, jpeg_array.size, src_addr, scaling_factor)
+                self.__get_header_and_dimensions(handle, jpeg_array, src_addr, scaling_factor)
             num_planes = 3
             if jpeg_subsample == TJSAMP_GRAY:
                 num_planes = 1
+            if isinstance(out, FrameRing):
+                out = [out] * num_planes
+            elif out is not None and len(out) != num_planes:
+                raise ValueError('expected {} output planes, got {}'.format(num_planes, len(out)))
             strides_addr = (c_int * num_planes)()
             dest_addr = (POINTER(c_ubyte) * num_planes)()
             planes = list()
             for i in range(num_planes):
-                if strides[i] == 0:
-                    strides_addr[i] = self.__plane_width(i, scaled_width, jpeg_subsample)
+                plane_width = self.__plane_width(i, scaled_width, jpeg_subsample)
+                plane_height = self.__plane_height(i, scaled_height, jpeg_subsample)
+                if out is None:
+                    if 0 < strides[i] < plane_width:
+                        raise ValueError('stride {} of plane {} is less than its width {}'.format(
+                            strides[i], i, plane_width))
+                    plane = np.empty((plane_height, strides[i] or plane_width), dtype=np.uint8)
+                elif isinstance(out[i], FrameRing):
+                    plane = out[i].acquire((plane_height, plane_width))
                 else:
-                    strides_addr[i] = strides[i]
-                planes.append(np.empty(
-                    (self.__plane_height(i, scaled_height, jpeg_subsample), strides_addr[i]), dtype=np.uint8))
-                dest_addr[i] = self.__getaddr(planes[i])
-            status = self.__decompressToYUVPlanes(
-                handle, src_addr, jpeg_array.size, dest_addr, scaled_width, strides_addr, scaled_height, flags)
-            if status != 0:
-                self.__report_error(handle)
+                    plane = out[i]
+                    self.__check_output_array(plane, (plane_height, plane_width), min_width=True)
+                strides_addr[i] = plane.strides[0]
+                planes.append(plane)
+                dest_addr[i] = self.__getaddr(plane)
+
+            def decompress(handle):
+                return self.__decompressToYUVPlanes(
+                    handle, src_addr, jpeg_array.size, dest_addr, scaled_width, strides_addr,
+                    scaled_height, flags)
+
+            self.__check_decompress(decompress(handle), handle, self.__decompress_pool, decompress)
             return planes
         finally:
-            self.__destroy(handle)
+            self.__decompress_pool.release(handle)
 
-    def encode(self, img_array, quality=85, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_422, flags=0):
-        """encodes numpy array to JPEG memory buffer."""
-        handle = self.__init_compress()
+    def encode(self, img_array, quality=85, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_422, flags=0,
+               lossless=False):
+        """encodes numpy array to JPEG memory buffer.
+           lossless=True produces a lossless JPEG (tj3 backend only); quality
+           and jpeg_subsample are then ignored.
+        """
+        if self.__use_tj3:
+            return self.__tj3_encode(
+                img_array, None, quality, pixel_format, jpeg_subsample, flags, lossless)
+        if lossless:
+            raise RuntimeError('lossless JPEG encoding requires libjpeg-turbo 3.x')
+        handle = self.__acquire_compress(flags)
         try:
             jpeg_buf = c_void_p()
             jpeg_size = c_ulong()
-            height, width = img_array.shape[:2]
-            channel = tjPixelSize[pixel_format]
-            if channel > 1 and (len(img_array.shape) < 3 or img_array.shape[2] != channel):
-                raise ValueError('Invalid shape for image data')
+            height, width = self.__check_image_array(img_array, pixel_format)
             src_addr = self.__getaddr(img_array)
             status = self.__compress(
                 handle, src_addr, width, img_array.strides[0], height, pixel_format,
                 byref(jpeg_buf), byref(jpeg_size), jpeg_subsample, quality, flags)
+            try:
+                if status != 0:
+                    self.__report_error(handle)
+            finally:
+                jpeg_data = self.__take_jpeg_buffer(jpeg_buf, jpeg_size.value)
+            return jpeg_data
+        finally:
+            self.__compress_pool.release(handle)
+
+    def encode_into(self, img_array, out, quality=85, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_422, flags=0):
+        """encodes numpy array into a caller-provided buffer, without
+           reallocation or intermediate copies.
+           out is a writable bytes-like object (e.g. bytearray or uint8 numpy
+           array) of at least buffer_size(width, height, jpeg_subsample)
+           bytes. Returns a memoryview of the JPEG data within out.
+        """
+        if self.__use_tj3:
+            return self.__tj3_encode(
+                img_array, out, quality, pixel_format, jpeg_subsample, flags)
+        handle = self.__acquire_compress(flags)
+        try:
+            height, width = self.__check_image_array(img_array, pixel_format)
+            out_array = self.__jpeg_output_array(out, width, height, jpeg_subsample)
+            jpeg_buf = c_void_p(out_array.__array_interface__['data'][0])
+            jpeg_size = c_ulong(out_array.size)
+            src_addr = self.__getaddr(img_array)
+            status = self.__compress(
+                handle, src_addr, width, img_array.strides[0], height, pixel_format,
+                byref(jpeg_buf), byref(jpeg_size), jpeg_subsample, quality,
+                flags | TJFLAG_NOREALLOC)
             if status != 0:
                 self.__report_error(handle)
-            dest_buf = create_string_buffer(jpeg_size.value)
-            memmove(dest_buf, jpeg_buf.value, jpeg_size.value)
-            self.__free(jpeg_buf)
-            return dest_buf.raw
+            return out_array.data[:jpeg_size.value]
         finally:
-            self.__destroy(handle)
+            self.__compress_pool.release(handle)
+
+    def encode_to_size(self, img_array, target_bytes, quality=85, pixel_format=TJPF_BGR,
+                       jpeg_subsample=TJSAMP_422, flags=0, tolerance=0.1, max_trials=8,
+                       min_quality=5, max_quality=95):
+        """encodes numpy array to a JPEG memory buffer of at most target_bytes.
+           Bisects quality in [min_quality, max_quality], starting from
+           quality, between the highest quality that fits and the lowest one
+           that does not, with at most max_trials encodes into a reused
+           scratch buffer; 8 trials narrow the default range down to one
+           quality. Stops early at a size within tolerance below the target.
+           Returns (jpeg_buf, quality) for the largest encode that fits. If
+           none of the trials fits, min_quality is encoded as well, and only
+           if that does not fit either the smallest encode is returned.
+        """
+        if not 1 <= min_quality <= max_quality <= 100:
+            raise ValueError('invalid quality range [{}, {}]'.format(min_quality, max_quality))
+        height, width = self.__check_image_array(img_array, pixel_format)
+        scratch = self.__scratch('encode_to_size', self.__buffer_size(width, height, jpeg_subsample))
+        # qualities in [low, high] are neither known to fit nor known not to
+        low, high = min_quality, max_quality
+        quality = min(max(quality, low), high)
+        best = smallest = None
+        for trial in range(max_trials + 1):
+            if trial == max_trials:
+                if best is not None or low > min_quality:
+                    break
+                # min_quality decides whether any quality fits
+                quality = min_quality
+            jpeg_view = self.encode_into(
+                img_array, scratch, quality, pixel_format, jpeg_subsample, flags)
+            size = len(jpeg_view)
+            if size <= target_bytes:
+                if best is None or size > len(best[0]):
+                    best = (bytes(jpeg_view), quality)
+                if size >= target_bytes * (1 - tolerance):
+                    break
+                low = quality + 1
+            else:
+                if smallest is None or size < len(smallest[0]):
+                    smallest = (bytes(jpeg_view), quality)
+                high = quality - 1
+            if low > high:
+                break
+            quality = (low + high) // 2
+        return best if best is not None else smallest
+
+    def __acquire_compress(self, flags):
+        """checks out a compress handle, which is not reused after a call
+           with flags: e.g. a progressive encode leaves its scan script
+           behind and corrupts the next baseline encode of the handle"""
+        handle = self.__compress_pool.acquire()
+        if flags:
+            self.__compress_pool.discard(handle)
+        return handle
+
+    def __tj3_encode(self, img_array, out, quality, pixel_format, jpeg_subsample, flags, lossless=False):
+        """encodes numpy array with the tj3 API, into out if given"""
+        tj3_handle = self.__tj3_compress_pool.acquire()
+        if flags or lossless:
+            # setting TJPARAM_LOSSLESS and TJPARAM_PROGRESSIVE back to 0 does
+            # not restore lossy baseline encoding, see __acquire_compress
+            self.__tj3_compress_pool.discard(tj3_handle)
+        handle = tj3_handle.handle
+        try:
+            height, width = self.__check_image_array(img_array, pixel_format)
+            self.__tj3_set_params(tj3_handle, (
+                (TJPARAM_QUALITY, quality),
+                (TJPARAM_SUBSAMP, jpeg_subsample),
+                (TJPARAM_BOTTOMUP, int(bool(flags & TJFLAG_BOTTOMUP))),
+                # like tjCompress2, which compresses with the fast DCT unless
+                # the quality is high or TJFLAG_ACCURATEDCT is given
+                (TJPARAM_FASTDCT, int(quality < 96 and not flags & TJFLAG_ACCURATEDCT)),
+                (TJPARAM_STOPONWARNING, int(bool(flags & TJFLAG_STOPONWARNING))),
+                (TJPARAM_PROGRESSIVE, int(bool(flags & TJFLAG_PROGRESSIVE))),
+                (TJPARAM_LOSSLESS, int(lossless)),
+                (TJPARAM_NOREALLOC, int(out is not None)),
+            ))
+            src_addr = self.__getaddr(img_array)
+            if out is None:
+                jpeg_buf = c_void_p()
+                jpeg_size = c_size_t()
+            else:
+                out_array = self.__jpeg_output_array(out, width, height, jpeg_subsample)
+                jpeg_buf = c_void_p(out_array.__array_interface__['data'][0])
+                jpeg_size = c_size_t(out_array.size)
+            status = self.__tj3_compress8(
+                handle, src_addr, width, img_array.strides[0], height, pixel_format,
+                byref(jpeg_buf), byref(jpeg_size))
+            if out is not None:
+                if status != 0:
+                    self.__report_error(handle)
+                return out_array.data[:jpeg_size.value]
+            try:
+                if status != 0:
+                    self.__report_error(handle)
+            finally:
+                jpeg_data = self.__take_jpeg_buffer(jpeg_buf, jpeg_size.value)
+            return jpeg_data
+        finally:
+            self.__tj3_compress_pool.release(tj3_handle)
 
-    def encode_from_yuv(self, img_array, height, width, quality=85, jpeg_subsample=TJSAMP_420, flags=0):
-        """encodes numpy array to JPEG memory buffer."""
-        handle = self.__init_compress()
+    def encode_from_yuv(self, img_array, height, width, quality=85, jpeg_subsample=TJSAMP_420, flags=0, pad=4):
+        """encodes yuv array to JPEG memory buffer.
+           pad is the row alignment of the planes in img_array, i.e. the pad
+           passed to decode_to_yuv.
+        """
+        handle = self.__acquire_compress(flags)
         try:
             jpeg_buf = c_void_p()
             jpeg_size = c_ulong()
+            self.__check_yuv_array(img_array, width, height, pad, jpeg_subsample)
             src_addr = self.__getaddr(img_array)
             status = self.__compressFromYUV(
-                handle, src_addr, width, 4, height, jpeg_subsample,
+                handle, src_addr, width, pad, height, jpeg_subsample,
                 byref(jpeg_buf), byref(jpeg_size), quality, flags)
+            try:
+                if status != 0:
+                    self.__report_error(handle)
+            finally:
+                jpeg_data = self.__take_jpeg_buffer(jpeg_buf, jpeg_size.value)
+            return jpeg_data
+        finally:
+            self.__compress_pool.release(handle)
+
+    def encode_from_yuv_into(self, img_array, height, width, out, quality=85, jpeg_subsample=TJSAMP_420, flags=0,
+                             pad=4):
+        """encodes yuv array into a caller-provided buffer, without
+           reallocation or intermediate copies. See encode_into for out and
+           encode_from_yuv for pad.
+        """
+        handle = self.__acquire_compress(flags)
+        try:
+            self.__check_yuv_array(img_array, width, height, pad, jpeg_subsample)
+            out_array = self.__jpeg_output_array(out, width, height, jpeg_subsample)
+            jpeg_buf = c_void_p(out_array.__array_interface__['data'][0])
+            jpeg_size = c_ulong(out_array.size)
+            src_addr = self.__getaddr(img_array)
+            status = self.__compressFromYUV(
+                handle, src_addr, width, pad, height, jpeg_subsample,
+                byref(jpeg_buf), byref(jpeg_size), quality, flags | TJFLAG_NOREALLOC)
             if status != 0:
                 self.__report_error(handle)
-            dest_buf = create_string_buffer(jpeg_size.value)
-            memmove(dest_buf, jpeg_buf.value, jpeg_size.value)
-            self.__free(jpeg_buf)
-            return dest_buf.raw
+            return out_array.data[:jpeg_size.value]
+        finally:
+            self.__compress_pool.release(handle)
+
+    def encode_from_yuv_planes(self, planes, height, width, quality=85, jpeg_subsample=TJSAMP_420, flags=0):
+        """encodes separate Y, U and V planes (only Y for TJSAMP_GRAY) to
+           JPEG memory buffer without packing them first.
+           Each plane is a 2-D uint8 array of tjPlaneHeight rows of at least
+           tjPlaneWidth samples, e.g. as returned by decode_to_yuv_planes;
+           rows may be padded, the stride is taken from each array.
+        """
+        self.__check_yuv_planes(planes, width, height, jpeg_subsample)
+        handle = self.__acquire_compress(flags)
+        try:
+            return self.__encode_planes(
+                handle, planes, width, height, jpeg_subsample, quality, flags)
         finally:
-            self.__destroy(handle)
+            self.__compress_pool.release(handle)
+
+    def buffer_size(self, width, height, jpeg_subsample=TJSAMP_422):
+        """returns the worst-case JPEG size, i.e. the size of the out buffer
+           needed by the *_into encoders"""
+        return self.__buffer_size(width, height, jpeg_subsample)
 
     def scale_with_quality(self, jpeg_buf, scaling_factor=None, quality=85, flags=0):
-        """decompresstoYUV with scale factor, recompresstoYUV with quality factor"""
-        handle = self.__init_decompress()
+        """decompresstoYUV with scale factor, recompresstoYUV with quality factor.
+           The YUV planes are decoded into per-thread scratch buffers that are
+           reused across calls.
+        """
+        return self.__transcode(jpeg_buf, [scaling_factor], quality, flags)[0]
+
+    def thumbnails(self, jpeg_buf, sizes, quality=85, flags=0):
+        """transcodes JPEG memory buffer to one JPEG thumbnail per size.
+           Each (width, height) of sizes gets the largest DCT-domain scale
+           of scaling_factors that fits into it, or the smallest scale if
+           none does. The image is decoded to YUV once per scale that is not
+           a power-of-two reduction of a larger requested scale; those are
+           box-filtered from the YUV planes of the larger scale instead.
+           Returns the thumbnails in the order of sizes.
+        """
+        handle = self.__decompress_pool.acquire()
         try:
             jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
-            src_addr = self.__getaddr(jpeg_array)
-            scaled_width, scaled_height, jpeg_subsample, _ = self.__get_header_and_dimensions(
-                handle, jpeg_array.size, src_addr, scaling_factor)
-            buffer_YUV_size = self.__buffer_size_YUV2(
-                scaled_height, 4, scaled_width, jpeg_subsample)
-            img_array = np.empty([buffer_YUV_size])
-            dest_addr = self.__getaddr(img_array)
-            status = self.__decompressToYUV2(
-                handle, src_addr, jpeg_array.size, dest_addr, scaled_width, 4, scaled_height, flags)
-            if status != 0:
-                self.__report_error(handle)
-            self.__destroy(handle)
-            handle = self.__init_compress()
-            jpeg_buf = c_void_p()
-            jpeg_size = c_ulong()
-            status = self.__compressFromYUV(
-                handle, dest_addr, scaled_width, 4, scaled_height, jpeg_subsample, byref(jpeg_buf),
-                byref(jpeg_size), quality, flags)
+            width, height, _, _ = self.__get_header_and_dimensions(
+                handle, jpeg_array, self.__getaddr(jpeg_array), None)
+        finally:
+            self.__decompress_pool.release(handle)
+        scaling_factors = [self.choose_scaling_factor(width, height, max_size=size) for size in sizes]
+        return self.__transcode(jpeg_buf, scaling_factors, quality, flags)
+
+    def __transcode(self, jpeg_buf, scaling_factors, quality, flags):
+        """transcodes JPEG memory buffer to one JPEG per scaling factor"""
+        decompress_handle = self.__decompress_pool.acquire()
+        try:
+            compress_handle = self.__acquire_compress(flags)
+            try:
+                jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
+                src_addr = self.__getaddr(jpeg_array)
+                width, height, jpeg_subsample, _ = self.__get_header_and_dimensions(
+                    decompress_handle, jpeg_array, src_addr, None)
+                if jpeg_subsample == TJSAMP_UNKNOWN:
+                    raise IOError('Could not determine subsampling type for JPEG image')
+                scaling_factors = [tuple(f) if f is not None else (1, 1) for f in scaling_factors]
+                # largest scale first, so smaller ones can be derived from it
+                decoded = {}
+                for scaling_factor in sorted(set(scaling_factors), key=lambda f: -f[0] / f[1]):
+                    # derive from the smallest scale possible
+                    for source, (scaled_width, scaled_height, planes) in reversed(list(decoded.items())):
+                        reduction = self.__power_of_two_reduction(source, scaling_factor)
+                        if reduction is not None:
+                            derived_width = -(-scaled_width // reduction)
+                            derived_height = -(-scaled_height // reduction)
+                            # the planes of the smaller image may need more
+                            # padding rows or columns than the reduced ones have
+                            decoded[scaling_factor] = (derived_width, derived_height, [
+                                self.__fit_plane(
+                                    self.__downscale_plane(plane, reduction),
+                                    self.__plane_height(i, derived_height, jpeg_subsample),
+                                    self.__plane_width(i, derived_width, jpeg_subsample))
+                                for i, plane in enumerate(planes)])
+                            break
+                    else:
+                        decoded[scaling_factor] = self.__decode_planes_to_scratch(
+                            decompress_handle, src_addr, jpeg_array.size, width, height,
+                            jpeg_subsample, scaling_factor, len(decoded), flags)
+                jpeg_bufs = {}
+                for scaling_factor, (scaled_width, scaled_height, planes) in decoded.items():
+                    jpeg_bufs[scaling_factor] = self.__encode_planes(
+                        compress_handle, planes, scaled_width, scaled_height,
+                        jpeg_subsample, quality, flags)
+                return [jpeg_bufs[f] for f in scaling_factors]
+            finally:
+                self.__compress_pool.release(compress_handle)
+        finally:
+            self.__decompress_pool.release(decompress_handle)
+
+    def __decode_planes_to_scratch(self, handle, src_addr, jpeg_array_size, width, height,
+                                   jpeg_subsample, scaling_factor, slot, flags):
+        """decodes JPEG memory buffer to yuv planes in a scratch buffer and
+           returns (scaled_width, scaled_height, planes)"""
+        scaled_width, scaled_height = self.__scaled_dimensions(width, height, scaling_factor)
+        num_planes = 1 if jpeg_subsample == TJSAMP_GRAY else 3
+        shapes = [(self.__plane_height(i, scaled_height, jpeg_subsample),
+                   self.__plane_width(i, scaled_width, jpeg_subsample)) for i in range(num_planes)]
+        scratch = self.__scratch(slot, sum(h * w for h, w in shapes))
+        planes = list()
+        offset = 0
+        for h, w in shapes:
+            planes.append(scratch[offset:offset + h * w].reshape(h, w))
+            offset += h * w
+        dest_addr = (POINTER(c_ubyte) * num_planes)(*[self.__getaddr(p) for p in planes])
+        strides_addr = (c_int * num_planes)(*[p.strides[0] for p in planes])
+
+        def decompress(handle):
+            return self.__decompressToYUVPlanes(
+                handle, src_addr, jpeg_array_size, dest_addr, scaled_width, strides_addr,
+                scaled_height, flags)
+
+        self.__check_decompress(decompress(handle), handle, self.__decompress_pool, decompress)
+        return scaled_width, scaled_height, planes
+
+    def __encode_planes(self, handle, planes, width, height, jpeg_subsample, quality, flags):
+        """encodes yuv planes to JPEG memory buffer"""
+        num_planes = len(planes)
+        src_addr = (POINTER(c_ubyte) * num_planes)(*[self.__getaddr(p) for p in planes])
+        strides_addr = (c_int * num_planes)(*[p.strides[0] for p in planes])
+        jpeg_buf = c_void_p()
+        jpeg_size = c_ulong()
+        status = self.__compressFromYUVPlanes(
+            handle, src_addr, width, strides_addr, height, jpeg_subsample,
+            byref(jpeg_buf), byref(jpeg_size), quality, flags)
+        try:
             if status != 0:
                 self.__report_error(handle)
-            dest_buf = create_string_buffer(jpeg_size.value)
-            memmove(dest_buf, jpeg_buf.value, jpeg_size.value)
-            self.__free(jpeg_buf)
-            return dest_buf.raw
         finally:
-            self.__destroy(handle)
+            jpeg_data = self.__take_jpeg_buffer(jpeg_buf, jpeg_size.value)
+        return jpeg_data
+
+    def __scratch(self, slot, size):
+        """returns a uint8 scratch buffer of size bytes, reused by the
+           calling thread for the same slot"""
+        buffers = getattr(self.__scratch_local, 'buffers', None)
+        if buffers is None:
+            buffers = self.__scratch_local.buffers = {}
+        buffer = buffers.get(slot)
+        if buffer is None or buffer.size < size:
+            buffer = buffers[slot] = np.empty(size, dtype=np.uint8)
+        return buffer[:size]
+
+    @staticmethod
+    def __power_of_two_reduction(source, target):
+        """returns k if target equals source / k for a power of two k > 1"""
+        num = source[0] * target[1]
+        denom = source[1] * target[0]
+        if num % denom != 0:
+            return None
+        reduction = num // denom
+        if reduction < 2 or reduction & (reduction - 1):
+            return None
+        return reduction
+
+    @staticmethod
+    def __fit_plane(plane, height, width):
+        """returns a yuv plane of exactly height x width, repeating its last
+           row and column or dropping the excess ones"""
+        h, w = plane.shape
+        if h < height or w < width:
+            plane = np.pad(plane, ((0, max(height - h, 0)), (0, max(width - w, 0))), mode='edge')
+        return plane[:height, :width]
+
+    @staticmethod
+    def __downscale_plane(plane, k):
+        """box-filters a yuv plane by a power of two k in steps of two,
+           rounding up its dimensions like DCT scaling does"""
+        while k > 1:
+            h, w = plane.shape
+            if h % 2 or w % 2:
+                plane = np.pad(plane, ((0, h % 2), (0, w % 2)), mode='edge')
+            sums = plane[0::2, 0::2].astype(np.uint16)
+            sums += plane[1::2, 0::2]
+            sums += plane[0::2, 1::2]
+            sums += plane[1::2, 1::2]
+            sums += 2
+            sums >>= 2
+            plane = sums.astype(np.uint8)
+            k //= 2
+        return plane
+
+    def transform(self, jpeg_buf, ops, flags=0):
+        """losslessly transforms a jpeg image in the DCT domain, without
+           decoding it. ops is a list of TransformOp, or of bare TJXOP_*
+           values; all outputs are produced by a single tjTransform call.
+           Without TJXOPT_TRIM or TJXOPT_PERFECT, partial MCUs at the right
+           and bottom edges are left untransformed.
+           Returns one JPEG memory buffer per op.
+        """
+        ops = [op if isinstance(op, TransformOp) else TransformOp(op) for op in ops]
+        if not ops:
+            return []
+        transforms = (TransformStruct * len(ops))()
+        for i, op in enumerate(ops):
+            options = op.options
+            region = CroppingRegion()
+            if op.region is not None:
+                region = CroppingRegion(*op.region)
+                options |= TJXOPT_CROP
+            transforms[i] = TransformStruct(region, op.op, options)
+        jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
+        # libjpeg-turbo only warns about a datastream without an image and
+        # returns empty outputs
+        if not JPEGIndex.has_image(jpeg_array):
+            raise IOError('JPEG datastream contains no image')
+        handle = self.__transform_pool.acquire()
+        try:
+            src_addr = self.__getaddr(jpeg_array)
+            dest_array = (c_void_p * len(ops))()
+            dest_size = (c_ulong * len(ops))()
+            status = self.__transform(
+                handle, src_addr, jpeg_array.size, len(ops), dest_array, dest_size,
+                transforms, flags)
+            try:
+                if status != 0:
+                    self.__report_error(handle)
+            finally:
+                results = [
+                    self.__take_jpeg_buffer(dest_array[i], dest_size[i])
+                    for i in range(len(ops))
+                ]
+            return results
+        finally:
+            self.__transform_pool.release(handle)
 
-    def crop(self, jpeg_buf, x, y, w, h, preserve=False, gray=False):
-        """losslessly crop a jpeg image with optional grayscale"""
-        handle = self.__init_transform()
+    def crop(self, jpeg_buf, x, y, w, h, preserve=False, gray=False, jpeg_index=None):
+        """losslessly crop a jpeg image with optional grayscale.
+           jpeg_index is an optional JPEGIndex of jpeg_buf to reuse.
+        """
+        if jpeg_index is None:
+            jpeg_index = JPEGIndex.parse(jpeg_buf)
+        jpeg_subsample = self.__check_transform_subsample(jpeg_index)
+        handle = self.__transform_pool.acquire()
         try:
             jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
             src_addr = self.__getaddr(jpeg_array)
-            width = c_int()
-            height = c_int()
-            jpeg_colorspace = c_int()
-            jpeg_subsample = c_int()
-            status = self.__decompress_header(
-                handle, src_addr, jpeg_array.size, byref(width), byref(height),
-                byref(jpeg_subsample), byref(jpeg_colorspace))
-            if status != 0:
-                self.__report_error(handle)
             x, w = self.__axis_to_image_boundaries(
-                x, w, width.value, preserve, tjMCUWidth[jpeg_subsample.value])
+                x, w, jpeg_index.width, preserve, tjMCUWidth[jpeg_subsample])
             y, h = self.__axis_to_image_boundaries(
-                y, h, height.value, preserve, tjMCUHeight[jpeg_subsample.value])
+                y, h, jpeg_index.height, preserve, tjMCUHeight[jpeg_subsample])
             dest_array = c_void_p()
             dest_size = c_ulong()
             region = CroppingRegion(x, y, w, h)
@@ -578,16 +2272,16 @@ class TurboJPEG(object):
             status = self.__transform(
                 handle, src_addr, jpeg_array.size, 1, byref(dest_array), byref(dest_size),
                 byref(crop_transform), 0)
-            dest_buf = create_string_buffer(dest_size.value)
-            memmove(dest_buf, dest_array.value, dest_size.value)
-            self.__free(dest_array)
-            if status != 0:
-                self.__report_error(handle)
-            return dest_buf.raw
+            try:
+                if status != 0:
+                    self.__report_error(handle)
+            finally:
+                jpeg_data = self.__take_jpeg_buffer(dest_array, dest_size.value)
+            return jpeg_data
         finally:
-            self.__destroy(handle)
+            self.__transform_pool.release(handle)
 
-    def crop_multiple(self, jpeg_buf, crop_parameters, background_luminance=1.0, gray=False):
+    def crop_multiple(self, jpeg_buf, crop_parameters, background_luminance=1.0, gray=False, jpeg_index=None):
         """Lossless crop and/or extension operations on jpeg image.
         Crop origin(s) needs be divisable by the MCU block size and inside
         the input image, or OSError: Invalid crop request is raised.
@@ -604,34 +2298,23 @@ class TurboJPEG(object):
             Default to 1, resulting in white background.
         gray: bool
             Produce greyscale output
+        jpeg_index: Optional[JPEGIndex]
+            Index of jpeg_buf to reuse instead of parsing the header again.
 
         Returns
         ----------
         List[bytes]
             Cropped and/or extended jpeg images.
         """
-        handle = self.__init_transform()
+        # Parse the header once to get input image size and quantization
+        if jpeg_index is None:
+            jpeg_index = JPEGIndex.parse(jpeg_buf)
+        self.__check_transform_subsample(jpeg_index)
+        handle = self.__transform_pool.acquire()
         try:
             jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
             src_addr = self.__getaddr(jpeg_array)
-            image_width = c_int()
-            image_height = c_int()
-            jpeg_subsample = c_int()
-            jpeg_colorspace = c_int()
-
-            # Decompress header to get input image size and subsample value
-            decompress_header_status = self.__decompress_header(
-                handle,
-                src_addr,
-                jpeg_array.size,
-                byref(image_width),
-                byref(image_height),
-                byref(jpeg_subsample),
-                byref(jpeg_colorspace)
-            )
-
-            if decompress_header_status != 0:
-                self.__report_error(handle)
+            background_dc = None
 
             # Define cropping regions from input parameters and image size
             crop_regions = self.__define_cropping_regions(crop_parameters)
@@ -643,17 +2326,19 @@ class TurboJPEG(object):
                 # The fill_background callback is slow, only use it if needed
                 if self.__need_fill_background(
                     crop_region,
-                    (image_width.value, image_height.value),
+                    (jpeg_index.width, jpeg_index.height),
                     background_luminance
                 ):
-                    # Use callback to fill in background post-transform
-                    callback_data = BackgroundStruct(
-                        image_width,
-                        image_height,
-                        self.__map_luminance_to_dc_dct_coefficient(
-                            bytearray(jpeg_buf),
+                    if background_dc is None:
+                        background_dc = self.__map_luminance_to_dc_dct_coefficient(
+                            jpeg_index,
                             background_luminance
                         )
+                    # Use callback to fill in background post-transform
+                    callback_data = BackgroundStruct(
+                        jpeg_index.width,
+                        jpeg_index.height,
+                        background_dc
                     )
                     callback = CUSTOMFILTER(fill_background)
                     crop_transforms[i] = TransformStruct(
@@ -686,51 +2371,196 @@ class TurboJPEG(object):
                 TJFLAG_ACCURATEDCT
             )
 
-            if transform_status != 0:
-                self.__report_error(handle)
-
-            # Copy the transform results into python bytes
-            results = []
-            for i in range(number_of_operations):
-                dest_buf = create_string_buffer(dest_size[i])
-                memmove(dest_buf, dest_array[i], dest_size[i])
-                results.append(dest_buf.raw)
-
-            # Free the output image buffers
-            for dest in dest_array:
-                self.__free(dest)
+            try:
+                if transform_status != 0:
+                    self.__report_error(handle)
+            finally:
+                # Copy the transform results into python bytes and free the
+                # output image buffers
+                results = [
+                    self.__take_jpeg_buffer(dest_array[i], dest_size[i])
+                    for i in range(number_of_operations)
+                ]
 
             return results
 
         finally:
-            self.__destroy(handle)
-
-    def __get_header_and_dimensions(self, handle, jpeg_array_size, src_addr, scaling_factor):
+            self.__transform_pool.release(handle)
+
+    def decode_stream(self, stream, every_nth=1, skip=0, out=None, pixel_format=TJPF_BGR,
+                      scaling_factor=None, flags=0, chunk_size=65536):
+        """lazily decodes the JPEG images of a concatenated (MJPEG) binary
+           stream, e.g. a recorded session or camera dump, in constant memory.
+           The first skip images are dropped, then every every_nth image is
+           decoded; skipped images are only split off, never decoded. out is
+           passed to decode_into, e.g. a FrameRing, to avoid allocations.
+        """
+        if every_nth < 1:
+            raise ValueError('every_nth must be at least 1')
+        for i, jpeg_buf in enumerate(iter_mjpeg(stream, chunk_size)):
+            if i < skip or (i - skip) % every_nth != 0:
+                continue
+            yield self.decode_into(jpeg_buf, out, pixel_format, scaling_factor, flags)
+
+    def decode_batch(self, jpeg_bufs, pixel_format=TJPF_BGR, scaling_factor=None, flags=0):
+        """decodes JPEG memory buffers in parallel on the worker threads.
+           Returns a list in input order holding, for each buffer, either the
+           decoded numpy array or the exception raised while decoding it.
+        """
+        return self.__run_batch(
+            self.decode,
+            [(jpeg_buf, pixel_format, scaling_factor, flags) for jpeg_buf in jpeg_bufs])
+
+    def encode_batch(self, img_arrays, quality=85, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_422, flags=0):
+        """encodes numpy arrays in parallel on the worker threads.
+           Returns a list in input order holding, for each array, either the
+           JPEG memory buffer or the exception raised while encoding it.
+        """
+        return self.__run_batch(
+            self.encode,
+            [(img_array, quality, pixel_format, jpeg_subsample, flags) for img_array in img_arrays])
+
+    def transform_batch(self, jpeg_bufs, ops, flags=0):
+        """transforms JPEG memory buffers in parallel on the worker threads.
+           Returns a list in input order holding, for each buffer, either the
+           list of transformed JPEG memory buffers or the exception raised.
+        """
+        return self.__run_batch(
+            self.transform, [(jpeg_buf, ops, flags) for jpeg_buf in jpeg_bufs])
+
+    def __run_batch(self, func, args_list):
+        """runs func once per argument tuple on the worker threads and returns
+           results or exceptions in input order"""
+        executor = self.__get_executor()
+        futures = [executor.submit(func, *args) for args in args_list]
+        results = []
+        for future in futures:
+            error = future.exception()
+            results.append(future.result() if error is None else error)
+        return results
+
+    def __get_executor(self):
+        """returns the batch worker thread pool, creating it on first use"""
+        with self.__executor_lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(
+                    max_workers=self.__max_workers, thread_name_prefix='turbojpeg')
+            return self.__executor
+
+    def __get_header_and_dimensions(self, handle, jpeg_array, src_addr, scaling_factor):
         """returns scaled image dimensions and header data"""
-        if scaling_factor is not None and \
-            scaling_factor not in self.__scaling_factors:
-            raise ValueError('supported scaling factors are ' +
-                str(self.__scaling_factors))
         width = c_int()
         height = c_int()
         jpeg_colorspace = c_int()
         jpeg_subsample = c_int()
         status = self.__decompress_header(
-            handle, src_addr, jpeg_array_size, byref(width), byref(height),
+            handle, src_addr, jpeg_array.size, byref(width), byref(height),
             byref(jpeg_subsample), byref(jpeg_colorspace))
         if status != 0:
-            self.__report_error(handle)
-        scaled_width = width.value
-        scaled_height = height.value
-        if scaling_factor is not None:
-            def get_scaled_value(dim, num, denom):
-                return (dim * num + denom - 1) // denom
-            scaled_width = get_scaled_value(
-                scaled_width, scaling_factor[0], scaling_factor[1])
-            scaled_height = get_scaled_value(
-                scaled_height, scaling_factor[0], scaling_factor[1])
+            header = self.__report_header_error(handle, src_addr, jpeg_array.size)
+        else:
+            header = (width.value, height.value, jpeg_subsample.value, jpeg_colorspace.value)
+        self.__check_header(handle, jpeg_array, header)
+        width, height, jpeg_subsample, jpeg_colorspace = header
+        scaled_width, scaled_height = self.__scaled_dimensions(width, height, scaling_factor)
         return scaled_width, scaled_height, jpeg_subsample, jpeg_colorspace
 
+    def __scaled_dimensions(self, width, height, scaling_factor):
+        """returns image dimensions scaled by scaling_factor"""
+        if scaling_factor is None:
+            return width, height
+        if scaling_factor not in self.__scaling_factors:
+            raise ValueError('supported scaling factors are ' +
+                str(self.__scaling_factors))
+        def get_scaled_value(dim, num, denom):
+            return (dim * num + denom - 1) // denom
+        return (get_scaled_value(width, scaling_factor[0], scaling_factor[1]),
+                get_scaled_value(height, scaling_factor[0], scaling_factor[1]))
+
+    def __output_array(self, out, shape):
+        """returns the array to decode into: a new one if out is None, the
+           next one of a FrameRing, or out itself after validation"""
+        if out is None:
+            return np.empty(shape, dtype=np.uint8)
+        if isinstance(out, FrameRing):
+            return out.acquire(shape)
+        self.__check_output_array(out, shape)
+        return out
+
+    @staticmethod
+    def __check_output_array(out, shape, min_width=False):
+        """raises ValueError if out cannot be written as an image of shape.
+           Rows may be padded, but items within a row must be contiguous."""
+        if not isinstance(out, np.ndarray) or out.dtype != np.uint8:
+            raise ValueError('output array must be a numpy array of dtype uint8')
+        if not out.flags.writeable:
+            raise ValueError('output array is read-only')
+        if out.ndim != len(shape) or out.shape[0] != shape[0] or \
+            (out.shape[1:] != shape[1:] and
+                not (min_width and out.shape[1] >= shape[1])):
+            raise ValueError('output array has shape {}, expected {}'.format(
+                out.shape, shape))
+        if out.ndim == 1:
+            contiguous = out.flags.c_contiguous
+        else:
+            inner_strides = (out.shape[2], 1) if out.ndim == 3 else (1,)
+            contiguous = out.strides[1:] == inner_strides and \
+                out.strides[0] >= out.shape[1] * inner_strides[0]
+        if not contiguous:
+            raise ValueError('output array rows must be contiguous')
+
+    @staticmethod
+    def __check_image_array(img_array, pixel_format):
+        """returns (height, width) of an image array to encode"""
+        height, width = img_array.shape[:2]
+        channel = tjPixelSize[pixel_format]
+        if channel > 1 and (len(img_array.shape) < 3 or img_array.shape[2] != channel):
+            raise ValueError('Invalid shape for image data')
+        return height, width
+
+    def __check_yuv_array(self, img_array, width, height, pad, jpeg_subsample):
+        """raises ValueError if img_array is too small for a packed yuv image"""
+        required_size = self.__buffer_size_YUV2(width, pad, height, jpeg_subsample)
+        if img_array.size * img_array.itemsize < required_size:
+            raise ValueError('yuv array holds {} bytes, {} required for pad {}'.format(
+                img_array.size * img_array.itemsize, required_size, pad))
+
+    def __check_yuv_planes(self, planes, width, height, jpeg_subsample):
+        """raises ValueError if planes cannot be encoded as a yuv image"""
+        num_planes = 1 if jpeg_subsample == TJSAMP_GRAY else 3
+        if len(planes) != num_planes:
+            raise ValueError('expected {} planes, got {}'.format(num_planes, len(planes)))
+        for i, plane in enumerate(planes):
+            plane_width = self.__plane_width(i, width, jpeg_subsample)
+            plane_height = self.__plane_height(i, height, jpeg_subsample)
+            if not isinstance(plane, np.ndarray) or plane.dtype != np.uint8 or plane.ndim != 2:
+                raise ValueError('planes must be 2-D numpy arrays of dtype uint8')
+            if plane.shape[0] != plane_height or plane.shape[1] < plane_width:
+                raise ValueError('plane {} has shape {}, expected ({}, {})'.format(
+                    i, plane.shape, plane_height, plane_width))
+            if plane.strides[1] != 1 or plane.strides[0] < plane.shape[1]:
+                raise ValueError('plane {} rows must be contiguous'.format(i))
+
+    def __jpeg_output_array(self, out, width, height, jpeg_subsample):
+        """returns out as a uint8 array after checking that it can hold any
+           JPEG image of the given dimensions"""
+        out_array = np.frombuffer(out, dtype=np.uint8)
+        if not out_array.flags.writeable:
+            raise ValueError('output buffer is read-only')
+        required_size = self.__buffer_size(width, height, jpeg_subsample)
+        if out_array.size < required_size:
+            raise ValueError('output buffer holds {} bytes, {} required'.format(
+                out_array.size, required_size))
+        return out_array
+
+    def __take_jpeg_buffer(self, jpeg_buf, jpeg_size):
+        """copies a JPEG buffer allocated by libjpeg-turbo into bytes and
+           frees it"""
+        try:
+            return string_at(jpeg_buf, jpeg_size)
+        finally:
+            self.__free(jpeg_buf)
+
     def __axis_to_image_boundaries(self, a, b, img_boundary, preserve, mcuBlock):
         img_b = img_boundary - (img_boundary % mcuBlock)
         delta_a = a % mcuBlock
@@ -793,82 +2623,7 @@ class TurboJPEG(object):
         )
 
     @staticmethod
-    def __find_dqt(jpeg_data, dqt_index):
-        """Return byte offset to quantification table with index dqt_index in
-        jpeg_data.
-
-        Parameters
-        ----------
-        jpeg_data: bytes
-            Jpeg data.
-        dqt_index: int
-            Index of quantificatin table to find (0 - luminance).
-
-        Returns
-        ----------
-        Optional[int]
-            Byte offset to quantification table, or None if not found.
-        """
-        offset = 0
-        while offset < len(jpeg_data):
-            dct_table_offset = jpeg_data[offset:].find(b'\xFF\xDB')
-            if dct_table_offset == -1:
-                break
-            dct_table_offset += offset
-            dct_table_length = unpack(
-                '>H',
-                jpeg_data[dct_table_offset+2:dct_table_offset+4]
-            )[0]
-            dct_table_id_offset = dct_table_offset + 4
-            table_index, _ = split_byte_into_nibbles(
-                jpeg_data[dct_table_id_offset]
-            )
-            if table_index == dqt_index:
-                return dct_table_offset
-            offset += dct_table_offset+dct_table_length
-        return None
-
-    @classmethod
-    def __get_dc_dqt_element(cls, jpeg_data, dqt_index):
-        """Return dc quantification element from jpeg_data for quantification
-        table dqt_index.
-
-        Parameters
-        ----------
-        jpeg_data: bytes
-            Jpeg data containing quantification table(s).
-        dqt_index: int
-            Index of quantificatin table to get (0 - luminance).
-
-        Returns
-        ----------
-        int
-            Dc quantification element.
-        """
-        dqt_offset = cls.__find_dqt(jpeg_data, dqt_index)
-        if dqt_offset is None:
-            raise ValueError(
-                "Quantisation table {dqt_index} not found in header".format(
-                    dqt_index=dqt_index)
-            )
-        precision_offset = dqt_offset+4
-        precision = split_byte_into_nibbles(jpeg_data[precision_offset])[0]
-        if precision == 0:
-            unpack_type = '>b'
-        elif precision == 1:
-            unpack_type = '>h'
-        else:
-            raise ValueError('Not valid precision definition in dqt')
-        dc_offset = dqt_offset + 5
-        dc_length = calcsize(unpack_type)
-        dc_value = unpack(
-            unpack_type,
-            jpeg_data[dc_offset:dc_offset+dc_length]
-        )[0]
-        return dc_value
-
-    @classmethod
-    def __map_luminance_to_dc_dct_coefficient(cls, jpeg_data, luminance):
+    def __map_luminance_to_dc_dct_coefficient(jpeg_index, luminance):
         """Map a luminance level (0 - 1) to quantified dc dct coefficient.
         Before quantification dct coefficient have a range -1024 - 1023. This
         is reduced upon quantification by the quantification factor. This
@@ -877,8 +2632,8 @@ class TurboJPEG(object):
 
         Parameters
         ----------
-        jpeg_data: bytes
-            Jpeg data containing quantification table(s).
+        jpeg_index: JPEGIndex
+            Index of the jpeg data containing quantification table(s).
         luminance: float
             Luminance level (0 - black, 1 - white).
 
@@ -888,18 +2643,89 @@ class TurboJPEG(object):
             Quantified luminance dc dct coefficent.
         """
         luminance = min(max(luminance, 0), 1)
-        dc_dqt_coefficient = cls.__get_dc_dqt_element(jpeg_data, 0)
+        dc_dqt_coefficient = jpeg_index.dc_quant(0)
         return int(round((luminance * 2047 - 1024) / dc_dqt_coefficient))
 
-    def __report_error(self, handle):
-        """reports error while error occurred"""
+    @staticmethod
+    def __check_transform_subsample(jpeg_index):
+        """returns the subsampling of an image to transform, raising IOError
+           if it is not supported"""
+        if jpeg_index.subsample == TJSAMP_UNKNOWN:
+            raise IOError('Could not determine subsampling type for JPEG image')
+        return jpeg_index.subsample
+
+    def __report_error(self, handle, error=None):
+        """reports error while error occurred. error is the error string if
+           it was read before another call could replace it"""
+        # libjpeg-turbo can report an error following a warning as a warning
+        # and keeps state from failed calls, so the handle is not reused
+        self.__failed_handles.add(handle)
+        if error is None:
+            error = self.__get_error_string(handle)
         if self.__get_error_code is not None:
             # using new error handling logic if possible
             if self.__get_error_code(handle) == TJERR_WARNING:
-                warnings.warn(self.__get_error_string(handle))
+                warnings.warn(error)
                 return
         # fatal error occurred
-        raise IOError(self.__get_error_string(handle))
+        raise IOError(error)
+
+    def __report_header_error(self, handle, src_addr, jpeg_array_size):
+        """reports a failed header decode. libjpeg-turbo reports an error
+           following a warning (e.g. a premature end of data) as a warning,
+           and a reused handle then still holds the header of its previous
+           image, so warnings are only passed on if a new handle can read
+           the header too. Returns the header read by the new handle."""
+        error = self.__get_error_string(handle)
+        fresh_handle = self.__init_decompress()
+        if not fresh_handle:
+            raise IOError('unable to initialize tjhandle')
+        try:
+            width = c_int()
+            height = c_int()
+            jpeg_subsample = c_int()
+            jpeg_colorspace = c_int()
+            self.__decompress_header(
+                fresh_handle, src_addr, jpeg_array_size, byref(width), byref(height),
+                byref(jpeg_subsample), byref(jpeg_colorspace))
+        finally:
+            self.__destroy(fresh_handle)
+        if width.value <= 0 or height.value <= 0:
+            self.__failed_handles.add(handle)
+            raise IOError(error)
+        # the header decode of the new handle resets the error string
+        self.__report_error(handle, error)
+        return width.value, height.value, jpeg_subsample.value, jpeg_colorspace.value
+
+    def __check_header(self, handle, jpeg_array, header):
+        """raises IOError unless header is the image header of jpeg_array.
+           The status of a header decode is not enough: for a tables-only or
+           empty datastream libjpeg-turbo returns success and leaves the
+           header of the previous image on a reused handle (or -1 with the
+           tj3 API), so the buffer must have a SOF marker and the dimensions
+           must be valid"""
+        width, height = header[:2]
+        if width < 1 or height < 1 or not JPEGIndex.has_image(jpeg_array):
+            self.__failed_handles.add(handle)
+            raise IOError('JPEG datastream contains no image')
+
+    def __check_decompress(self, status, handle, pool, decompress):
+        """reports the status of decompress(handle) on a pooled handle. A
+           warning there can hide an error following it and leave the output
+           unwritten, so the handle is discarded and decompress runs again on
+           a new handle, whose warnings are passed on"""
+        if status == 0:
+            return
+        key = pool.key(handle)
+        if self.__get_error_code is None or self.__get_error_code(key) != TJERR_WARNING:
+            self.__report_error(key)
+        self.__failed_handles.add(key)
+        fresh_handle = pool.create()
+        try:
+            if decompress(fresh_handle) != 0:
+                self.__report_error(pool.key(fresh_handle))
+        finally:
+            pool.destroy(fresh_handle)
 
     def __get_error_string(self, handle):
         """returns error string"""
@@ -909,25 +2735,6 @@ class TurboJPEG(object):
         # fallback to old interface
         return self.__get_error_str().decode()
 
-    def __find_turbojpeg(self):
-        """returns default turbojpeg library path if possible"""
-        lib_path = find_library('turbojpeg')
-        if lib_path is not None:
-            return lib_path
-        for lib_path in DEFAULT_LIB_PATHS[platform.system()]:
-            if os.path.exists(lib_path):
-                return lib_path
-        if platform.system() == 'Linux' and 'LD_LIBRARY_PATH' in os.environ:
-            ld_library_path = os.environ['LD_LIBRARY_PATH']
-            for path in ld_library_path.split(':'):
-                lib_path = os.path.join(path, 'libturbojpeg.so.0')
-                if os.path.exists(lib_path):
-                    return lib_path
-        raise RuntimeError(
-            'Unable to locate turbojpeg library automatically. '
-            'You may specify the turbojpeg library path manually.\n'
-            'e.g. jpeg = TurboJPEG(lib_path)')
-
     def __getaddr(self, nda):
         """returns the memory address for a given ndarray"""
         return cast(nda.__array_interface__['data'][0], POINTER(c_ubyte))
@@ -936,6 +2743,240 @@ class TurboJPEG(object):
     def scaling_factors(self):
         return self.__scaling_factors
 
+
+class DecodeCache(object):
+    """An opt-in LRU cache in front of TurboJPEG.decode and decode_header.
+
+    Entries are keyed by a hash of the JPEG data plus the decode parameters
+    and evicted least recently used first once the cached arrays exceed
+    max_bytes. Cached arrays are returned read-only and shared between
+    callers; copy them before modifying.
+
+    Parameters
+    ----------
+    jpeg: TurboJPEG
+        Decoder used on cache misses.
+    max_bytes: int
+        Byte budget of the cached arrays.
+    """
+
+    # nominal size accounted for a cached header tuple
+    HEADER_ENTRY_SIZE = 64
+
+    def __init__(self, jpeg, max_bytes=64 * 1024 * 1024):
+        self.__jpeg = jpeg
+        self.__max_bytes = max_bytes
+        self.__entries = OrderedDict()
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def decode(self, jpeg_buf, pixel_format=TJPF_BGR, scaling_factor=None, flags=0):
+        """decodes JPEG memory buffer to a read-only numpy array, reusing a
+           cached result for identical data and parameters"""
+        # TurboJPEG.decode also accepts a list as scaling_factor
+        if scaling_factor is not None:
+            scaling_factor = tuple(scaling_factor)
+        key = (self.__digest(jpeg_buf), 'decode', pixel_format, scaling_factor, flags)
+        img_array = self.__get(key)
+        if img_array is None:
+            img_array = self.__jpeg.decode(jpeg_buf, pixel_format, scaling_factor, flags)
+            img_array.flags.writeable = False
+            self.__put(key, img_array, img_array.nbytes)
+        return img_array
+
+    def decode_header(self, jpeg_buf):
+        """decodes JPEG header, reusing a cached result for identical data"""
+        key = (self.__digest(jpeg_buf), 'decode_header')
+        header = self.__get(key)
+        if header is None:
+            header = self.__jpeg.decode_header(jpeg_buf)
+            self.__put(key, header, self.HEADER_ENTRY_SIZE)
+        return header
+
+    def clear(self):
+        """drops all cached entries"""
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def stats(self):
+        """returns the cache counters as a dict"""
+        with self.__lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.__entries),
+                'bytes': self.__bytes,
+                'max_bytes': self.__max_bytes,
+            }
+
+    @staticmethod
+    def __digest(jpeg_buf):
+        """returns a fast content hash of a JPEG memory buffer"""
+        return hashlib.blake2b(jpeg_buf, digest_size=16).digest()
+
+    def __get(self, key):
+        """returns the cached value for key, or None, updating the counters"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def __put(self, key, value, size):
+        """caches value, evicting least recently used entries over budget"""
+        if size > self.__max_bytes:
+            return
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.__bytes -= previous[1]
+            self.__entries[key] = (value, size)
+            self.__bytes += size
+            while self.__bytes > self.__max_bytes:
+                _, (_, evicted_size) = self.__entries.popitem(last=False)
+                self.__bytes -= evicted_size
+                self.evictions += 1
+
+
+class RateController(object):
+    """Per-stream JPEG rate control towards a byte budget per frame.
+
+    Each frame is encoded with TurboJPEG.encode_to_size, warm-started from
+    the quality chosen for the previous frame, so consecutive frames of a
+    stream usually need one or two trial encodes.
+
+    Parameters
+    ----------
+    jpeg: TurboJPEG
+        Encoder used for the trial encodes.
+    target_bytes: int
+        Byte budget of an encoded frame.
+    quality: int
+        Starting quality of the first frame.
+    tolerance: float
+        Accepted relative shortfall below target_bytes.
+    max_trials: int
+        Maximum number of encodes per frame.
+    min_quality, max_quality: int
+        Quality search range.
+    """
+
+    def __init__(self, jpeg, target_bytes, quality=85, tolerance=0.1, max_trials=8,
+                 min_quality=5, max_quality=95):
+        self.__jpeg = jpeg
+        self.target_bytes = target_bytes
+        self.tolerance = tolerance
+        self.max_trials = max_trials
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.quality = quality
+        self.last_size = None
+
+    def encode(self, img_array, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_422, flags=0):
+        """encodes numpy array within the byte budget and returns the JPEG
+           memory buffer; quality and last_size report the chosen encode"""
+        jpeg_buf, self.quality = self.__jpeg.encode_to_size(
+            img_array, self.target_bytes, self.quality, pixel_format, jpeg_subsample, flags,
+            self.tolerance, self.max_trials, self.min_quality, self.max_quality)
+        self.last_size = len(jpeg_buf)
+        return jpeg_buf
+
+
+class AsyncTurboJPEG(object):
+    """An asyncio facade over TurboJPEG.
+
+    The awaitable methods run the blocking calls on a dedicated thread pool,
+    so decoding overlaps with network I/O on the event loop. Each worker uses
+    its own pooled tjhandle. At most max_concurrency calls run at a time;
+    cancelling a call that is still queued drops it without running it, and
+    a call that already started keeps its slot until the C call returns.
+
+    Parameters
+    ----------
+    jpeg: Optional[TurboJPEG]
+        Instance to run the calls on; by default one is created with
+        lib_path and closed by close().
+    max_workers: Optional[int]
+        Number of worker threads, defaults to the number of CPUs.
+    max_concurrency: Optional[int]
+        Maximum number of calls running or queued on the workers, defaults
+        to max_workers.
+    lib_path: Optional[str]
+        libturbojpeg path used when jpeg is not given.
+    """
+    def __init__(self, jpeg=None, max_workers=None, max_concurrency=None, lib_path=None):
+        max_workers = max_workers or os.cpu_count() or 1
+        self.__owns_jpeg = jpeg is None
+        self.__jpeg = TurboJPEG(lib_path, max_workers=max_workers) if jpeg is None else jpeg
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='turbojpeg-async')
+        self.__semaphore = asyncio.Semaphore(max_concurrency or max_workers)
+
+    async def decode_header(self, jpeg_buf):
+        """see TurboJPEG.decode_header"""
+        return await self.__run(self.__jpeg.decode_header, jpeg_buf)
+
+    async def decode(self, jpeg_buf, pixel_format=TJPF_BGR, scaling_factor=None, flags=0):
+        """see TurboJPEG.decode"""
+        return await self.__run(self.__jpeg.decode, jpeg_buf, pixel_format, scaling_factor, flags)
+
+    async def encode(self, img_array, quality=85, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_422, flags=0):
+        """see TurboJPEG.encode"""
+        return await self.__run(
+            self.__jpeg.encode, img_array, quality, pixel_format, jpeg_subsample, flags)
+
+    async def crop(self, jpeg_buf, x, y, w, h, preserve=False, gray=False, jpeg_index=None):
+        """see TurboJPEG.crop"""
+        return await self.__run(
+            self.__jpeg.crop, jpeg_buf, x, y, w, h, preserve, gray, jpeg_index)
+
+    async def transform(self, jpeg_buf, ops, flags=0):
+        """see TurboJPEG.transform"""
+        return await self.__run(self.__jpeg.transform, jpeg_buf, ops, flags)
+
+    def close(self):
+        """cancels queued calls, waits for running ones and releases the
+           TurboJPEG instance if it was created here"""
+        self.__executor.shutdown(wait=True, cancel_futures=True)
+        if self.__owns_jpeg:
+            self.__jpeg.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def __run(self, func, *args):
+        """runs func on the worker threads once a concurrency slot is free"""
+        await self.__semaphore.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.__executor.submit(func, *args)
+        except BaseException:
+            self.__semaphore.release()
+            raise
+        # release the slot when the worker is done with the call, which may
+        # be after the awaiting task was cancelled
+        future.add_done_callback(lambda _: self.__release_from_worker(loop))
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def __release_from_worker(self, loop):
+        """releases a concurrency slot from a worker thread"""
+        try:
+            loop.call_soon_threadsafe(self.__semaphore.release)
+        except RuntimeError:
+            # the event loop is already closed
+            pass
+
 if __name__ == '__main__':
     jpeg = TurboJPEG()
     in_file = open('input.jpg', 'rb')
@@ -0,0 +1,161 @@
+"""
+Micro-batching of NLU inference requests.
+
+Sessions sharing one NLU model (e.g. one per robot) each send one InferenceRequest per transcript,
+which is one forward pass with batch size 1. MicroBatcher sits in front of NLU.request: it collects
+the requests of concurrent callers for up to max_wait seconds or max_batch_size requests, runs them
+with a single run_batch call and hands every caller its own InferenceResult.
+
+max_wait is the latency/throughput knob. With 0 no latency is added and only the requests that
+queued up while the previous batch ran are batched; larger values wait for more callers to fill a
+batch at the cost of up to max_wait seconds per request.
+
+Fewer forward passes need a run_batch with one padded forward pass over the batch. The NLU
+component has no batch request, and per_request still runs one forward pass per transcript, so in
+front of the component the batcher only adds a thread hop and serializes the requests of the
+sessions. demo_asr_nlu.py therefore calls the component directly. MicroBatcher is meant for an
+in-process model with a batched forward pass; the throughput gain measured by bench_nlu_batching.py
+is that of a synthetic padded-batch model, which returns (intent, score) tuples rather than
+InferenceResults, and is not demonstrated on the NLU component.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+def per_request(nlu):
+    """
+    Returns a run_batch function sending one request per item, for NLU components without a batch
+    endpoint. Batching then saves no forward passes. A failed request only fails its own caller.
+    """
+
+    def run_batch(requests):
+        results = []
+        for request in requests:
+            try:
+                results.append(nlu.request(request))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    return run_batch
+
+
+class MicroBatcher:
+    """
+    Collects requests of concurrent callers into batches for run_batch.
+
+    :param run_batch: called with a list of requests, returns their results in the same order, e.g.
+        one padded forward pass over all transcripts. A result that is an exception is raised to
+        the caller of that request only; an exception raised by run_batch fails the whole batch.
+    :param max_batch_size: the most requests passed to one run_batch call
+    :param max_wait: seconds the first request of a batch waits for more requests
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait=0.005):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_wait < 0:
+            raise ValueError("max_wait must not be negative")
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._requests = 0
+        self._batches = 0
+        self._largest_batch = 0
+        self._worker = threading.Thread(
+            target=self._run, name="MicroBatcher", daemon=True
+        )
+        self._worker.start()
+
+    def request(self, request, timeout=None):
+        """Blocks until the result of request is available, like NLU.request."""
+        return self.submit(request).result(timeout)
+
+    def submit(self, request):
+        """Queues request and returns a Future of its result."""
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._pending.append((request, future))
+            self._condition.notify()
+        return future
+
+    def stats(self):
+        with self._condition:
+            return {
+                "requests": self._requests,
+                "batches": self._batches,
+                "mean_batch_size": (
+                    self._requests / self._batches if self._batches else 0.0
+                ),
+                "largest_batch": self._largest_batch,
+            }
+
+    def close(self):
+        """Runs the pending requests and stops the worker thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _next_batch(self):
+        """Waits for a full batch or max_wait, returns None once closed and drained."""
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            size = min(len(self._pending), self.max_batch_size)
+            return [self._pending.popleft() for _ in range(size)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # callers may have cancelled their futures while waiting
+            batch = [
+                (request, future)
+                for request, future in batch
+                if future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            try:
+                results = self.run_batch([request for request, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"run_batch returned {len(results)} results for {len(batch)} requests"
+                    )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    if isinstance(result, BaseException):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+            with self._condition:
+                self._requests += len(batch)
+                self._batches += 1
+                self._largest_batch = max(self._largest_batch, len(batch))
@@ -0,0 +1,136 @@
+"""
+Cache of NLU results for repeated utterances.
+
+Dialogs with a social robot repeat the same short commands ("yes", "no", "stop", "hello") over and
+over. NLUResultCache keeps the InferenceResult per normalized transcript, so a repeated utterance
+is answered without another forward pass. Entries are evicted least recently used beyond
+max_entries and expire ttl seconds after they were stored.
+
+The cache key includes the identity of the model checkpoint and the ontology (path, modification
+time and size), so all entries are dropped when either file changes.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_WORD = re.compile(r"[\w']+")
+
+
+def normalize_transcript(text):
+    """Lowercases text and drops punctuation and extra whitespace, " Yes." becomes "yes"."""
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def file_identity(path):
+    """(path, modification time, size) of a file, or (path, None, None) if it is missing."""
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path, None, None
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+class NLUResultCache:
+    """
+    LRU + TTL cache of NLU results keyed by normalized transcript and model identity.
+
+    Cached results are shared between callers and must not be modified.
+
+    :param model_path: the NLUConf.model_path checkpoint
+    :param ontology_path: the NLUConf.ontology_path ontology
+    :param max_entries: the most results kept
+    :param ttl: seconds a result stays valid, None to keep results until evicted
+    :param check_interval: seconds between checks of the model and ontology files
+    """
+
+    def __init__(
+        self,
+        model_path,
+        ontology_path,
+        max_entries=1024,
+        ttl=3600.0,
+        check_interval=1.0,
+    ):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.model_path = model_path
+        self.ontology_path = ontology_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._identity = self._read_identity()
+        self._checked_at = time.monotonic()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, transcript, infer):
+        """
+        Returns the cached result for transcript, or calls infer() on a miss and caches its result.
+        """
+        key = normalize_transcript(transcript)
+        with self._lock:
+            identity = self._current_identity()
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at is None or time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return result
+                del self._entries[key]
+                self._expired += 1
+            self._misses += 1
+        # inference runs without the lock, so a concurrent miss on the same
+        # transcript runs it twice rather than waiting
+        result = infer()
+        with self._lock:
+            # the model may have changed while inferring
+            if identity == self._identity:
+                expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+                self._entries[key] = (expires_at, result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "expired": self._expired,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "entries": len(self._entries),
+            }
+
+    def _read_identity(self):
+        return file_identity(self.model_path), file_identity(self.ontology_path)
+
+    def _current_identity(self):
+        """Drops all entries if the model or ontology changed, checked every check_interval."""
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            identity = self._read_identity()
+            if identity != self._identity:
+                self._identity = identity
+                self._entries.clear()
+                self._invalidations += 1
+        return self._identity
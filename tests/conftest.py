@@ -0,0 +1,10 @@
+"""
+pytest configuration of the tests of the top level modules.
+
+usage: python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
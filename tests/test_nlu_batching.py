@@ -0,0 +1,162 @@
+"""
+Tests of MicroBatcher and per_request.
+"""
+
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from nlu_batching import MicroBatcher, per_request
+
+TIMEOUT = 5
+
+
+class GatedModel:
+    """run_batch recording its batches, which blocks each batch until released."""
+
+    def __init__(self, gated=True):
+        self.batches = []
+        self.started = threading.Semaphore(0)
+        self.gate = threading.Event()
+        if not gated:
+            self.gate.set()
+
+    def __call__(self, requests):
+        self.batches.append(list(requests))
+        self.started.release()
+        assert self.gate.wait(TIMEOUT)
+        return [request * 10 for request in requests]
+
+    def wait_started(self):
+        assert self.started.acquire(timeout=TIMEOUT)
+
+
+def test_batches_queued_requests():
+    model = GatedModel()
+    with MicroBatcher(model, max_batch_size=8, max_wait=0) as batcher:
+        first = batcher.submit(1)
+        model.wait_started()
+        futures = [batcher.submit(request) for request in (2, 3, 4)]
+        model.gate.set()
+        assert first.result(TIMEOUT) == 10
+        assert [future.result(TIMEOUT) for future in futures] == [20, 30, 40]
+    assert model.batches == [[1], [2, 3, 4]]
+    assert batcher.stats() == {
+        "requests": 4,
+        "batches": 2,
+        "mean_batch_size": 2.0,
+        "largest_batch": 3,
+    }
+
+
+def test_max_batch_size():
+    model = GatedModel()
+    with MicroBatcher(model, max_batch_size=2, max_wait=0) as batcher:
+        batcher.submit(0)
+        model.wait_started()
+        futures = [batcher.submit(request) for request in range(1, 6)]
+        model.gate.set()
+        assert [future.result(TIMEOUT) for future in futures] == [10, 20, 30, 40, 50]
+    assert model.batches == [[0], [1, 2], [3, 4], [5]]
+
+
+def test_max_wait_collects_callers():
+    model = GatedModel(gated=False)
+    # a full batch is run without waiting for max_wait
+    with MicroBatcher(model, max_batch_size=3, max_wait=TIMEOUT) as batcher:
+        futures = [batcher.submit(request) for request in (1, 2, 3)]
+        assert [future.result(TIMEOUT) for future in futures] == [10, 20, 30]
+    assert model.batches == [[1, 2, 3]]
+
+
+def test_request_blocks_for_result():
+    with MicroBatcher(GatedModel(gated=False)) as batcher:
+        assert batcher.request(7, timeout=TIMEOUT) == 70
+
+
+def test_exception_result_fails_its_request_only():
+    def run_batch(requests):
+        return [ValueError(request) if request < 0 else request for request in requests]
+
+    model = GatedModel()
+    with MicroBatcher(model, max_wait=0) as batcher:
+        batcher.submit(0)
+        model.wait_started()
+        batcher.run_batch = run_batch
+        futures = [batcher.submit(request) for request in (1, -2, 3)]
+        model.gate.set()
+        assert futures[0].result(TIMEOUT) == 1
+        with pytest.raises(ValueError):
+            futures[1].result(TIMEOUT)
+        assert futures[2].result(TIMEOUT) == 3
+
+
+def test_run_batch_exception_fails_batch():
+    def run_batch(requests):
+        raise RuntimeError("model failed")
+
+    with MicroBatcher(run_batch) as batcher:
+        with pytest.raises(RuntimeError, match="model failed"):
+            batcher.request(1, timeout=TIMEOUT)
+        # the worker keeps running
+        batcher.run_batch = GatedModel(gated=False)
+        assert batcher.request(2, timeout=TIMEOUT) == 20
+
+
+def test_result_count_mismatch_fails_batch():
+    with MicroBatcher(lambda requests: []) as batcher:
+        with pytest.raises(RuntimeError, match="returned 0 results for 1 requests"):
+            batcher.request(1, timeout=TIMEOUT)
+
+
+def test_cancelled_requests_are_not_run():
+    model = GatedModel()
+    with MicroBatcher(model, max_wait=0) as batcher:
+        batcher.submit(1)
+        model.wait_started()
+        cancelled = batcher.submit(2)
+        kept = batcher.submit(3)
+        assert cancelled.cancel()
+        model.gate.set()
+        assert kept.result(TIMEOUT) == 30
+        with pytest.raises(CancelledError):
+            cancelled.result(TIMEOUT)
+    assert model.batches == [[1], [3]]
+    assert batcher.stats()["requests"] == 2
+
+
+def test_close_runs_pending_requests():
+    model = GatedModel()
+    batcher = MicroBatcher(model, max_wait=0)
+    batcher.submit(1)
+    model.wait_started()
+    futures = [batcher.submit(request) for request in (2, 3)]
+    closer = threading.Thread(target=batcher.close)
+    closer.start()
+    model.gate.set()
+    closer.join(TIMEOUT)
+    assert not closer.is_alive()
+    assert [future.result(0) for future in futures] == [20, 30]
+    with pytest.raises(RuntimeError, match="closed"):
+        batcher.submit(4)
+
+
+@pytest.mark.parametrize(
+    "params", [{"max_batch_size": 0}, {"max_wait": -1}], ids=["batch", "wait"]
+)
+def test_invalid_parameters(params):
+    with pytest.raises(ValueError):
+        MicroBatcher(GatedModel(), **params)
+
+
+def test_per_request_fails_failed_item_only():
+    class NLU:
+        def request(self, request):
+            if request == "fail":
+                raise IOError("no reply")
+            return request.upper()
+
+    results = per_request(NLU())(["yes", "fail", "no"])
+    assert results[0] == "YES" and results[2] == "NO"
+    assert isinstance(results[1], IOError)
@@ -0,0 +1,94 @@
+"""
+Tests of the EnergyVAD noise floor and endpointing.
+"""
+
+import numpy as np
+import pytest
+
+from eval_vad_endpointing import match, noise_step, run_vad
+from vad_endpointing import EnergyVAD, StreamEndpointer
+
+SAMPLE_RATE = 16000
+NOISE_WINDOW_MS = 3000
+
+
+def utterance(envelope, duration, noise=50.0, lead=1.0, trail=2.0, seed=0):
+    """Returns int16 samples of noise with duration seconds of speech-like noise after lead."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int((lead + duration + trail) * SAMPLE_RATE)) / SAMPLE_RATE
+    audio = rng.standard_normal(len(t)) * noise
+    voiced = (t >= lead) & (t < lead + duration)
+    audio[voiced] += (
+        rng.standard_normal(voiced.sum()) * 4000.0 * envelope(t[voiced] - lead)
+    )
+    return np.clip(audio, -32768, 32767).astype(np.int16)
+
+
+@pytest.mark.parametrize("syllables_per_second", [2, 4, 6])
+def test_continuous_speech_longer_than_noise_window(syllables_per_second):
+    duration = 3 * NOISE_WINDOW_MS / 1000
+
+    def envelope(t):
+        # no pauses: the energy never drops to the noise
+        return 0.3 + 0.7 * np.abs(np.sin(np.pi * syllables_per_second * t))
+
+    samples = utterance(envelope, duration)
+    segments = run_vad(
+        samples, SAMPLE_RATE, chunk_ms=250, noise_window_ms=NOISE_WINDOW_MS
+    )
+    assert len(segments) == 1
+    assert segments[0].start == pytest.approx(1.0, abs=0.1)
+    assert segments[0].end == pytest.approx(1.0 + duration, abs=0.1)
+
+
+def test_noise_step_ends_segments():
+    samples, reference = noise_step(SAMPLE_RATE)
+    segments = run_vad(samples, SAMPLE_RATE, chunk_ms=250)
+    results = match(reference, segments)
+    assert not any(clipped or split for _, clipped, split in results)
+    assert len(segments) == len(reference)
+    for (_, end), (detected_at, _, _) in zip(reference, results):
+        assert detected_at - end < 1.0
+
+
+def test_noise_floor_follows_noise_step():
+    samples, _ = noise_step(SAMPLE_RATE)
+    vad = EnergyVAD(SAMPLE_RATE)
+    vad.process(samples[: 25 * SAMPLE_RATE])
+    quiet_floor = vad.noise_floor
+    vad.process(samples[25 * SAMPLE_RATE : 55 * SAMPLE_RATE])
+    assert vad.noise_floor > 5 * quiet_floor
+
+
+class Message:
+    """AudioMessage of the microphone connector."""
+
+    def __init__(self, samples):
+        self.waveform = samples.tobytes()
+        self.sample_rate = SAMPLE_RATE
+
+
+def test_on_speech_precedes_each_kept_segment():
+    def envelope(t):
+        return np.ones_like(t)
+
+    rng = np.random.default_rng(1)
+    click = np.zeros(SAMPLE_RATE, dtype=np.int16)
+    click[: SAMPLE_RATE // 10] = rng.standard_normal(SAMPLE_RATE // 10) * 4000
+    samples = np.concatenate(
+        [utterance(envelope, 0.5), click, utterance(envelope, 1.5, seed=1)]
+    )
+    events = []
+    endpointer = StreamEndpointer(
+        max_queued=8,
+        on_speech=lambda: events.append(("speech", endpointer.vad.stream_time)),
+    )
+    chunk = SAMPLE_RATE // 4
+    for offset in range(0, len(samples), chunk):
+        endpointer.on_audio(Message(samples[offset : offset + chunk]))
+        for segment in iter(lambda: endpointer.next_segment(timeout=0), None):
+            events.append(("segment", segment))
+    # the click is shorter than min_speech_ms and gets no callback
+    assert [event for event, _ in events] == ["speech", "segment"] * 2
+    for (_, confirmed_at), (_, segment) in zip(events[::2], events[1::2]):
+        assert confirmed_at < segment.end
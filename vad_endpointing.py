@@ -0,0 +1,276 @@
+"""
+Energy based voice activity detection and endpointing of a microphone stream.
+
+EnergyVAD splits 16 bit PCM audio into short frames and compares the RMS energy of each frame with
+an adaptive noise floor, which also follows an increase of the background noise during a segment:
+when the frame energies of a sliding window are steady, like those of noise and unlike those of
+speech, the floor is raised to their minimum. Speech starts after start_ms of voiced frames and ends after hangover_ms
+of unvoiced frames, so a segment is finished as soon as the trailing silence is long enough rather
+than after a fixed listening window. Segments keep pre_roll_ms of audio before the speech start and
+up to pre_roll_ms after its end, so soft onsets and word endings are not clipped.
+
+StreamEndpointer runs EnergyVAD on the AudioMessages of a microphone connector and queues the
+finished segments for transcription. It can also report when speech is confirmed, min_speech_ms
+into a segment and at least hangover_ms before its end is detected, e.g. to prepare a recognizer.
+"""
+
+import queue
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+
+@dataclass
+class SpeechSegment:
+    """
+    A voiced segment of an audio stream. Times are seconds since the start of the stream.
+
+    :param audio: 16 bit samples from audio_start, including the pre-roll
+    :param start: start of the first voiced frame
+    :param end: end of the last voiced frame
+    :param detected_at: end of the frame at which the end of speech was detected
+    :param end_time: wall clock time of end, if known
+    """
+
+    audio: np.ndarray
+    sample_rate: int
+    audio_start: float
+    start: float
+    end: float
+    detected_at: float
+    end_time: Optional[float] = None
+
+    @property
+    def audio_end(self):
+        return self.audio_start + len(self.audio) / self.sample_rate
+
+
+class EnergyVAD:
+    """
+    Frame energy voice activity detector with hangover based endpointing.
+
+    :param sample_rate: sample rate of the audio
+    :param frame_ms: frame length
+    :param start_ms: voiced audio needed to start a segment, rejects clicks
+    :param hangover_ms: unvoiced audio that ends a segment
+    :param pre_roll_ms: audio kept before the start and after the end of speech
+    :param min_speech_ms: shorter segments are dropped
+    :param max_segment_ms: longer segments are ended, like phrase_time_limit
+    :param threshold_ratio: a frame is voiced when its energy exceeds the noise floor by this factor
+    :param min_threshold: lowest RMS energy of a voiced frame
+    :param noise_adaptation: weight of an unvoiced frame in the running noise floor
+    :param noise_window_ms: the noise floor is raised to the lowest frame energy of this window,
+        also within segments, if that window is steady
+    :param steady_ratio: a window is steady when its lowest frame energy is at least this fraction
+        of its median; the energy of speech varies far more, also without pauses
+    """
+
+    def __init__(
+        self,
+        sample_rate,
+        frame_ms=30,
+        start_ms=90,
+        hangover_ms=300,
+        pre_roll_ms=200,
+        min_speech_ms=150,
+        max_segment_ms=20000,
+        threshold_ratio=3.0,
+        min_threshold=200.0,
+        noise_adaptation=0.05,
+        noise_window_ms=3000,
+        steady_ratio=0.7,
+    ):
+        self.sample_rate = sample_rate
+        self.frame_size = max(int(sample_rate * frame_ms / 1000), 1)
+        self.frame_duration = self.frame_size / sample_rate
+        self.start_frames = self._frames(start_ms)
+        self.hangover_frames = self._frames(hangover_ms)
+        self.pre_roll_frames = self._frames(pre_roll_ms, minimum=0)
+        self.min_speech = min_speech_ms / 1000.0
+        self.max_segment_frames = self._frames(max_segment_ms)
+        self.threshold_ratio = threshold_ratio
+        self.min_threshold = min_threshold
+        self.noise_adaptation = noise_adaptation
+        self.noise_floor = None
+        self.steady_ratio = steady_ratio
+        self._energies = deque(maxlen=self._frames(noise_window_ms))
+        self._pending = np.empty(0, dtype=np.int16)
+        self._frame_count = 0
+        self._history = deque(maxlen=self.pre_roll_frames + self.start_frames)
+        self._voiced_run = 0
+        self._segment = None
+        # segments that reached min_speech_ms, these are not dropped
+        self.confirmed = 0
+
+    def _frames(self, ms, minimum=1):
+        return max(int(round(ms / 1000.0 / self.frame_duration)), minimum)
+
+    @property
+    def stream_time(self):
+        """Seconds of audio passed to process, including samples not framed yet."""
+        return (
+            self._frame_count * self.frame_size + len(self._pending)
+        ) / self.sample_rate
+
+    def process(self, samples):
+        """Processes 16 bit samples, returns the segments whose end was detected in them."""
+        samples = np.concatenate([self._pending, np.asarray(samples, dtype=np.int16)])
+        framed = len(samples) // self.frame_size * self.frame_size
+        frames = samples[:framed].reshape(-1, self.frame_size)
+        self._pending = samples[framed:]
+        energies = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+        segments = []
+        for frame, energy in zip(frames, energies):
+            segment = self._process_frame(frame, energy)
+            if segment is not None:
+                segments.append(segment)
+        return segments
+
+    def flush(self):
+        """Ends the current segment at the end of the stream, returns it or None."""
+        if self._segment is None:
+            return None
+        return self._end_segment(self._frame_count * self.frame_duration)
+
+    def _process_frame(self, frame, energy):
+        frame_start = self._frame_count * self.frame_duration
+        frame_end = frame_start + self.frame_duration
+        self._frame_count += 1
+        self._energies.append(float(energy))
+        if (
+            self.noise_floor is not None
+            and len(self._energies) == self._energies.maxlen
+        ):
+            lowest = min(self._energies)
+            if lowest > self.noise_floor and lowest >= self.steady_ratio * np.median(
+                self._energies
+            ):
+                self.noise_floor = lowest
+        threshold = self.min_threshold
+        if self.noise_floor is not None:
+            threshold = max(threshold, self.noise_floor * self.threshold_ratio)
+        voiced = energy >= threshold
+
+        if self._segment is None:
+            self._history.append(frame)
+            if not voiced:
+                self._voiced_run = 0
+                if self.noise_floor is None:
+                    self.noise_floor = float(energy)
+                else:
+                    self.noise_floor += self.noise_adaptation * (
+                        energy - self.noise_floor
+                    )
+                return None
+            self._voiced_run += 1
+            if self._voiced_run >= self.start_frames:
+                self._segment = {
+                    "frames": list(self._history),
+                    "audio_start": frame_end - len(self._history) * self.frame_duration,
+                    "start": frame_end - self.start_frames * self.frame_duration,
+                    "end": frame_end,
+                    "silent_run": 0,
+                    "confirmed": False,
+                }
+                self._confirm(self._segment)
+            return None
+
+        segment = self._segment
+        segment["frames"].append(frame)
+        if voiced:
+            segment["silent_run"] = 0
+            segment["end"] = frame_end
+            self._confirm(segment)
+        else:
+            segment["silent_run"] += 1
+        if (
+            segment["silent_run"] >= self.hangover_frames
+            or len(segment["frames"]) >= self.max_segment_frames
+        ):
+            return self._end_segment(frame_end)
+        return None
+
+    def _confirm(self, segment):
+        if (
+            not segment["confirmed"]
+            and segment["end"] - segment["start"] >= self.min_speech
+        ):
+            segment["confirmed"] = True
+            self.confirmed += 1
+
+    def _end_segment(self, detected_at):
+        segment = self._segment
+        self._segment = None
+        self._voiced_run = 0
+        self._history.clear()
+        if not segment["confirmed"]:
+            return None
+        # keep at most the pre-roll of the trailing silence
+        audio_end = min(
+            detected_at, segment["end"] + self.pre_roll_frames * self.frame_duration
+        )
+        frames = int(round((audio_end - segment["audio_start"]) / self.frame_duration))
+        return SpeechSegment(
+            audio=np.concatenate(segment["frames"][:frames]),
+            sample_rate=self.sample_rate,
+            audio_start=segment["audio_start"],
+            start=segment["start"],
+            end=segment["end"],
+            detected_at=detected_at,
+        )
+
+
+class StreamEndpointer:
+    """
+    Runs EnergyVAD on the AudioMessages of a microphone and queues the finished segments.
+
+    Register on_audio as a callback of the microphone connector. When max_queued segments wait for
+    transcription the oldest one is dropped.
+
+    :param on_speech: called without arguments, from the callback thread, when the VAD confirms
+        the speech of a segment. It is called before that segment is queued, once per segment.
+    :param vad_params: keyword arguments of EnergyVAD
+    """
+
+    def __init__(self, max_queued=4, on_speech=None, **vad_params):
+        self.on_speech = on_speech
+        self.vad_params = vad_params
+        self.vad = None
+        # samples per AudioMessage of the microphone
+        self.chunk_size = None
+        self.dropped = 0
+        self._segments = queue.Queue(maxsize=max_queued)
+
+    def on_audio(self, message):
+        if self.vad is None:
+            self.vad = EnergyVAD(message.sample_rate, **self.vad_params)
+            self.chunk_size = len(message.waveform) // 2
+        received = getattr(message, "_timestamp", None) or time.time()
+        confirmed = self.vad.confirmed
+        segments = self.vad.process(np.frombuffer(message.waveform, dtype=np.int16))
+        if self.on_speech is not None:
+            for _ in range(self.vad.confirmed - confirmed):
+                self.on_speech()
+        for segment in segments:
+            # the message was sent when its last sample was captured
+            segment.end_time = received - (self.vad.stream_time - segment.end)
+            while True:
+                try:
+                    self._segments.put_nowait(segment)
+                    break
+                except queue.Full:
+                    try:
+                        self._segments.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def next_segment(self, timeout=None):
+        """The next finished segment, or None if there was none within timeout seconds."""
+        try:
+            return self._segments.get(timeout=timeout)
+        except queue.Empty:
+            return None